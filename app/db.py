@@ -2,13 +2,28 @@
 db.py
 SQLite-хранилище:
 - notes: заметки пользователя;
-- quiz_stats: статистика по викторинам.
+- notes_fts: полнотекстовый индекс FTS5 по заметкам (синхронизируется триггерами);
+- user_counters: счетчики пользователя (число заметок), ведутся триггерами на notes;
+- quiz_stats: статистика по викторинам (индекс по рейтингу — общая таблица лидеров);
+- quiz_topic_stats: та же статистика в разрезе тем (таблицы лидеров по темам, см. app/services/leaderboard.py);
+- quiz_players: имена игроков для таблицы лидеров;
+- geocode_cache: кэш геокодинга городов (в т.ч. "не найдено" с коротким сроком жизни);
+- weather_subscriptions: ежедневная рассылка погоды (индекс по времени следующей отправки);
+- reminders: напоминания о заметках (индекс по времени срабатывания, см. app/services/reminders.py);
+- quiz_questions: банк вопросов викторины (читается по темам лениво, см. app/services/quiz_bank.py);
+- persisted_data: user_data/chat_data бота между перезапусками (см. app/persistence.py);
+- meta: служебные значения (например, прогресс заполнения FTS-индекса).
 
-Все функции максимально простые и прозрачные для учебного проекта.
+Функции разделены на два уровня:
+- "*_q(conn, ...)" — запросы поверх уже открытого соединения (без commit),
+  их переиспользует асинхронный слой app/db_async.py;
+- add_note/list_notes/... (db_path, ...) — простые синхронные обертки,
+  которые открывают соединение, выполняют запрос и закрывают его.
 """
 
 from __future__ import annotations
 
+import re
 import sqlite3
 from pathlib import Path
 from typing import Any, Optional
@@ -22,9 +37,22 @@ def get_conn(db_path: Path) -> sqlite3.Connection:
     return conn
 
 
+def configure_conn(conn: sqlite3.Connection) -> None:
+    # WAL: читатели не блокируют писателя и наоборот.
+    # synchronous=NORMAL в режиме WAL безопасен для целостности БД,
+    # fsync выполняется только на checkpoint, а не на каждый COMMIT.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-8192")  # ~8 МБ страничного кэша на соединение
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA busy_timeout=5000")
+
+
 def init_db(db_path: Path) -> None:
     conn = get_conn(db_path)
     try:
+        # journal_mode=WAL сохраняется в файле БД, включаем его сразу.
+        configure_conn(conn)
         cur = conn.cursor()
 
         cur.execute(
@@ -38,6 +66,10 @@ def init_db(db_path: Path) -> None:
             """
         )
 
+        # Составной индекс: выборка заметок пользователя и постраничный вывод
+        # по id идут по индексу, без полного сканирования таблицы.
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_notes_user_id ON notes(user_id, id)")
+
         cur.execute(
             """
             CREATE TABLE IF NOT EXISTS quiz_stats (
@@ -50,41 +82,777 @@ def init_db(db_path: Path) -> None:
             """
         )
 
-        conn.commit()
-    finally:
-        conn.close()
+        # Рейтинг: больше верных ответов, при равенстве — меньше вопросов (выше точность).
+        # Индекс покрывает и выборку лучших (/top), и загрузку всей таблицы в порядке рейтинга.
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_quiz_stats_rank ON quiz_stats(correct_total DESC, questions_total, user_id)"
+        )
+        # Статистика по темам ведется теми же upsert, что и quiz_stats (upsert_quiz_stats_q).
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS quiz_topic_stats (
+                topic TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                quizzes INTEGER NOT NULL,
+                questions INTEGER NOT NULL,
+                correct INTEGER NOT NULL,
+                PRIMARY KEY (topic, user_id)
+            ) WITHOUT ROWID
+            """
+        )
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_quiz_topic_stats_rank
+            ON quiz_topic_stats(topic, correct DESC, questions, user_id)
+            """
+        )
+        cur.execute("CREATE TABLE IF NOT EXISTS quiz_players (user_id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
 
+        cur.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
 
-def add_note(db_path: Path, user_id: int, created_at_iso: str, text: str) -> int:
-    conn = get_conn(db_path)
-    try:
-        cur = conn.cursor()
+        _init_notes_fts(cur)
+        _init_user_counters(cur)
+
+        # Кэш геокодинга: name IS NULL — отрицательный результат ("город не найден").
         cur.execute(
-            "INSERT INTO notes (user_id, created_at, text) VALUES (?, ?, ?)",
-            (user_id, created_at_iso, text),
+            """
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                key TEXT PRIMARY KEY,
+                name TEXT,
+                country TEXT,
+                latitude REAL,
+                longitude REAL,
+                expires_at INTEGER NOT NULL
+            )
+            """
         )
+
+        # Подписки на погоду: рассылка выбирает по индексу только тех, кому пора (next_due_at).
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS weather_subscriptions (
+                chat_id INTEGER NOT NULL,
+                city_key TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                city TEXT NOT NULL,
+                country TEXT NOT NULL,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                send_minute INTEGER NOT NULL,
+                next_due_at INTEGER NOT NULL,
+                PRIMARY KEY (chat_id, city_key)
+            )
+            """
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_weather_subscriptions_due ON weather_subscriptions(next_due_at)"
+        )
+
+        # Напоминания: планировщик читает их окнами по времени (due_at, id) через индекс.
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS reminders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                note_id INTEGER NOT NULL,
+                due_at INTEGER NOT NULL
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(due_at)")
+
+        # Банк вопросов: answers — допустимые ответы через "\n". Индекс UNIQUE(topic, question)
+        # заодно покрывает выборку id по теме (rowid входит в индекс) и подсчет вопросов по темам.
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS quiz_questions (
+                id INTEGER PRIMARY KEY,
+                topic TEXT NOT NULL,
+                question TEXT NOT NULL,
+                answers TEXT NOT NULL,
+                UNIQUE (topic, question)
+            )
+            """
+        )
+
+        # Persistence PTB (app/persistence.py): user_data/chat_data — строка на пользователя/чат,
+        # data — pickle словаря. kind: "user" или "chat".
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS persisted_data (
+                kind TEXT NOT NULL,
+                key INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                updated_at INTEGER NOT NULL,
+                PRIMARY KEY (kind, key)
+            ) WITHOUT ROWID
+            """
+        )
+
         conn.commit()
-        return int(cur.lastrowid)
     finally:
         conn.close()
 
 
-def list_notes(db_path: Path, user_id: int, limit: int = 10) -> list[dict[str, Any]]:
-    conn = get_conn(db_path)
-    try:
-        cur = conn.cursor()
+def _init_notes_fts(cur: sqlite3.Cursor) -> None:
+    """
+    FTS5-индекс по notes.text (external content: текст хранится только в notes).
+
+    user_id тоже проиндексирован: поиск фильтрует по владельцу внутри MATCH
+    (см. search_notes_q), а не после него по всем совпадениям всех пользователей.
+
+    Если индекс создается на уже заполненной БД, старые заметки (id <= fts_backfill_upto)
+    индексируются отдельно и частями — см. backfill_notes_fts_q. Пока это не сделано,
+    триггеры удаления/изменения не трогают еще не проиндексированные строки.
+    Индекс старого формата (без user_id) пересоздается и заполняется так же.
+    """
+    row = cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'notes_fts'").fetchone()
+    if row is not None and "user_id" not in row[0]:
+        for trigger in ("notes_fts_ai", "notes_fts_ad", "notes_fts_au"):
+            cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cur.execute("DROP TABLE notes_fts")
+        row = None
+    if row is None:
         cur.execute(
+            """
+            CREATE VIRTUAL TABLE notes_fts USING fts5(
+                text,
+                user_id,
+                content = 'notes',
+                content_rowid = 'id',
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+            """
+        )
+        max_id = cur.execute("SELECT COALESCE(MAX(id), 0) FROM notes").fetchone()[0]
+        cur.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('fts_backfill_pos', 0), ('fts_backfill_upto', ?)",
+            (int(max_id),),
+        )
+
+    # Строка проиндексирована, если она новее границы заполнения или уже пройдена заполнением.
+    indexed = (
+        "(old.id > (SELECT value FROM meta WHERE key = 'fts_backfill_upto')"
+        " OR old.id <= (SELECT value FROM meta WHERE key = 'fts_backfill_pos'))"
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS notes_fts_ai AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts (rowid, text, user_id) VALUES (new.id, new.text, new.user_id);
+        END
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_ad AFTER DELETE ON notes WHEN {indexed} BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, text, user_id) VALUES ('delete', old.id, old.text, old.user_id);
+        END
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_au AFTER UPDATE OF text ON notes WHEN {indexed} BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, text, user_id) VALUES ('delete', old.id, old.text, old.user_id);
+            INSERT INTO notes_fts (rowid, text, user_id) VALUES (new.id, new.text, new.user_id);
+        END
+        """
+    )
+
+
+def _init_user_counters(cur: sqlite3.Cursor) -> None:
+    """
+    user_counters.notes_total поддерживается триггерами на вставку/удаление заметок,
+    поэтому /stats читает готовое число вместо COUNT(*) по notes.
+    """
+    exists = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_counters'"
+    ).fetchone()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_counters (
+            user_id INTEGER PRIMARY KEY,
+            notes_total INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS notes_counter_ai AFTER INSERT ON notes BEGIN
+            INSERT INTO user_counters (user_id, notes_total) VALUES (new.user_id, 1)
+            ON CONFLICT(user_id) DO UPDATE SET notes_total = notes_total + 1;
+        END
+        """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS notes_counter_ad AFTER DELETE ON notes BEGIN
+            UPDATE user_counters SET notes_total = notes_total - 1 WHERE user_id = old.user_id;
+        END
+        """
+    )
+    if not exists:
+        # Таблица появилась на уже заполненной БД — считаем начальные значения один раз.
+        rebuild_user_counters_q(cur.connection)
+
+
+# --- Запросы уровня соединения (без commit) ---
+
+
+def add_note_q(conn: sqlite3.Connection, user_id: int, created_at_iso: str, text: str) -> int:
+    cur = conn.execute(
+        "INSERT INTO notes (user_id, created_at, text) VALUES (?, ?, ?)",
+        (user_id, created_at_iso, text),
+    )
+    return int(cur.lastrowid)
+
+
+def list_notes_q(conn: sqlite3.Connection, user_id: int, limit: int = 10) -> list[dict[str, Any]]:
+    cur = conn.execute(
+        """
+        SELECT id, created_at, text
+        FROM notes
+        WHERE user_id = ?
+        ORDER BY id DESC
+        LIMIT ?
+        """,
+        (user_id, limit),
+    )
+    return [dict(r) for r in cur.fetchall()]
+
+
+def list_notes_page_q(
+    conn: sqlite3.Connection,
+    user_id: int,
+    limit: int = 10,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+) -> dict[str, Any]:
+    """
+    Keyset-пагинация (от новых к старым):
+    - before_id — страница заметок старше указанного id ("дальше");
+    - after_id — страница заметок новее указанного id ("назад");
+    - без курсоров — самая свежая страница.
+    Каждая страница — диапазонный проход по индексу (user_id, id), без OFFSET.
+    """
+    if after_id is not None:
+        cur = conn.execute(
             """
             SELECT id, created_at, text
             FROM notes
-            WHERE user_id = ?
-            ORDER BY id DESC
+            WHERE user_id = ? AND id > ?
+            ORDER BY id ASC
             LIMIT ?
             """,
-            (user_id, limit),
+            (user_id, after_id, limit + 1),
         )
-        rows = cur.fetchall()
-        return [dict(r) for r in rows]
+        rows = [dict(r) for r in cur.fetchall()]
+        has_newer = len(rows) > limit
+        notes = rows[:limit]
+        notes.reverse()
+        # Соседняя страница в обратную сторону — точечный EXISTS по тому же индексу.
+        has_older = bool(notes) and _notes_exist(conn, "id < ?", user_id, int(notes[-1]["id"]))
+    else:
+        if before_id is not None:
+            cur = conn.execute(
+                """
+                SELECT id, created_at, text
+                FROM notes
+                WHERE user_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+                """,
+                (user_id, before_id, limit + 1),
+            )
+        else:
+            cur = conn.execute(
+                """
+                SELECT id, created_at, text
+                FROM notes
+                WHERE user_id = ?
+                ORDER BY id DESC
+                LIMIT ?
+                """,
+                (user_id, limit + 1),
+            )
+        rows = [dict(r) for r in cur.fetchall()]
+        has_older = len(rows) > limit
+        notes = rows[:limit]
+        has_newer = before_id is not None and bool(notes) and _notes_exist(
+            conn, "id > ?", user_id, int(notes[0]["id"])
+        )
+
+    return {"notes": notes, "has_older": has_older, "has_newer": has_newer}
+
+
+def _notes_exist(conn: sqlite3.Connection, cond: str, user_id: int, note_id: int) -> bool:
+    row = conn.execute(
+        f"SELECT EXISTS(SELECT 1 FROM notes WHERE user_id = ? AND {cond}) AS e",
+        (user_id, note_id),
+    ).fetchone()
+    return bool(row["e"])
+
+
+def fts_match_expr(query: str) -> str:
+    """
+    Превращает пользовательский ввод в безопасное FTS5-выражение:
+    каждое слово в кавычках (никакого синтаксиса FTS от пользователя),
+    последнее слово — префиксный поиск ("конспе" найдет "конспект").
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return ""
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_notes_q(conn: sqlite3.Connection, user_id: int, query: str, limit: int = 10) -> list[dict[str, Any]]:
+    expr = fts_match_expr(query)
+    if not expr:
+        return []
+    # Владелец — часть MATCH: чужие заметки отсекаются пересечением списков FTS,
+    # без чтения строк notes и подсчета bm25 для них. Колонка user_id в ранжировании не участвует.
+    cur = conn.execute(
+        """
+        SELECT n.id, n.created_at, snippet(notes_fts, 0, '«', '»', '…', 12) AS snippet
+        FROM notes_fts
+        JOIN notes n ON n.id = notes_fts.rowid
+        WHERE notes_fts MATCH ?
+        ORDER BY bm25(notes_fts, 1.0, 0.0)
+        LIMIT ?
+        """,
+        (f'user_id : "{int(user_id)}" AND text : ({expr})', limit),
+    )
+    return [dict(r) for r in cur.fetchall()]
+
+
+def backfill_notes_fts_q(conn: sqlite3.Connection, chunk: int = 500) -> int:
+    """
+    Индексирует следующую порцию старых заметок (созданных до появления notes_fts).
+    Возвращает число проиндексированных строк; 0 — заполнение завершено.
+    Каждая порция — отдельная короткая транзакция, длинной блокировки записи нет.
+    """
+    meta = {r["key"]: r["value"] for r in conn.execute("SELECT key, value FROM meta WHERE key LIKE 'fts_backfill_%'")}
+    pos, upto = int(meta.get("fts_backfill_pos", 0)), int(meta.get("fts_backfill_upto", 0))
+    if pos >= upto:
+        return 0
+
+    rows = conn.execute(
+        "SELECT id, text, user_id FROM notes WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+        (pos, upto, chunk),
+    ).fetchall()
+    conn.executemany(
+        "INSERT INTO notes_fts (rowid, text, user_id) VALUES (?, ?, ?)",
+        [(r["id"], r["text"], r["user_id"]) for r in rows],
+    )
+
+    # Неполная порция означает, что до границы больше нет заметок.
+    new_pos = int(rows[-1]["id"]) if len(rows) == chunk else upto
+    conn.execute("UPDATE meta SET value = ? WHERE key = 'fts_backfill_pos'", (new_pos,))
+    return len(rows)
+
+
+def delete_note_q(conn: sqlite3.Connection, user_id: int, note_id: int) -> bool:
+    cur = conn.execute(
+        "DELETE FROM notes WHERE user_id = ? AND id = ?",
+        (user_id, note_id),
+    )
+    return cur.rowcount > 0
+
+
+def count_notes_q(conn: sqlite3.Connection, user_id: int) -> int:
+    row = conn.execute("SELECT notes_total FROM user_counters WHERE user_id = ?", (user_id,)).fetchone()
+    return int(row["notes_total"]) if row else 0
+
+
+def get_user_stats_q(conn: sqlite3.Connection, user_id: int) -> dict[str, Any]:
+    """Все данные для /stats одним запросом: поиск по первичному ключу в user_counters и quiz_stats."""
+    row = conn.execute(
+        """
+        SELECT
+            u.id AS user_id,
+            COALESCE(c.notes_total, 0) AS notes_total,
+            COALESCE(q.quizzes_total, 0) AS quizzes_total,
+            COALESCE(q.questions_total, 0) AS questions_total,
+            COALESCE(q.correct_total, 0) AS correct_total,
+            q.last_topic AS last_topic
+        FROM (SELECT ? AS id) u
+        LEFT JOIN user_counters c ON c.user_id = u.id
+        LEFT JOIN quiz_stats q ON q.user_id = u.id
+        """,
+        (user_id,),
+    ).fetchone()
+    return dict(row)
+
+
+def rebuild_user_counters_q(conn: sqlite3.Connection) -> int:
+    """Пересчитывает user_counters по таблице notes (ремонт после сбоев/ручных правок). Возвращает число строк."""
+    conn.execute("DELETE FROM user_counters")
+    cur = conn.execute(
+        """
+        INSERT INTO user_counters (user_id, notes_total)
+        SELECT user_id, COUNT(*) FROM notes GROUP BY user_id
+        """
+    )
+    return cur.rowcount
+
+
+def get_quiz_stats_q(conn: sqlite3.Connection, user_id: int) -> dict[str, Any]:
+    row = conn.execute(
+        """
+        SELECT user_id, quizzes_total, questions_total, correct_total, last_topic
+        FROM quiz_stats
+        WHERE user_id = ?
+        """,
+        (user_id,),
+    ).fetchone()
+    if not row:
+        return {
+            "user_id": user_id,
+            "quizzes_total": 0,
+            "questions_total": 0,
+            "correct_total": 0,
+            "last_topic": None,
+        }
+    return dict(row)
+
+
+UPSERT_QUIZ_STATS_SQL = """
+    INSERT INTO quiz_stats (user_id, quizzes_total, questions_total, correct_total, last_topic)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        quizzes_total = quizzes_total + excluded.quizzes_total,
+        questions_total = questions_total + excluded.questions_total,
+        correct_total = correct_total + excluded.correct_total,
+        last_topic = COALESCE(excluded.last_topic, last_topic)
+"""
+
+
+UPSERT_QUIZ_TOPIC_STATS_SQL = """
+    INSERT INTO quiz_topic_stats (topic, user_id, quizzes, questions, correct)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(topic, user_id) DO UPDATE SET
+        quizzes = quizzes + excluded.quizzes,
+        questions = questions + excluded.questions,
+        correct = correct + excluded.correct
+"""
+
+# Счет игрока после записи: (тема или None — общая таблица лидеров, user_id, correct, questions).
+QuizScoreChange = tuple[Optional[str], int, int, int]
+
+
+def upsert_quiz_stats_q(
+    conn: sqlite3.Connection,
+    user_id: int,
+    quizzes_add: int,
+    questions_add: int,
+    correct_add: int,
+    last_topic: Optional[str],
+) -> list[QuizScoreChange]:
+    """
+    Применяет приращения к quiz_stats и (если тема известна) к quiz_topic_stats.
+    Возвращает новый счет игрока для таблиц лидеров.
+    """
+    # Одна инструкция: приращения применяются атомарно внутри SQLite,
+    # поэтому параллельные завершения викторин не теряют обновления.
+    conn.execute(UPSERT_QUIZ_STATS_SQL, (user_id, quizzes_add, questions_add, correct_add, last_topic))
+    # Новые значения — поиском по первичному ключу в той же транзакции.
+    row = conn.execute(
+        "SELECT correct_total, questions_total FROM quiz_stats WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    changes: list[QuizScoreChange] = [(None, user_id, int(row[0]), int(row[1]))]
+    if last_topic is not None:
+        conn.execute(UPSERT_QUIZ_TOPIC_STATS_SQL, (last_topic, user_id, quizzes_add, questions_add, correct_add))
+        row = conn.execute(
+            "SELECT correct, questions FROM quiz_topic_stats WHERE topic = ? AND user_id = ?", (last_topic, user_id)
+        ).fetchone()
+        changes.append((last_topic, user_id, int(row[0]), int(row[1])))
+    return changes
+
+
+def upsert_quiz_stats_many_q(
+    conn: sqlite3.Connection,
+    rows: list[tuple[int, int, int, int, Optional[str]]],
+) -> list[QuizScoreChange]:
+    # rows: (user_id, quizzes_add, questions_add, correct_add, last_topic)
+    changes: list[QuizScoreChange] = []
+    for row in rows:
+        changes.extend(upsert_quiz_stats_q(conn, *row))
+    return changes
+
+
+def quiz_board_q(conn: sqlite3.Connection, topic: Optional[str]) -> list[tuple[int, int, int]]:
+    """Вся таблица лидеров (topic=None — общая) в порядке рейтинга: (user_id, correct, questions)."""
+    if topic is None:
+        rows = conn.execute(
+            """
+            SELECT user_id, correct_total, questions_total FROM quiz_stats
+            ORDER BY correct_total DESC, questions_total, user_id
+            """
+        )
+    else:
+        rows = conn.execute(
+            """
+            SELECT user_id, correct, questions FROM quiz_topic_stats WHERE topic = ?
+            ORDER BY correct DESC, questions, user_id
+            """,
+            (topic,),
+        )
+    return [(int(r[0]), int(r[1]), int(r[2])) for r in rows]
+
+
+def quiz_top_q(conn: sqlite3.Connection, topic: Optional[str], limit: int) -> list[dict[str, Any]]:
+    """Лучшие игроки: проход по индексу рейтинга с LIMIT и поиск имен по первичному ключу."""
+    if topic is None:
+        sql = """
+            SELECT s.user_id, s.correct_total AS correct, s.questions_total AS questions, p.name
+            FROM quiz_stats s LEFT JOIN quiz_players p ON p.user_id = s.user_id
+            ORDER BY s.correct_total DESC, s.questions_total, s.user_id
+            LIMIT ?
+        """
+        args: tuple[Any, ...] = (limit,)
+    else:
+        sql = """
+            SELECT s.user_id, s.correct, s.questions, p.name
+            FROM quiz_topic_stats s LEFT JOIN quiz_players p ON p.user_id = s.user_id
+            WHERE s.topic = ?
+            ORDER BY s.correct DESC, s.questions, s.user_id
+            LIMIT ?
+        """
+        args = (topic, limit)
+    return [dict(r) for r in conn.execute(sql, args).fetchall()]
+
+
+def put_quiz_player_q(conn: sqlite3.Connection, user_id: int, name: str) -> None:
+    conn.execute(
+        "INSERT INTO quiz_players (user_id, name) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET name = excluded.name",
+        (user_id, name),
+    )
+
+
+def get_geocode_q(conn: sqlite3.Connection, key: str, now_ts: int) -> Optional[dict[str, Any]]:
+    """Непросроченная запись кэша геокодинга или None, если записи нет."""
+    row = conn.execute(
+        """
+        SELECT key, name, country, latitude, longitude, expires_at
+        FROM geocode_cache
+        WHERE key = ? AND expires_at > ?
+        """,
+        (key, now_ts),
+    ).fetchone()
+    return dict(row) if row else None
+
+
+def put_geocode_q(
+    conn: sqlite3.Connection,
+    key: str,
+    name: Optional[str],
+    country: Optional[str],
+    latitude: Optional[float],
+    longitude: Optional[float],
+    expires_at: int,
+) -> None:
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO geocode_cache (key, name, country, latitude, longitude, expires_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (key, name, country, latitude, longitude, expires_at),
+    )
+
+
+def upsert_weather_subscription_q(
+    conn: sqlite3.Connection,
+    chat_id: int,
+    city_key: str,
+    user_id: int,
+    city: str,
+    country: str,
+    latitude: float,
+    longitude: float,
+    send_minute: int,
+    next_due_at: int,
+) -> None:
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO weather_subscriptions
+            (chat_id, city_key, user_id, city, country, latitude, longitude, send_minute, next_due_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (chat_id, city_key, user_id, city, country, latitude, longitude, send_minute, next_due_at),
+    )
+
+
+def count_weather_subscriptions_q(conn: sqlite3.Connection, chat_id: int) -> int:
+    row = conn.execute("SELECT COUNT(*) FROM weather_subscriptions WHERE chat_id = ?", (chat_id,)).fetchone()
+    return int(row[0])
+
+
+def list_weather_subscriptions_q(conn: sqlite3.Connection, chat_id: int) -> list[dict[str, Any]]:
+    rows = conn.execute(
+        """
+        SELECT chat_id, city_key, city, country, send_minute, next_due_at
+        FROM weather_subscriptions
+        WHERE chat_id = ?
+        ORDER BY send_minute, city
+        """,
+        (chat_id,),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def delete_weather_subscriptions_q(conn: sqlite3.Connection, chat_id: int, city_key: Optional[str] = None) -> int:
+    """Удаляет подписку на город (или все подписки чата, если city_key не задан). Возвращает число строк."""
+    if city_key is None:
+        cur = conn.execute("DELETE FROM weather_subscriptions WHERE chat_id = ?", (chat_id,))
+    else:
+        cur = conn.execute(
+            "DELETE FROM weather_subscriptions WHERE chat_id = ? AND city_key = ?", (chat_id, city_key)
+        )
+    return cur.rowcount
+
+
+def due_weather_subscriptions_q(conn: sqlite3.Connection, now_ts: int, limit: int = 500) -> list[dict[str, Any]]:
+    """Ближайшие подписки, которым пора отправлять (по индексу next_due_at, не больше limit)."""
+    rows = conn.execute(
+        """
+        SELECT chat_id, city_key, user_id, city, country, latitude, longitude, send_minute, next_due_at
+        FROM weather_subscriptions
+        WHERE next_due_at <= ?
+        ORDER BY next_due_at
+        LIMIT ?
+        """,
+        (now_ts, limit),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def reschedule_weather_subscriptions_q(
+    conn: sqlite3.Connection,
+    rows: list[tuple[int, int, str, int]],
+) -> None:
+    # rows: (новый next_due_at, chat_id, city_key, прежний next_due_at).
+    # Условие на прежнее значение: если пользователь успел переподписаться, его время не трогаем.
+    conn.executemany(
+        """
+        UPDATE weather_subscriptions SET next_due_at = ?
+        WHERE chat_id = ? AND city_key = ? AND next_due_at = ?
+        """,
+        rows,
+    )
+
+
+def add_reminder_q(
+    conn: sqlite3.Connection, user_id: int, chat_id: int, note_id: int, due_at: int
+) -> Optional[int]:
+    """Создает напоминание, только если заметка принадлежит пользователю. Возвращает id или None."""
+    cur = conn.execute(
+        """
+        INSERT INTO reminders (user_id, chat_id, note_id, due_at)
+        SELECT user_id, ?, id, ? FROM notes WHERE user_id = ? AND id = ?
+        """,
+        (chat_id, due_at, user_id, note_id),
+    )
+    return int(cur.lastrowid) if cur.rowcount else None
+
+
+def reminders_window_q(
+    conn: sqlite3.Connection, after_due: int, after_id: int, before_due: int, limit: int = 1000
+) -> list[dict[str, Any]]:
+    """
+    Напоминания с (due_at, id) > (after_due, after_id) и due_at < before_due по порядку срабатывания.
+    Курсор (due_at, id) позволяет дочитывать окно порциями без OFFSET; идет по idx_reminders_due
+    (rowid входит в индекс). Текст берется из заметки; если заметку удалили, text = NULL.
+    """
+    rows = conn.execute(
+        """
+        SELECT r.id, r.user_id, r.chat_id, r.note_id, r.due_at, n.text
+        FROM reminders AS r
+        LEFT JOIN notes AS n ON n.id = r.note_id
+        WHERE (r.due_at, r.id) > (?, ?) AND r.due_at < ?
+        ORDER BY r.due_at, r.id
+        LIMIT ?
+        """,
+        (after_due, after_id, before_due, limit),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def delete_reminders_q(conn: sqlite3.Connection, ids: list[int]) -> None:
+    conn.executemany("DELETE FROM reminders WHERE id = ?", [(i,) for i in ids])
+
+
+def quiz_topics_q(conn: sqlite3.Connection) -> list[tuple[str, int]]:
+    rows = conn.execute("SELECT topic, COUNT(*) FROM quiz_questions GROUP BY topic").fetchall()
+    return [(str(r[0]), int(r[1])) for r in rows]
+
+
+def quiz_topic_ids_q(conn: sqlite3.Connection, topic: str) -> list[int]:
+    # Только id (по покрывающему индексу): тексты вопросов читаются точечно, когда нужны.
+    return [int(r[0]) for r in conn.execute("SELECT id FROM quiz_questions WHERE topic = ?", (topic,))]
+
+
+def quiz_questions_q(conn: sqlite3.Connection, ids: list[int]) -> list[dict[str, Any]]:
+    if not ids:
+        return []
+    marks = ",".join("?" * len(ids))
+    rows = conn.execute(
+        f"SELECT id, topic, question, answers FROM quiz_questions WHERE id IN ({marks})", ids
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def import_quiz_questions_q(conn: sqlite3.Connection, rows: list[tuple[str, str, str]]) -> None:
+    """
+    rows: (topic, question, answers через "\n"). Вопрос с тем же текстом в теме обновляется
+    на месте: id не меняется, и незаконченные викторины после перезагрузки банка не ломаются.
+    """
+    conn.executemany(
+        """
+        INSERT INTO quiz_questions (topic, question, answers) VALUES (?, ?, ?)
+        ON CONFLICT (topic, question) DO UPDATE SET answers = excluded.answers
+        """,
+        rows,
+    )
+
+
+def get_persisted_q(conn: sqlite3.Connection, kind: str, key: int) -> Optional[bytes]:
+    row = conn.execute("SELECT data FROM persisted_data WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+    return bytes(row[0]) if row else None
+
+
+def put_persisted_many_q(conn: sqlite3.Connection, rows: list[tuple[str, int, bytes]], now_ts: int) -> None:
+    conn.executemany(
+        """
+        INSERT INTO persisted_data (kind, key, data, updated_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (kind, key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+        """,
+        [(kind, key, data, now_ts) for kind, key, data in rows],
+    )
+
+
+def delete_persisted_many_q(conn: sqlite3.Connection, keys: list[tuple[str, int]]) -> None:
+    conn.executemany("DELETE FROM persisted_data WHERE kind = ? AND key = ?", keys)
+
+
+# --- Синхронные обертки (отдельное соединение на вызов) ---
+
+
+def add_note(db_path: Path, user_id: int, created_at_iso: str, text: str) -> int:
+    conn = get_conn(db_path)
+    try:
+        note_id = add_note_q(conn, user_id, created_at_iso, text)
+        conn.commit()
+        return note_id
+    finally:
+        conn.close()
+
+
+def list_notes(db_path: Path, user_id: int, limit: int = 10) -> list[dict[str, Any]]:
+    conn = get_conn(db_path)
+    try:
+        return list_notes_q(conn, user_id, limit)
     finally:
         conn.close()
 
@@ -92,13 +860,34 @@ def list_notes(db_path: Path, user_id: int, limit: int = 10) -> list[dict[str, A
 def delete_note(db_path: Path, user_id: int, note_id: int) -> bool:
     conn = get_conn(db_path)
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "DELETE FROM notes WHERE user_id = ? AND id = ?",
-            (user_id, note_id),
-        )
+        ok = delete_note_q(conn, user_id, note_id)
+        conn.commit()
+        return ok
+    finally:
+        conn.close()
+
+
+def backfill_notes_fts(db_path: Path, chunk: int = 500) -> int:
+    """Полное заполнение FTS-индекса порциями (для CLI, см. app/maintenance.py)."""
+    conn = get_conn(db_path)
+    try:
+        total = 0
+        while True:
+            n = backfill_notes_fts_q(conn, chunk)
+            conn.commit()
+            if n == 0:
+                return total
+            total += n
+    finally:
+        conn.close()
+
+
+def rebuild_user_counters(db_path: Path) -> int:
+    conn = get_conn(db_path)
+    try:
+        n = rebuild_user_counters_q(conn)
         conn.commit()
-        return cur.rowcount > 0
+        return n
     finally:
         conn.close()
 
@@ -106,10 +895,7 @@ def delete_note(db_path: Path, user_id: int, note_id: int) -> bool:
 def count_notes(db_path: Path, user_id: int) -> int:
     conn = get_conn(db_path)
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) AS c FROM notes WHERE user_id = ?", (user_id,))
-        row = cur.fetchone()
-        return int(row["c"]) if row else 0
+        return count_notes_q(conn, user_id)
     finally:
         conn.close()
 
@@ -117,25 +903,7 @@ def count_notes(db_path: Path, user_id: int) -> int:
 def get_quiz_stats(db_path: Path, user_id: int) -> dict[str, Any]:
     conn = get_conn(db_path)
     try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT user_id, quizzes_total, questions_total, correct_total, last_topic
-            FROM quiz_stats
-            WHERE user_id = ?
-            """,
-            (user_id,),
-        )
-        row = cur.fetchone()
-        if not row:
-            return {
-                "user_id": user_id,
-                "quizzes_total": 0,
-                "questions_total": 0,
-                "correct_total": 0,
-                "last_topic": None,
-            }
-        return dict(row)
+        return get_quiz_stats_q(conn, user_id)
     finally:
         conn.close()
 
@@ -148,28 +916,28 @@ def upsert_quiz_stats(
     correct_add: int,
     last_topic: Optional[str],
 ) -> None:
-    current = get_quiz_stats(db_path, user_id)
+    conn = get_conn(db_path)
+    try:
+        upsert_quiz_stats_q(conn, user_id, quizzes_add, questions_add, correct_add, last_topic)
+        conn.commit()
+    finally:
+        conn.close()
 
-    quizzes_total = int(current["quizzes_total"]) + quizzes_add
-    questions_total = int(current["questions_total"]) + questions_add
-    correct_total = int(current["correct_total"]) + correct_add
 
+def count_quiz_questions(db_path: Path) -> int:
     conn = get_conn(db_path)
     try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO quiz_stats (user_id, quizzes_total, questions_total, correct_total, last_topic)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                quizzes_total = excluded.quizzes_total,
-                questions_total = excluded.questions_total,
-                correct_total = excluded.correct_total,
-                last_topic = excluded.last_topic
-            """,
-            (user_id, quizzes_total, questions_total, correct_total, last_topic),
-        )
-        conn.commit()
+        return int(conn.execute("SELECT COUNT(*) FROM quiz_questions").fetchone()[0])
     finally:
         conn.close()
 
+
+def import_quiz_questions(db_path: Path, rows: list[tuple[str, str, str]]) -> int:
+    conn = get_conn(db_path)
+    try:
+        configure_conn(conn)
+        import_quiz_questions_q(conn, rows)
+        conn.commit()
+        return len(rows)
+    finally:
+        conn.close()
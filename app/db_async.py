@@ -0,0 +1,380 @@
+"""
+db_async.py
+Асинхронный слой над SQLite.
+
+sqlite3 — синхронный драйвер, поэтому:
+- запросы выполняются в отдельном пуле потоков (ThreadPoolExecutor);
+- у каждого потока пула свое долгоживущее соединение (не открываем/закрываем на каждый вызов);
+- хендлеры делают await db.add_note(...) и не блокируют event loop дисковым I/O;
+- записи идут через GroupCommitWriter (app/db_writer.py): одна транзакция на пачку;
+- статистика викторин опционально копится в памяти (app/write_behind.py)
+  и сбрасывается в БД раз в stats_flush_sec;
+- изменения счета викторин (QuizScoreChange) после записи передаются в on_quiz_scores —
+  так таблицы лидеров в памяти (app/services/leaderboard.py) обновляются без пересчета;
+- частые чтения по user_id (/stats, первая страница /note list) идут через
+  LRU-кэш с TTL (app/utils/cache.py); записи точечно инвалидируют ключи пользователя.
+
+Жизненный цикл: await Database.open() в post_init, await Database.close() в post_shutdown (см. bot.py).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Optional, TypeVar
+
+from app.db import (
+    QuizScoreChange,
+    add_note_q,
+    add_reminder_q,
+    backfill_notes_fts_q,
+    configure_conn,
+    count_weather_subscriptions_q,
+    delete_note_q,
+    delete_reminders_q,
+    delete_weather_subscriptions_q,
+    due_weather_subscriptions_q,
+    get_conn,
+    get_geocode_q,
+    get_user_stats_q,
+    list_notes_page_q,
+    list_notes_q,
+    list_weather_subscriptions_q,
+    put_geocode_q,
+    put_quiz_player_q,
+    quiz_board_q,
+    quiz_questions_q,
+    quiz_top_q,
+    quiz_topic_ids_q,
+    quiz_topics_q,
+    rebuild_user_counters_q,
+    reminders_window_q,
+    reschedule_weather_subscriptions_q,
+    search_notes_q,
+    upsert_quiz_stats_many_q,
+    upsert_quiz_stats_q,
+    upsert_weather_subscription_q,
+)
+from app.db_writer import GroupCommitWriter
+from app.utils.cache import MISSING, LRUCache
+from app.write_behind import QuizStatsRow, QuizStatsWriteBehind
+
+T = TypeVar("T")
+
+# Поля quiz_stats в результате get_user_stats.
+_QUIZ_FIELDS = ("user_id", "quizzes_total", "questions_total", "correct_total", "last_topic")
+# Число "полос" версий для защиты кэша от гонок чтение/запись (см. _cached_read).
+_VERSION_STRIPES = 1024
+
+
+class Database:
+    def __init__(
+        self,
+        db_path: Path,
+        pool_size: int = 4,
+        batch_max_ops: int = 64,
+        batch_delay_ms: float = 5.0,
+        stats_flush_sec: float = 0.0,
+        cache_max_entries: int = 10_000,
+        cache_ttl_sec: float = 60.0,
+    ) -> None:
+        self.db_path = db_path
+        self.pool_size = max(1, pool_size)
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._conns: list[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        self._writer = GroupCommitWriter(db_path, max_batch=batch_max_ops, max_delay_ms=batch_delay_ms)
+        # stats_flush_sec <= 0 — статистика пишется сразу, без буфера.
+        self._stats_buffer: Optional[QuizStatsWriteBehind] = None
+        if stats_flush_sec > 0:
+            self._stats_buffer = QuizStatsWriteBehind(self._flush_quiz_stats, stats_flush_sec)
+
+        # Ключи кэша: ("stats", user_id) и ("notes_page", user_id) — первая страница заметок.
+        self.cache = LRUCache(max_entries=cache_max_entries, ttl_sec=cache_ttl_sec)
+        self._versions = [0] * _VERSION_STRIPES
+        # Получатель изменений счета после COMMIT (подключается в post_init, см. bot.py).
+        self.on_quiz_scores: Optional[Callable[[list[QuizScoreChange]], None]] = None
+
+    # --- Жизненный цикл ---
+
+    async def open(self) -> None:
+        if self._executor is not None:
+            return
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.pool_size,
+            thread_name_prefix="sqlite",
+            initializer=self._init_worker,
+        )
+        await self._writer.start()
+        if self._stats_buffer is not None:
+            await self._stats_buffer.start()
+
+    async def close(self) -> None:
+        if self._executor is None:
+            return
+        # Сначала сбрасываем буфер статистики и фиксируем все поставленные в очередь записи.
+        if self._stats_buffer is not None:
+            await self._stats_buffer.stop()
+        await self._writer.stop()
+        # Дожидаемся завершения уже поставленных чтений, затем закрываем соединения.
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+
+    def _init_worker(self) -> None:
+        conn = get_conn(self.db_path)
+        configure_conn(conn)
+        self._local.conn = conn
+        with self._conns_lock:
+            self._conns.append(conn)
+
+    def _call(self, fn: Callable[..., T], *args: Any) -> T:
+        # Выполняется в потоке пула: берем соединение этого потока.
+        return fn(self._local.conn, *args)
+
+    async def _read(self, fn: Callable[..., T], *args: Any) -> T:
+        if self._executor is None:
+            raise RuntimeError("Database не открыта: вызовите open() в post_init.")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(self._call, fn, *args))
+
+    async def _write(self, fn: Callable[..., T], *args: Any) -> T:
+        # Результат приходит после COMMIT пачки, в которую попала операция.
+        return await self._writer.submit(fn, *args)
+
+    # --- Кэш ---
+
+    def _version(self, user_id: int) -> int:
+        return self._versions[user_id % _VERSION_STRIPES]
+
+    def _invalidate_user(self, user_id: int) -> None:
+        self._versions[user_id % _VERSION_STRIPES] += 1
+        self.cache.pop(("stats", user_id))
+        self.cache.pop(("notes_page", user_id))
+
+    def _invalidate_all(self) -> None:
+        # Новые версии всех полос: чтения, начатые до сброса, не положат в кэш старое.
+        for i in range(len(self._versions)):
+            self._versions[i] += 1
+        self.cache.clear()
+
+    async def _cached_read(self, key: tuple[Any, ...], user_id: int, fn: Callable[..., T], *args: Any) -> T:
+        value = self.cache.get(key)
+        if value is not MISSING:
+            return value
+        # Если за время чтения по пользователю прошла запись, результат может быть устаревшим:
+        # отдаем его вызывающему, но в кэш не кладем.
+        version = self._version(user_id)
+        value = await self._read(fn, *args)
+        if self._version(user_id) == version:
+            self.cache.set(key, value)
+        return value
+
+    async def _user_write(self, user_id: int, fn: Callable[..., T], *args: Any) -> T:
+        # Инвалидация до записи отсекает чтения, начатые раньше нее,
+        # инвалидация после — значения, прочитанные до COMMIT.
+        self._invalidate_user(user_id)
+        try:
+            return await self._write(fn, *args)
+        finally:
+            self._invalidate_user(user_id)
+
+    @staticmethod
+    def _first_page_q(conn: sqlite3.Connection, user_id: int, limit: int) -> tuple[int, dict[str, Any]]:
+        return limit, list_notes_page_q(conn, user_id, limit)
+
+    def cache_stats(self) -> dict[str, Any]:
+        return self.cache.stats()
+
+    def writer_stats(self) -> dict[str, Any]:
+        return self._writer.stats()
+
+    # --- Публичное API (awaitable-версии функций из app/db.py) ---
+
+    async def add_note(self, user_id: int, created_at_iso: str, text: str) -> int:
+        return await self._user_write(user_id, add_note_q, user_id, created_at_iso, text)
+
+    async def list_notes(self, user_id: int, limit: int = 10) -> list[dict[str, Any]]:
+        return await self._read(list_notes_q, user_id, limit)
+
+    async def list_notes_page(
+        self,
+        user_id: int,
+        limit: int = 10,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+    ) -> dict[str, Any]:
+        if before_id is None and after_id is None:
+            # Первая страница — самый частый запрос, кэшируем только ее (вместе с limit).
+            cached_limit, page = await self._cached_read(
+                ("notes_page", user_id), user_id, self._first_page_q, user_id, limit
+            )
+            if cached_limit == limit:
+                return page
+        return await self._read(list_notes_page_q, user_id, limit, before_id, after_id)
+
+    async def search_notes(self, user_id: int, query: str, limit: int = 10) -> list[dict[str, Any]]:
+        return await self._read(search_notes_q, user_id, query, limit)
+
+    async def backfill_notes_fts(self, chunk: int = 500, pause_sec: float = 0.05) -> int:
+        """
+        Заполняет FTS-индекс старыми заметками порциями через общую очередь записи:
+        между порциями проходят обычные записи пользователей.
+        """
+        total = 0
+        while True:
+            n = await self._write(backfill_notes_fts_q, chunk)
+            if n == 0:
+                return total
+            total += n
+            await asyncio.sleep(pause_sec)
+
+    async def delete_note(self, user_id: int, note_id: int) -> bool:
+        return await self._user_write(user_id, delete_note_q, user_id, note_id)
+
+    async def count_notes(self, user_id: int) -> int:
+        stats = await self.get_user_stats(user_id)
+        return int(stats["notes_total"])
+
+    async def get_quiz_stats(self, user_id: int) -> dict[str, Any]:
+        stats = await self.get_user_stats(user_id)
+        return {k: stats[k] for k in _QUIZ_FIELDS}
+
+    async def get_user_stats(self, user_id: int) -> dict[str, Any]:
+        """Заметки + викторины одним запросом на одном соединении (для /stats)."""
+        stats = await self._cached_read(("stats", user_id), user_id, get_user_stats_q, user_id)
+        if self._stats_buffer is not None:
+            stats = self._stats_buffer.apply_pending(stats)
+        return stats
+
+    async def rebuild_user_counters(self) -> int:
+        # Как _user_write, но для всех пользователей сразу.
+        self._invalidate_all()
+        try:
+            return await self._write(rebuild_user_counters_q)
+        finally:
+            self._invalidate_all()
+
+    async def upsert_quiz_stats(
+        self,
+        user_id: int,
+        quizzes_add: int,
+        questions_add: int,
+        correct_add: int,
+        last_topic: Optional[str],
+    ) -> None:
+        if self._stats_buffer is not None:
+            # В кэше лежат значения из БД, буфер добавляется при чтении: инвалидировать нечего.
+            self._stats_buffer.add(user_id, quizzes_add, questions_add, correct_add, last_topic)
+            return
+        changes = await self._user_write(
+            user_id, upsert_quiz_stats_q, user_id, quizzes_add, questions_add, correct_add, last_topic
+        )
+        self._notify_quiz_scores(changes)
+
+    async def quiz_board(self, topic: Optional[str]) -> list[tuple[int, int, int]]:
+        return await self._read(quiz_board_q, topic)
+
+    async def quiz_top(self, topic: Optional[str], limit: int) -> list[dict[str, Any]]:
+        return await self._read(quiz_top_q, topic, limit)
+
+    async def put_quiz_player(self, user_id: int, name: str) -> None:
+        await self._write(put_quiz_player_q, user_id, name)
+
+    async def get_geocode(self, key: str, now_ts: int) -> Optional[dict[str, Any]]:
+        return await self._read(get_geocode_q, key, now_ts)
+
+    async def put_geocode(
+        self,
+        key: str,
+        name: Optional[str],
+        country: Optional[str],
+        latitude: Optional[float],
+        longitude: Optional[float],
+        expires_at: int,
+    ) -> None:
+        await self._write(put_geocode_q, key, name, country, latitude, longitude, expires_at)
+
+    async def upsert_weather_subscription(
+        self,
+        chat_id: int,
+        city_key: str,
+        user_id: int,
+        city: str,
+        country: str,
+        latitude: float,
+        longitude: float,
+        send_minute: int,
+        next_due_at: int,
+    ) -> None:
+        await self._write(
+            upsert_weather_subscription_q,
+            chat_id,
+            city_key,
+            user_id,
+            city,
+            country,
+            latitude,
+            longitude,
+            send_minute,
+            next_due_at,
+        )
+
+    async def count_weather_subscriptions(self, chat_id: int) -> int:
+        return await self._read(count_weather_subscriptions_q, chat_id)
+
+    async def list_weather_subscriptions(self, chat_id: int) -> list[dict[str, Any]]:
+        return await self._read(list_weather_subscriptions_q, chat_id)
+
+    async def delete_weather_subscriptions(self, chat_id: int, city_key: Optional[str] = None) -> int:
+        return await self._write(delete_weather_subscriptions_q, chat_id, city_key)
+
+    async def due_weather_subscriptions(self, now_ts: int, limit: int = 500) -> list[dict[str, Any]]:
+        return await self._read(due_weather_subscriptions_q, now_ts, limit)
+
+    async def reschedule_weather_subscriptions(self, rows: list[tuple[int, int, str, int]]) -> None:
+        await self._write(reschedule_weather_subscriptions_q, rows)
+
+    async def add_reminder(self, user_id: int, chat_id: int, note_id: int, due_at: int) -> Optional[int]:
+        return await self._write(add_reminder_q, user_id, chat_id, note_id, due_at)
+
+    async def reminders_window(
+        self, after_due: int, after_id: int, before_due: int, limit: int = 1000
+    ) -> list[dict[str, Any]]:
+        return await self._read(reminders_window_q, after_due, after_id, before_due, limit)
+
+    async def delete_reminders(self, ids: list[int]) -> None:
+        await self._write(delete_reminders_q, ids)
+
+    async def quiz_topics(self) -> list[tuple[str, int]]:
+        return await self._read(quiz_topics_q)
+
+    async def quiz_topic_ids(self, topic: str) -> list[int]:
+        return await self._read(quiz_topic_ids_q, topic)
+
+    async def quiz_questions(self, ids: list[int]) -> list[dict[str, Any]]:
+        return await self._read(quiz_questions_q, ids)
+
+    async def _flush_quiz_stats(self, rows: list[QuizStatsRow]) -> None:
+        user_ids = [row[0] for row in rows]
+        for user_id in user_ids:
+            self._invalidate_user(user_id)
+        try:
+            changes = await self._write(upsert_quiz_stats_many_q, rows)
+        finally:
+            for user_id in user_ids:
+                self._invalidate_user(user_id)
+        self._notify_quiz_scores(changes)
+
+    def _notify_quiz_scores(self, changes: list[QuizScoreChange]) -> None:
+        if self.on_quiz_scores is not None and changes:
+            self.on_quiz_scores(changes)
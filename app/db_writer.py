@@ -0,0 +1,170 @@
+"""
+db_writer.py
+Групповой коммит (group commit) для записей в SQLite.
+
+Идея:
+- все хендлеры отправляют записи в одну очередь;
+- единственный поток-писатель собирает их пачкой (каждые max_delay_ms
+  или по достижении max_batch операций) и выполняет в одной транзакции;
+- на пачку приходится один COMMIT (и один fsync), а не по одному на действие пользователя;
+- после коммита каждый вызывающий получает свой результат (например, lastrowid).
+
+Каждая операция выполняется внутри SAVEPOINT: ошибка одной операции
+откатывает только ее, остальные операции пачки фиксируются.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from app.db import configure_conn, get_conn
+
+log = logging.getLogger(__name__)
+
+# (функция запроса, аргументы, future вызывающего)
+_WriteOp = tuple[Callable[..., Any], tuple[Any, ...], "asyncio.Future[Any]"]
+
+
+class GroupCommitWriter:
+    def __init__(self, db_path: Path, max_batch: int = 64, max_delay_ms: float = 5.0) -> None:
+        self.db_path = db_path
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max(0.0, max_delay_ms) / 1000.0
+
+        self._queue: "asyncio.Queue[Optional[_WriteOp]]" = asyncio.Queue()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task[None]] = None
+
+        # Счетчики для оценки эффективности группировки.
+        self.batches_total = 0
+        self.ops_total = 0
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        # Один поток — один писатель: SQLite все равно сериализует запись.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        loop = asyncio.get_running_loop()
+        self._conn = await loop.run_in_executor(self._executor, self._open_conn)
+        self._task = asyncio.create_task(self._run(), name="db-group-commit")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        # None — маркер остановки: писатель дорабатывает все, что было в очереди до него.
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+        assert self._executor is not None
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._close_conn)
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    async def submit(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._task is None:
+            raise RuntimeError("GroupCommitWriter не запущен: вызовите start().")
+        fut: asyncio.Future[Any] = asyncio.get_running_loop().create_future()
+        await self._queue.put((fn, args, fut))
+        return await fut
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches_total": self.batches_total,
+            "ops_total": self.ops_total,
+            "avg_batch": round(self.ops_total / self.batches_total, 2) if self.batches_total else 0.0,
+        }
+
+    # --- Внутреннее ---
+
+    def _open_conn(self) -> sqlite3.Connection:
+        conn = get_conn(self.db_path)
+        # Транзакциями управляем сами (BEGIN/COMMIT/SAVEPOINT).
+        conn.isolation_level = None
+        configure_conn(conn)
+        return conn
+
+    def _close_conn(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+
+            # Добираем пачку: пока не истекло окно ожидания и не набран лимит.
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            ops = [(fn, args) for fn, args, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self._apply_batch, ops)
+            except Exception as e:
+                log.exception("Групповой коммит не удался (%d операций)", len(batch))
+                for _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            self.batches_total += 1
+            self.ops_total += len(batch)
+            for (_, _, fut), (ok, value) in zip(batch, results):
+                if fut.done():
+                    continue
+                if ok:
+                    fut.set_result(value)
+                else:
+                    fut.set_exception(value)
+
+    def _apply_batch(self, ops: list[tuple[Callable[..., Any], tuple[Any, ...]]]) -> list[tuple[bool, Any]]:
+        conn = self._conn
+        assert conn is not None
+
+        results: list[tuple[bool, Any]] = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for fn, args in ops:
+                conn.execute("SAVEPOINT op")
+                try:
+                    value = fn(conn, *args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    results.append((False, e))
+                else:
+                    conn.execute("RELEASE op")
+                    results.append((True, value))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return results
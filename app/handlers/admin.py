@@ -0,0 +1,62 @@
+"""
+admin.py
+/metrics — служебные счетчики процесса (кэши, очередь записи и т.п.).
+/quizreload — перечитать банк вопросов после python -m app.maintenance quiz-import.
+/rebuildcounters — пересчитать счетчики заметок (user_counters) и сбросить кэш чтений бота.
+
+Доступно только пользователям из ADMIN_IDS (см. config.py).
+"""
+
+from __future__ import annotations
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from app import metrics
+from app.db_async import Database
+from app.services.quiz_bank import QuizBank
+from app.services.sender import reply
+from app.utils.text import clamp, join_lines
+from config import Settings
+
+
+def is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    settings: Settings = context.application.bot_data["settings"]
+    return bool(update.effective_user) and update.effective_user.id in settings.admin_ids
+
+
+async def cmd_metrics(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not is_admin(update, context):
+        reply(update, context, "Команда доступна только администраторам.")
+        return
+
+    lines: list[str] = []
+    for name, values in metrics.snapshot().items():
+        lines.append(f"[{name}]")
+        for key, value in values.items():
+            lines.append(f"{key}: {value}")
+        lines.append("")
+
+    reply(update, context, clamp(join_lines(lines)) or "Метрик пока нет.")
+
+
+async def cmd_quiz_reload(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not is_admin(update, context):
+        reply(update, context, "Команда доступна только администраторам.")
+        return
+
+    bank: QuizBank = context.application.bot_data["quiz_bank"]
+    await bank.reload()
+    stats = bank.stats()
+    reply(update, context, f"Банк вопросов перечитан: тем {stats['topics']}, вопросов {stats['questions']}.")
+
+
+async def cmd_rebuild_counters(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not is_admin(update, context):
+        reply(update, context, "Команда доступна только администраторам.")
+        return
+
+    # В отличие от python -m app.maintenance rebuild-counters, сбрасывает и кэш этого процесса.
+    db: Database = context.application.bot_data["db"]
+    n = await db.rebuild_user_counters()
+    reply(update, context, f"Пересчитано счетчиков пользователей: {n}.")
@@ -0,0 +1,122 @@
+"""
+inline.py
+Inline-режим: "@bot Бер" -> список городов с текущей погодой, выбранный вариант
+отправляется в чат как обычное сообщение о погоде.
+
+Telegram присылает inline-запрос на каждое нажатие клавиши, поэтому:
+- подсказки берутся из кэша префиксов / офлайн-справочника (GeoCache.suggest),
+  сеть — только если справочника нет;
+- на некэшированный префикс ждем паузу в наборе (дебаунс на пользователя),
+  более новый запрос отменяет старый вместе с уже начатым поиском;
+- закэшированный префикс отвечается сразу, без дебаунса;
+- погода для всех вариантов запрашивается параллельно (один пакетный запрос через
+  ForecastBatcher), варианты, не успевшие за бюджет времени, пропускаются;
+- cache_time + is_personal=False: ответ одинаков для всех, Telegram сам отдает его
+  повторным запросам с тем же текстом.
+
+Хендлер регистрируется с block=False (bot.py), иначе запросы одного пользователя
+выстраивались бы в очередь и дебаунсу нечего было бы отменять.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+
+import httpx
+from telegram import InlineQueryResultArticle, InputTextMessageContent, Update
+from telegram.error import BadRequest
+from telegram.ext import ContextTypes
+
+from app.handlers.weather import format_weather
+from app.services.geocache import GeoCache
+from app.services.http import HttpClients
+from app.services.open_meteo import GeoResult, describe_weather_code
+from app.services.resilience import CircuitOpenError
+from app.services.weather_cache import WeatherCache, WeatherReading
+from app.utils.cache import MISSING
+from app.utils.debounce import KeyedDebouncer
+
+log = logging.getLogger(__name__)
+
+INLINE_MIN_QUERY_LEN = 2
+INLINE_MAX_RESULTS = 5
+# Сколько секунд Telegram может отдавать наш ответ на тот же запрос без обращения к боту.
+INLINE_CACHE_TIME_SEC = 300
+# Сколько ждем погоду для вариантов; кто не успел — не попадает в список.
+INLINE_WEATHER_BUDGET_SEC = 2.0
+
+
+async def on_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.inline_query
+    if query is None:
+        return
+    text = query.query.strip()
+    if len(text) < INLINE_MIN_QUERY_LEN:
+        await _answer(query, [])
+        return
+
+    bot_data = context.application.bot_data
+    geo_cache: GeoCache = bot_data["geo_cache"]
+    debouncer: KeyedDebouncer = bot_data["inline_debouncer"]
+
+    delay = 0.0
+    if geo_cache.cached_suggestions(text) is MISSING:
+        delay = bot_data["settings"].inline_debounce_ms / 1000.0
+
+    try:
+        results = await debouncer.run(query.from_user.id, lambda: _build_results(bot_data, text), delay)
+    except (CircuitOpenError, httpx.HTTPError) as e:
+        log.info("Inline-подсказки недоступны: %s", e)
+        return
+    if results is None:
+        # Пользователь продолжил набирать: ответит более новый запрос.
+        return
+    await _answer(query, results)
+
+
+async def _build_results(bot_data: dict, text: str) -> list[InlineQueryResultArticle]:
+    http: HttpClients = bot_data["http"]
+    geo_cache: GeoCache = bot_data["geo_cache"]
+    weather_cache: WeatherCache = bot_data["weather_cache"]
+
+    cities = await geo_cache.suggest(http, text, limit=INLINE_MAX_RESULTS)
+    if not cities:
+        return []
+
+    tasks = [asyncio.ensure_future(weather_cache.get(geo.latitude, geo.longitude)) for geo in cities]
+    done: set[asyncio.Future] = set()
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=INLINE_WEATHER_BUDGET_SEC)
+    finally:
+        # Общие запросы в WeatherCache защищены shield: доедут и прогреют кэш.
+        # Отмененная задача станет done() только на следующей итерации цикла,
+        # поэтому результаты читаем только из done.
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    results: list[InlineQueryResultArticle] = []
+    for geo, task in zip(cities, tasks):
+        if task not in done or task.cancelled() or task.exception() is not None:
+            continue
+        results.append(_article(geo, task.result()))
+    return results
+
+
+def _article(geo: GeoResult, reading: WeatherReading) -> InlineQueryResultArticle:
+    w = reading.weather
+    return InlineQueryResultArticle(
+        id=f"{geo.latitude:.4f},{geo.longitude:.4f}",
+        title=f"{geo.name} ({geo.country})",
+        description=f"{w.temperature_c:.0f}°C, {describe_weather_code(w.weather_code)}",
+        input_message_content=InputTextMessageContent(format_weather(geo, reading)),
+    )
+
+
+async def _answer(query, results: list[InlineQueryResultArticle]) -> None:
+    try:
+        await query.answer(results, cache_time=INLINE_CACHE_TIME_SEC, is_personal=False)
+    except BadRequest as e:
+        # "Query is too old": пользователь уже ушел дальше, отвечать некому.
+        log.debug("Inline-ответ не отправлен: %s", e)
@@ -1,77 +1,214 @@
 """
 notes.py
-Команда /note с подкомандами add|list|del.
+Команда /note с подкомандами add|list|search|del|remind.
 
 Примеры:
 - /note add Купить кофе
 - /note list
+- /note search кофе
 - /note del 5
+- /note remind 5 30m  (или 2h, 1d, 18:00, 25.12 09:00 — см. app/services/reminders.py)
+
+/note list выводит заметки страницами; кнопки "Новее"/"Старее" — это курсоры
+keyset-пагинации (id крайней заметки на странице), обработчик — on_notes_page.
 """
 
 from __future__ import annotations
 
+import time
 from datetime import datetime, timezone
 
-from telegram import Update
+from typing import Any, Optional
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 
-from app.db import add_note, delete_note, list_notes
-from app.utils.text import join_lines
+from app.db_async import Database
+from app.services.reminders import ReminderScheduler, format_due, parse_when
+from app.services.sender import reply
+from app.utils.text import clamp, join_lines
+
+PAGE_SIZE = 10
+# Длинная заметка в списке показывается укороченной, чтобы страница влезла в clamp().
+NOTE_PREVIEW_LEN = 500
+MESSAGE_MAX_LEN = 3500
+
+
+def render_notes_page(notes: list[dict[str, Any]]) -> tuple[str, list[dict[str, Any]]]:
+    """
+    Собирает текст страницы, не превышая MESSAGE_MAX_LEN.
+    Возвращает текст и заметки, которые реально попали на страницу:
+    курсор "Старее" должен указывать на последнюю показанную, а не на последнюю выбранную.
+    """
+    lines = ["Заметки:"]
+    size = len(lines[0])
+    shown: list[dict[str, Any]] = []
+    for n in notes:
+        line = clamp(f'{n["id"]}) {n["text"]}', NOTE_PREVIEW_LEN) + f'  [{n["created_at"]}]'
+        if shown and size + 1 + len(line) > MESSAGE_MAX_LEN:
+            break
+        lines.append(line)
+        size += 1 + len(line)
+        shown.append(n)
+    return clamp(join_lines(lines), MESSAGE_MAX_LEN), shown
+
+
+def notes_page_keyboard(
+    user_id: int, shown: list[dict[str, Any]], has_newer: bool, has_older: bool
+) -> Optional[InlineKeyboardMarkup]:
+    buttons = []
+    if shown and has_newer:
+        buttons.append(InlineKeyboardButton("« Новее", callback_data=f'notes:{user_id}:newer:{shown[0]["id"]}'))
+    if shown and has_older:
+        buttons.append(InlineKeyboardButton("Старее »", callback_data=f'notes:{user_id}:older:{shown[-1]["id"]}'))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+async def _load_notes_page(
+    db: Database, user_id: int, before_id: Optional[int] = None, after_id: Optional[int] = None
+) -> Optional[tuple[str, Optional[InlineKeyboardMarkup]]]:
+    """Текст и клавиатура страницы; None, если на странице нет заметок."""
+    page = await db.list_notes_page(user_id, limit=PAGE_SIZE, before_id=before_id, after_id=after_id)
+    if not page["notes"]:
+        return None
+    text, shown = render_notes_page(page["notes"])
+    # Если страница не влезла целиком, остаток уйдет на следующую "старую" страницу.
+    has_older = page["has_older"] or len(shown) < len(page["notes"])
+    return text, notes_page_keyboard(user_id, shown, page["has_newer"], has_older)
 
 
 async def cmd_note(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # context.args — стандартный способ получить "хвост" команды. :contentReference[oaicite:3]{index=3}
     args = context.args
     if not args:
-        await update.message.reply_text(
+        reply(
+            update,
+            context,
             "Использование:\n"
             "/note add <текст>\n"
             "/note list\n"
-            "/note del <id>"
+            "/note search <запрос>\n"
+            "/note del <id>\n"
+            "/note remind <id> <когда>"
         )
         return
 
     sub = args[0].strip().lower()
     user_id = int(update.effective_user.id) if update.effective_user else 0
+    db: Database = context.application.bot_data["db"]
 
     if sub == "add":
         text = " ".join(args[1:]).strip()
         if not text:
-            await update.message.reply_text("Добавление заметки: /note add <текст>")
+            reply(update, context, "Добавление заметки: /note add <текст>")
             return
 
         created_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
-        note_id = add_note(context.application.bot_data["db_path"], user_id, created_at, text)
+        note_id = await db.add_note(user_id, created_at, text)
 
-        await update.message.reply_text(f"Заметка добавлена: id={note_id}")
+        reply(update, context, f"Заметка добавлена: id={note_id}")
         return
 
     if sub == "list":
-        notes = list_notes(context.application.bot_data["db_path"], user_id, limit=10)
-        if not notes:
-            await update.message.reply_text("Заметок пока нет. Добавь: /note add <текст>")
+        page = await _load_notes_page(db, user_id)
+        if page is None:
+            reply(update, context, "Заметок пока нет. Добавь: /note add <текст>")
             return
 
-        lines = ["Последние заметки:"]
-        for n in notes:
-            lines.append(f'{n["id"]}) {n["text"]}  [{n["created_at"]}]')
+        text, keyboard = page
+        reply(update, context, text, reply_markup=keyboard)
+        return
+
+    if sub == "search":
+        query = " ".join(args[1:]).strip()
+        if not query:
+            reply(update, context, "Поиск: /note search <запрос>")
+            return
+
+        found = await db.search_notes(user_id, query, limit=PAGE_SIZE)
+        if not found:
+            reply(update, context, "Ничего не нашлось.")
+            return
 
-        await update.message.reply_text(join_lines(lines))
+        lines = [f"Найдено по запросу «{clamp(query, 100)}»:"]
+        for n in found:
+            lines.append(clamp(f'{n["id"]}) {n["snippet"]}', NOTE_PREVIEW_LEN) + f'  [{n["created_at"]}]')
+        reply(update, context, clamp(join_lines(lines), MESSAGE_MAX_LEN))
         return
 
     if sub == "del":
         if len(args) < 2:
-            await update.message.reply_text("Удаление: /note del <id>")
+            reply(update, context, "Удаление: /note del <id>")
             return
         try:
             note_id = int(args[1])
         except ValueError:
-            await update.message.reply_text("id должен быть числом. Пример: /note del 3")
+            reply(update, context, "id должен быть числом. Пример: /note del 3")
             return
 
-        ok = delete_note(context.application.bot_data["db_path"], user_id, note_id)
-        await update.message.reply_text("Удалено." if ok else "Не найдено (проверь id).")
+        ok = await db.delete_note(user_id, note_id)
+        reply(update, context, "Удалено." if ok else "Не найдено (проверь id).")
+        return
+
+    if sub == "remind":
+        await _remind(update, context, user_id, args[1:])
+        return
+
+    reply(update, context, "Неизвестная подкоманда. Используй: add, list, search, del или remind.")
+
+
+async def _remind(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int, args: list[str]) -> None:
+    usage = "Напоминание: /note remind <id> <когда>\nКогда: 30m, 2h, 1d, 18:00, 25.12 09:00"
+    if len(args) < 2:
+        reply(update, context, usage)
+        return
+    try:
+        note_id = int(args[0])
+    except ValueError:
+        reply(update, context, "id должен быть числом. " + usage)
+        return
+
+    tz = context.application.bot_data["subscriptions_tz"]
+    due_at = parse_when(" ".join(args[1:]), tz, time.time())
+    if due_at is None:
+        reply(update, context, "Не понял время (или оно уже прошло). " + usage)
         return
 
-    await update.message.reply_text("Неизвестная подкоманда. Используй: add, list или del.")
+    reminders: ReminderScheduler = context.application.bot_data["reminders"]
+    reminder_id = await reminders.add(user_id, update.effective_chat.id, note_id, due_at)
+    if reminder_id is None:
+        reply(update, context, "Заметка не найдена (проверь id).")
+        return
+    reply(update, context, f"Напомню {format_due(due_at, tz)} ({tz}).")
+
+
+async def on_notes_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Кнопки "Новее"/"Старее" под списком заметок: callback_data = notes:<user_id>:<newer|older>:<id>."""
+    query = update.callback_query
+    if not query or not query.data:
+        return
 
+    try:
+        _, owner_raw, direction, cursor_raw = query.data.split(":")
+        owner_id, cursor = int(owner_raw), int(cursor_raw)
+    except ValueError:
+        await query.answer()
+        return
+
+    # В группах кнопки видят все: листать может только владелец списка.
+    if not query.from_user or query.from_user.id != owner_id:
+        await query.answer("Это не твой список заметок.")
+        return
+
+    db: Database = context.application.bot_data["db"]
+    if direction == "older":
+        page = await _load_notes_page(db, owner_id, before_id=cursor)
+    else:
+        page = await _load_notes_page(db, owner_id, after_id=cursor)
+
+    await query.answer()
+    if page is None:
+        await query.edit_message_text("Заметок на этой странице больше нет. Обнови список: /note list")
+        return
+    text, keyboard = page
+    await query.edit_message_text(text, reply_markup=keyboard)
@@ -4,176 +4,230 @@ quiz.py
 
 Логика:
 - Выбираем 3 случайных вопроса по теме;
-- Задаем по очереди;
-- Ждем текстовый ответ на каждый вопрос (через await bot);
+- Задаем по очереди: вопрос приходит с кнопками вариантов ответа;
+- Ответ кнопкой: то же сообщение редактируется — вердикт и следующий вопрос (или итог),
+  новых сообщений в чате не появляется;
+- Ответ текстом тоже принимается (on_text_quiz_router) — тогда вердикт и следующий
+  вопрос приходят новым сообщением;
 - Считаем правильные;
-- Записываем статистику в SQLite.
+- Записываем статистику в SQLite (по ней же ведутся таблицы лидеров /top);
+  имя игрока для /top запоминается при старте викторины.
+
+Состояние викторины — QuizSession в user_data["quiz"] (только id вопросов, без копий текста
+и ответов); активные сессии учитывает QuizSessionRegistry (bot_data["quiz_sessions"]),
+брошенные викторины он со временем убирает. В user_data["quiz_seen"] — компактный
+фильтр недавно заданных вопросов: новая викторина старается их не повторять.
+Кнопки устаревшего вопроса (уже отвеченного текстом или из прошлой викторины)
+отсекаются по номеру вопроса в callback_data.
 """
 
 from __future__ import annotations
 
-from telegram import Update
+from typing import Optional
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
-from app.db import upsert_quiz_stats
-from app.services.quiz_bank import available_topics, pick_questions, check_answer
+from app.db_async import Database
+from app.services.leaderboard import Leaderboard
+from app.services.quiz_bank import QuizBank, match_answer
+from app.services.quiz_sessions import QuizSession, QuizSessionRegistry
+from app.services.sender import reply
+from app.utils.bloom import RecentIds
 from app.utils.text import join_lines
 
 
+async def _question_text(bank: QuizBank, session: QuizSession) -> str:
+    q = await bank.get(session.current_id)
+    return f"Вопрос {session.index + 1}/{session.total}: {q.question if q else '—'}"
+
+
+async def _keyboard(bank: QuizBank, user_id: int, session: QuizSession) -> InlineKeyboardMarkup:
+    # callback_data = quiz:<user_id>:<номер вопроса>:<номер варианта> (лимит Telegram — 64 байта).
+    options = await bank.get_many(session.current_options)
+    buttons = [
+        InlineKeyboardButton(options[qid].display, callback_data=f"quiz:{user_id}:{session.index}:{i}")
+        for i, qid in enumerate(session.current_options)
+        if qid in options
+    ]
+    # По два варианта в ряд: короткие ответы помещаются, длинные не обрезаются.
+    return InlineKeyboardMarkup([buttons[i : i + 2] for i in range(0, len(buttons), 2)])
+
+
+async def _advance(
+    user_id: int,
+    context: ContextTypes.DEFAULT_TYPE,
+    session: QuizSession,
+    answer: str,
+    chosen_id: Optional[int] = None,
+) -> tuple[str, Optional[InlineKeyboardMarkup]]:
+    """
+    Засчитывает ответ на текущий вопрос. Возвращает текст (вердикт + следующий вопрос
+    или итог) и клавиатуру следующего вопроса (None — викторина закончилась).
+    chosen_id — id вопроса, чей ответ на нажатой кнопке (None — ответ текстом).
+    """
+    bank: QuizBank = context.application.bot_data["quiz_bank"]
+    settings = context.application.bot_data["settings"]
+    q = await bank.get(session.current_id)
+
+    if q is None:
+        typos = None
+    elif chosen_id is not None:
+        # Кнопка: опечаток не бывает, а нечеткое сравнение засчитало бы похожий чужой ответ.
+        # Точное совпадение — на случай одинаковых ответов у разных вопросов.
+        typos = 0 if chosen_id == session.current_id else match_answer(q, answer)
+    else:
+        typos = match_answer(q, answer, fuzzy=settings.quiz_fuzzy)
+    session.advance(typos is not None)
+    if typos is not None:
+        verdict = "Верно ✅" if typos == 0 else f"Верно ✅ (правильно пишется: {q.display})"
+    else:
+        # Покажем 1 “эталонный” ответ, чтобы не спамить списком.
+        verdict = f"Не совсем ❌ Пример правильного ответа: {q.display if q else '—'}"
+
+    if not session.done:
+        text = join_lines([verdict, "", await _question_text(bank, session)])
+        return text, await _keyboard(bank, user_id, session)
+
+    # Вопросы закончились — подводим итог и пишем статистику:
+    sessions: QuizSessionRegistry = context.application.bot_data["quiz_sessions"]
+    sessions.finish(user_id, context.user_data)
+    score, total = session.score, session.total
+
+    db: Database = context.application.bot_data["db"]
+    await db.upsert_quiz_stats(
+        user_id=user_id,
+        quizzes_add=1,
+        questions_add=total,
+        correct_add=score,
+        last_topic=session.topic,
+    )
+
+    percent = round((score / total) * 100, 1) if total else 0.0
+    summary = join_lines(
+        [
+            verdict,
+            "",
+            "Викторина завершена!",
+            f"Результат: {score}/{total} ({percent}%)",
+            "Статистика обновлена. Посмотри: /stats",
+        ]
+    )
+    return summary, None
+
+
 async def cmd_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     args = context.args
+    bank: QuizBank = context.application.bot_data["quiz_bank"]
     if not args:
-        topics = ", ".join(available_topics())
-        await update.message.reply_text(f"Укажи тему: /quiz <тема>\nДоступно: {topics}")
+        topics = ", ".join(bank.available_topics())
+        reply(update, context, f"Укажи тему: /quiz <тема>\nДоступно: {topics}")
         return
 
     topic = args[0].strip().lower()
-    questions = pick_questions(topic, count=3)
+    seen: RecentIds = context.user_data.setdefault("quiz_seen", RecentIds())
+    questions = await bank.pick(topic, count=3, seen=seen)
     if not questions:
-        topics = ", ".join(available_topics())
-        await update.message.reply_text(f"Не знаю такую тему.\nДоступно: {topics}")
+        topics = ", ".join(bank.available_topics())
+        reply(update, context, f"Не знаю такую тему.\nДоступно: {topics}")
         return
 
     user_id = int(update.effective_user.id) if update.effective_user else 0
-    chat_id = update.effective_chat.id if update.effective_chat else None
-    if chat_id is None:
-        await update.message.reply_text("Не удалось определить чат.")
+    if update.effective_chat is None:
+        reply(update, context, "Не удалось определить чат.")
         return
 
-    await update.message.reply_text(
-        f"Викторина по теме: {topic}\n"
-        "Отвечай обычным сообщением. Чтобы остановиться — напиши: стоп"
+    # Новая викторина заменяет незаконченную; кнопки старой станут устаревшими.
+    session = QuizSession(
+        topic,
+        [q.qid for q in questions],
+        [await bank.option_ids(q) for q in questions],
+    )
+    sessions: QuizSessionRegistry = context.application.bot_data["quiz_sessions"]
+    sessions.start(user_id, context.user_data, session)
+    for q in questions:
+        seen.add(q.qid)
+    if update.effective_user:
+        leaderboard: Leaderboard = context.application.bot_data["leaderboard"]
+        await leaderboard.remember_name(user_id, update.effective_user.first_name)
+
+    # Вступление и первый вопрос — одним сообщением: его и будем редактировать.
+    reply(
+        update,
+        context,
+        join_lines(
+            [
+                f"Викторина по теме: {topic}",
+                "Жми кнопку с ответом или отвечай обычным сообщением. Чтобы остановиться — напиши: стоп",
+                "",
+                await _question_text(bank, session),
+            ]
+        ),
+        reply_markup=await _keyboard(bank, user_id, session),
     )
 
-    correct = 0
-    total = len(questions)
-
-    for i, q in enumerate(questions, start=1):
-        await update.message.reply_text(f"Вопрос {i}/{total}: {q.question}")
-
-        # Ждем следующий текст от этого же пользователя в этом же чате.
-        # PTB не дает "из коробки" await next message одним вызовом,
-        # поэтому используем ConversationHandler? Можно, но для учебности проще так:
-        # мы включим режим "ожидания" через bot_data + MessageHandler в quiz-router.
-        #
-        # Чтобы не усложнять архитектуру, реализуем мини-диалог через application.user_data:
-        # user_data хранит состояние между апдейтами.
-        context.user_data["quiz_waiting"] = True
-        context.user_data["quiz_expected_answers"] = q.answers
-        context.user_data["quiz_topic"] = topic
-
-        # Сигнализируем главному циклу: ожидаем ответ.
-        # Дальше управление перейдет в handler on_text_quiz_router.
-        # Мы просто выходим: дальнейшие шаги викторины продолжатся там.
-        context.user_data["quiz_queue"] = context.user_data.get("quiz_queue", [])
-        context.user_data["quiz_queue"].append(
-            {"question": q.question, "answers": list(q.answers)}
-        )
-
-        # Важно: прерываем здесь, а продолжение идет в роутере.
-        # Чтобы пользователь не получал сразу все вопросы подряд.
-        return
-
-    # До сюда в текущей реализации не дойдем (вопросы идут через роутер).
-    # Оставлено как пояснение для расширения.
-    _ = correct
-async def on_text_quiz_router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """
-    Роутер, который ловит обычные текстовые сообщения, когда пользователь в режиме викторины.
-    Держит очередь вопросов в user_data и по одному задает следующий.
-    """
 
-    if not update.message or not update.message.text:
+async def on_quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Кнопка варианта ответа: callback_data = quiz:<user_id>:<номер вопроса>:<номер варианта>."""
+    query = update.callback_query
+    if not query or not query.data:
         return
 
-    # Если пользователь не в режиме викторины — игнорируем.
-    if not context.user_data.get("quiz_waiting"):
+    try:
+        _, owner_raw, number_raw, option_raw = query.data.split(":")
+        owner_id, number, option = int(owner_raw), int(number_raw), int(option_raw)
+    except ValueError:
+        await query.answer()
         return
 
-    text = update.message.text.strip()
-    if text.lower() in {"стоп", "stop", "cancel"}:
-        # Сбрасываем состояние.
-        context.user_data.pop("quiz_waiting", None)
-        context.user_data.pop("quiz_queue", None)
-        context.user_data.pop("quiz_score", None)
-        context.user_data.pop("quiz_total", None)
-        context.user_data.pop("quiz_topic", None)
-        await update.message.reply_text("Ок, остановил викторину.")
+    # В группах кнопки видят все: отвечать может только тот, кто начал викторину.
+    if not query.from_user or query.from_user.id != owner_id:
+        await query.answer("Это не твоя викторина.")
         return
 
-    # Восстановим текущий вопрос из очереди:
-    queue = context.user_data.get("quiz_queue") or []
-    if not queue:
-        # Нечего обрабатывать — сбрасываем.
-        context.user_data.pop("quiz_waiting", None)
-        await update.message.reply_text("Похоже, викторина уже завершена. Запусти заново: /quiz <тема>")
+    sessions: QuizSessionRegistry = context.application.bot_data["quiz_sessions"]
+    session = sessions.get(owner_id, context.user_data)
+    if session is None or session.index != number:
+        await query.answer("Этот вопрос уже закрыт.")
+        return
+    if not 0 <= option < len(session.current_options):
+        await query.answer()
         return
 
-    current = queue[0]
-    answers = set(a.lower() for a in current.get("answers", []))
+    bank: QuizBank = context.application.bot_data["quiz_bank"]
+    chosen_id = session.current_options[option]
+    chosen = await bank.get(chosen_id)
+    text, keyboard = await _advance(owner_id, context, session, chosen.display if chosen else "", chosen_id)
+    await query.answer()
+    try:
+        await query.edit_message_text(text, reply_markup=keyboard)
+    except BadRequest:
+        # Сообщение удалено или слишком старое для редактирования — продолжим новым.
+        reply(update, context, text, reply_markup=keyboard)
 
-    # Инициализируем счетчики, если их еще нет:
-    if "quiz_score" not in context.user_data:
-        context.user_data["quiz_score"] = 0
-    if "quiz_total" not in context.user_data:
-        context.user_data["quiz_total"] = len(queue)
 
-    # Проверка ответа:
-    from app.services.quiz_bank import QuizQuestion  # локальный импорт, чтобы файл был самостоятельным
-    q_obj = QuizQuestion(question=current.get("question", ""), answers=answers)
+async def on_text_quiz_router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Роутер, который ловит обычные текстовые сообщения, когда пользователь в режиме викторины.
+    Засчитывает ответ на текущий вопрос сессии и задает следующий.
+    """
+
+    if not update.message or not update.message.text or not update.effective_user:
+        return
 
-    is_ok = check_answer(q_obj, text)
-    if is_ok:
-        context.user_data["quiz_score"] += 1
-        await update.message.reply_text("Верно ✅")
-    else:
-        # Покажем 1 “эталонный” ответ, чтобы не спамить списком.
-        example = next(iter(answers)) if answers else "—"
-        await update.message.reply_text(f"Не совсем ❌ Пример правильного ответа: {example}")
-
-    # Убираем текущий вопрос из очереди:
-    queue.pop(0)
-    context.user_data["quiz_queue"] = queue
-
-    # Если вопросы закончились — подводим итог и пишем статистику:
-    if not queue:
-        score = int(context.user_data.get("quiz_score", 0))
-        total = int(context.user_data.get("quiz_total", 0))
-        topic = str(context.user_data.get("quiz_topic", "")) or None
-
-        user_id = int(update.effective_user.id) if update.effective_user else 0
-
-        upsert_quiz_stats(
-            context.application.bot_data["db_path"],
-            user_id=user_id,
-            quizzes_add=1,
-            questions_add=total,
-            correct_add=score,
-            last_topic=topic,
-        )
-
-        percent = round((score / total) * 100, 1) if total else 0.0
-        await update.message.reply_text(
-            join_lines(
-                [
-                    "Викторина завершена!",
-                    f"Результат: {score}/{total} ({percent}%)",
-                    "Статистика обновлена. Посмотри: /stats",
-                ]
-            )
-        )
-
-        # Сбрасываем состояние:
-        context.user_data.pop("quiz_waiting", None)
-        context.user_data.pop("quiz_queue", None)
-        context.user_data.pop("quiz_score", None)
-        context.user_data.pop("quiz_total", None)
-        context.user_data.pop("quiz_topic", None)
+    # Если у пользователя нет активной викторины — игнорируем.
+    user_id = int(update.effective_user.id)
+    sessions: QuizSessionRegistry = context.application.bot_data["quiz_sessions"]
+    session = sessions.get(user_id, context.user_data)
+    if session is None:
         return
 
-    # Иначе задаем следующий вопрос:
-    next_q = queue[0]
-    idx_done = int(context.user_data.get("quiz_total", 0)) - len(queue)
-    total = int(context.user_data.get("quiz_total", 0))
-    await update.message.reply_text(f"Вопрос {idx_done + 1}/{total}: {next_q.get('question', '')}")
+    text = update.message.text.strip()
+    if text.lower() in {"стоп", "stop", "cancel"}:
+        sessions.finish(user_id, context.user_data)
+        reply(update, context, "Ок, остановил викторину.")
+        return
 
+    text, keyboard = await _advance(user_id, context, session, text)
+    reply(update, context, text, reply_markup=keyboard)
@@ -8,13 +8,15 @@ from __future__ import annotations
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from app.services.quiz_bank import available_topics
+from app.services.quiz_bank import QuizBank
+from app.services.sender import reply
 from app.utils.text import join_lines
 
 
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_first = update.effective_user.first_name if update.effective_user else "друг"
-    topics = ", ".join(available_topics())
+    bank: QuizBank = context.application.bot_data["quiz_bank"]
+    topics = ", ".join(bank.available_topics())
 
     text = join_lines(
         [
@@ -34,11 +36,12 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "Напиши /help, чтобы увидеть все команды.",
         ]
     )
-    await update.message.reply_text(text)
+    reply(update, context, text)
 
 
 async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    topics = ", ".join(available_topics())
+    bank: QuizBank = context.application.bot_data["quiz_bank"]
+    topics = ", ".join(bank.available_topics())
     text = join_lines(
         [
             "Команды бота:",
@@ -47,12 +50,18 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "/help — список команд;",
             "",
             "/note add <текст> — добавить заметку в БД;",
-            "/note list — показать последние 10 заметок;",
+            "/note list — заметки постранично (кнопки «Новее»/«Старее»);",
+            "/note search <запрос> — поиск по заметкам;",
+            "/note remind <id> <когда> — напомнить о заметке (30m, 2h, 1d, 18:00, 25.12 09:00);",
             "/note del <id> — удалить заметку по id;",
             "",
             f"/quiz <тема> — мини-викторина (темы: {topics});",
             "/weather <город> — текущая погода (Open-Meteo);",
+            "/weather subscribe <город> <ЧЧ:ММ> — погода каждый день в заданное время;",
+            "/weather unsubscribe [город] — отменить подписку (без города — все);",
+            "/weather subs — ваши подписки;",
             "/stats — ваша статистика (заметки + викторины);",
+            "/top [тема] — таблица лидеров викторины (общая или по теме);",
             "",
             "Примеры:",
             "— /note add Сдать отчёт в пятницу;",
@@ -61,5 +70,5 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "— /weather München;",
         ]
     )
-    await update.message.reply_text(text)
+    reply(update, context, text)
 
@@ -1,23 +1,30 @@
 """
 stats.py
 /stats — сводная статистика пользователя.
+/top [тема] — таблица лидеров викторины (общая или по теме, см. app/services/leaderboard.py).
 """
 
 from __future__ import annotations
 
+from typing import Any, Optional
+
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from app.db import count_notes, get_quiz_stats
+from app.db_async import Database
+from app.services.leaderboard import Leaderboard
+from app.services.quiz_bank import QuizBank
+from app.services.sender import reply
 from app.utils.text import join_lines
 
 
 async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = int(update.effective_user.id) if update.effective_user else 0
 
-    notes_cnt = count_notes(context.application.bot_data["db_path"], user_id)
-    qs = get_quiz_stats(context.application.bot_data["db_path"], user_id)
+    db: Database = context.application.bot_data["db"]
+    qs = await db.get_user_stats(user_id)
 
+    notes_cnt = int(qs["notes_total"])
     quizzes = int(qs["quizzes_total"])
     questions = int(qs["questions_total"])
     correct = int(qs["correct_total"])
@@ -36,5 +43,49 @@ async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             f"Последняя тема: {last_topic if last_topic else '—'}",
         ]
     )
-    await update.message.reply_text(text)
+    reply(update, context, text)
+
+
+def _accuracy(correct: int, questions: int) -> float:
+    return round((correct / questions) * 100, 1) if questions else 0.0
+
+
+def _top_lines(rows: list[dict[str, Any]]) -> list[str]:
+    lines = []
+    place = 0
+    prev: Optional[tuple[int, int]] = None
+    for i, row in enumerate(rows, start=1):
+        correct, questions = int(row["correct"]), int(row["questions"])
+        # Одинаковый счет — одно место (как и в Leaderboard.rank).
+        if (correct, questions) != prev:
+            place, prev = i, (correct, questions)
+        name = row["name"] or f"игрок {row['user_id']}"
+        lines.append(f"{place}. {name} — {correct}/{questions} ({_accuracy(correct, questions)}%)")
+    return lines
 
+
+async def cmd_top(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    topic: Optional[str] = context.args[0].strip().lower() if context.args else None
+    bank: QuizBank = context.application.bot_data["quiz_bank"]
+    if topic is not None and topic not in bank.available_topics():
+        topics = ", ".join(bank.available_topics())
+        reply(update, context, f"Не знаю такую тему.\nДоступно: {topics}")
+        return
+
+    leaderboard: Leaderboard = context.application.bot_data["leaderboard"]
+    rows = await leaderboard.top(topic)
+    title = f"Лучшие игроки по теме {topic}:" if topic else "Лучшие игроки (все темы):"
+    if not rows:
+        reply(update, context, join_lines([title, f"Пока никто не играл. Начни первым: /quiz {topic or '<тема>'}"]))
+        return
+
+    lines = [title, *_top_lines(rows), ""]
+    user_id = int(update.effective_user.id) if update.effective_user else 0
+    rank = await leaderboard.rank(topic, user_id)
+    if rank is not None:
+        place, total = rank
+        lines.append(f"Ты: {place}-е место из {total}.")
+    else:
+        lines.append(f"Тебя пока нет в таблице — сыграй: /quiz {topic or '<тема>'}")
+    lines.append("Место: больше верных ответов, при равенстве — выше точность.")
+    reply(update, context, join_lines(lines))
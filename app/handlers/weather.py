@@ -1,55 +1,194 @@
 """
 weather.py
 /weather <город>
+/weather subscribe <город> <ЧЧ:ММ> — ежедневная погода (рассылка: app/services/subscriptions.py)
+/weather unsubscribe [город]        — отписаться от города (без города — от всех)
+/weather subs                       — список подписок
 
 Логика:
 - Берем город из аргументов;
-- Геокодим через Open-Meteo;
-- Берем current_weather;
+- Геокодим через кэш (память -> SQLite -> Open-Meteo);
+- Берем current_weather (кэш по ячейке сетки, один запрос на ячейку);
 - Форматируем и показываем.
+
+Если Open-Meteo недоступен (автомат разомкнут, сеть, дедлайн), показываем
+последнее известное значение с пометкой об устаревании — без ожидания таймаутов.
 """
 
 from __future__ import annotations
 
+import time
+
 import httpx
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from app.services.open_meteo import geocode_city, get_weather_now, describe_weather_code
+from app.db_async import Database
+from app.services.city_names import normalize_city
+from app.services.geocache import GeoCache
+from app.services.http import HttpClients
+from app.services.open_meteo import GeoResult, describe_weather_code
+from app.services.resilience import CircuitOpenError
+from app.services.sender import reply
+from app.services.subscriptions import format_hhmm, next_due_at, parse_hhmm
+from app.services.weather_cache import WeatherCache, WeatherReading
 from app.utils.text import join_lines
 
+MAX_SUBSCRIPTIONS_PER_CHAT = 5
+
+
+def format_weather(geo: GeoResult, reading: WeatherReading) -> str:
+    w = reading.weather
+    lines = [
+        f"Погода сейчас: {geo.name} ({geo.country})",
+        f"Температура: {w.temperature_c:.1f}°C",
+        f"Ветер: {w.wind_kmh:.1f} км/ч",
+        f"Состояние: {describe_weather_code(w.weather_code)}",
+    ]
+    if reading.stale:
+        minutes = max(1, round(reading.age_sec / 60))
+        lines.append(f"⚠️ Сервис погоды сейчас недоступен, данные {minutes} мин назад.")
+    return join_lines(lines)
+
 
 async def cmd_weather(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     args = context.args
     if not args:
-        await update.message.reply_text("Использование: /weather <город>\nПример: /weather Berlin")
+        reply(
+            update,
+            context,
+            "Использование: /weather <город>\nПример: /weather Berlin\n"
+            "Подписка: /weather subscribe <город> <ЧЧ:ММ>, /weather unsubscribe [город], /weather subs"
+        )
+        return
+
+    sub = args[0].strip().lower()
+    if sub == "subscribe":
+        await _subscribe(update, context, args[1:])
+        return
+    if sub == "unsubscribe":
+        await _unsubscribe(update, context, args[1:])
+        return
+    if sub == "subs":
+        await _list_subscriptions(update, context)
+        return
+
+    city = " ".join(args).strip()
+    # Общие клиенты с keep-alive создаются один раз в post_init.
+    http: HttpClients = context.application.bot_data["http"]
+    geo_cache: GeoCache = context.application.bot_data["geo_cache"]
+    weather_cache: WeatherCache = context.application.bot_data["weather_cache"]
+
+    try:
+        geo = await geo_cache.geocode(http, city)
+        if not geo:
+            reply(update, context, "Не нашёл такой город. Попробуй другой вариант написания.")
+            return
+
+        reading = await weather_cache.get(geo.latitude, geo.longitude)
+        reply(update, context, format_weather(geo, reading))
+
+    except CircuitOpenError:
+        reply(update, context, "Сервис погоды временно недоступен. Попробуй через минуту.")
+    except httpx.HTTPError:
+        reply(update, context, "Ошибка сети при запросе погоды. Попробуй чуть позже.")
+    except Exception:
+        reply(update, context, "Неожиданная ошибка при обработке погоды.")
+
+
+async def _subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE, args: list[str]) -> None:
+    send_minute = parse_hhmm(args[-1]) if len(args) >= 2 else None
+    if send_minute is None:
+        reply(
+            update,
+            context,
+            "Подписка: /weather subscribe <город> <ЧЧ:ММ>\nПример: /weather subscribe Berlin 07:30"
+        )
+        return
+
+    city = " ".join(args[:-1]).strip()
+    chat_id = update.effective_chat.id
+    user_id = int(update.effective_user.id) if update.effective_user else 0
+    bot_data = context.application.bot_data
+    db: Database = bot_data["db"]
+    http: HttpClients = bot_data["http"]
+    geo_cache: GeoCache = bot_data["geo_cache"]
+    tz = bot_data["subscriptions_tz"]
+
+    try:
+        geo = await geo_cache.geocode(http, city)
+    except (CircuitOpenError, httpx.HTTPError):
+        reply(update, context, "Сервис погоды временно недоступен. Попробуй через минуту.")
+        return
+    if not geo:
+        reply(update, context, "Не нашёл такой город. Попробуй другой вариант написания.")
         return
 
+    city_key = normalize_city(geo.name)
+    existing = await db.list_weather_subscriptions(chat_id)
+    if len(existing) >= MAX_SUBSCRIPTIONS_PER_CHAT and all(s["city_key"] != city_key for s in existing):
+        reply(
+            update,
+            context,
+            f"Не больше {MAX_SUBSCRIPTIONS_PER_CHAT} подписок в чате. Отписаться: /weather unsubscribe <город>"
+        )
+        return
+
+    await db.upsert_weather_subscription(
+        chat_id,
+        city_key,
+        user_id,
+        geo.name,
+        geo.country,
+        geo.latitude,
+        geo.longitude,
+        send_minute,
+        next_due_at(send_minute, tz, time.time()),
+    )
+    reply(
+        update,
+        context,
+        f"Готово: погода для {geo.name} ({geo.country}) каждый день в {format_hhmm(send_minute)} ({tz})."
+    )
+
+
+async def _unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE, args: list[str]) -> None:
+    bot_data = context.application.bot_data
+    db: Database = bot_data["db"]
+    chat_id = update.effective_chat.id
     city = " ".join(args).strip()
-    timeout = float(context.application.bot_data.get("http_timeout_sec", 10.0))
+    if not city:
+        n = await db.delete_weather_subscriptions(chat_id)
+        reply(update, context, "Подписки отменены." if n else "Подписок нет.")
+        return
 
-    async with httpx.AsyncClient(timeout=timeout) as client:
+    # Ключ подписки — нормализованное геокодированное название (как в _subscribe).
+    # Если пользователь написал его же (или синоним), сеть не нужна; иначе ("Tokyo"
+    # при ключе "токио") разрешаем название тем же геокодингом.
+    city_key = normalize_city(city)
+    existing = await db.list_weather_subscriptions(chat_id)
+    if all(s["city_key"] != city_key for s in existing):
         try:
-            geo = await geocode_city(client, city)
-            if not geo:
-                await update.message.reply_text("Не нашёл такой город. Попробуй другой вариант написания.")
-                return
-
-            w = await get_weather_now(client, geo.latitude, geo.longitude)
-            desc = describe_weather_code(w.weather_code)
-
-            text = join_lines(
-                [
-                    f"Погода сейчас: {geo.name} ({geo.country})",
-                    f"Температура: {w.temperature_c:.1f}°C",
-                    f"Ветер: {w.wind_kmh:.1f} км/ч",
-                    f"Состояние: {desc}",
-                ]
-            )
-            await update.message.reply_text(text)
-
-        except httpx.HTTPError:
-            await update.message.reply_text("Ошибка сети при запросе погоды. Попробуй чуть позже.")
-        except Exception:
-            await update.message.reply_text("Неожиданная ошибка при обработке погоды.")
+            geo = await bot_data["geo_cache"].geocode(bot_data["http"], city)
+        except (CircuitOpenError, httpx.HTTPError):
+            reply(update, context, "Сервис погоды временно недоступен. Попробуй через минуту.")
+            return
+        if geo is None:
+            reply(update, context, "Таких подписок нет. Список: /weather subs")
+            return
+        city_key = normalize_city(geo.name)
+    n = await db.delete_weather_subscriptions(chat_id, city_key)
+    reply(update, context, "Подписка отменена." if n else "Таких подписок нет. Список: /weather subs")
+
 
+async def _list_subscriptions(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    db: Database = context.application.bot_data["db"]
+    subs = await db.list_weather_subscriptions(update.effective_chat.id)
+    if not subs:
+        reply(update, context, "Подписок нет. Добавить: /weather subscribe <город> <ЧЧ:ММ>")
+        return
+    tz = context.application.bot_data["subscriptions_tz"]
+    lines = [f"Подписки (время {tz}):"]
+    for s in subs:
+        lines.append(f'{format_hhmm(s["send_minute"])} — {s["city"]} ({s["country"]})')
+    reply(update, context, join_lines(lines))
@@ -0,0 +1,70 @@
+"""
+maintenance.py
+Служебные операции над БД бота (запуск из консоли, бот можно не останавливать).
+Кэш чтений запущенного бота об этих изменениях не знает: после rebuild-counters он
+может отдавать старые счетчики до CACHE_TTL_SEC секунд (или до перезапуска бота);
+в работающем боте вместо этого есть /rebuildcounters.
+
+Примеры:
+- python -m app.maintenance fts-backfill
+- python -m app.maintenance fts-backfill --chunk 1000
+- python -m app.maintenance rebuild-counters
+- python -m app.maintenance gazetteer-build cities15000.txt data/cities.gzt
+- python -m app.maintenance quiz-import questions.tsv   (затем /quizreload в боте)
+"""
+
+from __future__ import annotations
+
+import argparse
+
+from app.db import backfill_notes_fts, import_quiz_questions, init_db, rebuild_user_counters
+from app.services.gazetteer import build_index
+from app.services.quiz_bank import read_quiz_tsv
+from config import DB_PATH, GAZETTEER_PATH
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Обслуживание SQLite-базы Student Helper Bot")
+    parser.add_argument("--db", default=str(DB_PATH), help="путь к файлу БД")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    fts = sub.add_parser("fts-backfill", help="проиндексировать старые заметки для /note search")
+    fts.add_argument("--chunk", type=int, default=500, help="строк в одной транзакции")
+
+    sub.add_parser(
+        "rebuild-counters",
+        help="пересчитать user_counters по таблице notes (кэш запущенного бота не сбрасывается: "
+        "старые значения видны до CACHE_TTL_SEC; в работающем боте — /rebuildcounters)",
+    )
+
+    gaz = sub.add_parser("gazetteer-build", help="собрать офлайн-справочник городов из выгрузки GeoNames")
+    gaz.add_argument("src", help="файл выгрузки GeoNames (например, cities15000.txt)")
+    gaz.add_argument("out", nargs="?", default=str(GAZETTEER_PATH), help="куда записать индекс")
+    gaz.add_argument("--min-population", type=int, default=0, help="пропускать города меньше")
+
+    quiz = sub.add_parser("quiz-import", help="загрузить вопросы викторины из TSV: тема, вопрос, ответ1|ответ2")
+    quiz.add_argument("src", help="файл TSV в UTF-8")
+
+    args = parser.parse_args()
+    if args.command == "gazetteer-build":
+        # БД здесь не нужна.
+        places, keys = build_index(args.src, args.out, min_population=args.min_population)
+        print(f"Справочник записан в {args.out}: городов {places}, ключей {keys}")
+        return
+
+    # init_db создаст недостающие таблицы/триггеры (и границу заполнения FTS).
+    init_db(args.db)
+
+    if args.command == "fts-backfill":
+        n = backfill_notes_fts(args.db, chunk=args.chunk)
+        print(f"Проиндексировано заметок: {n}")
+    elif args.command == "rebuild-counters":
+        n = rebuild_user_counters(args.db)
+        print(f"Пересчитано счетчиков пользователей: {n}")
+    elif args.command == "quiz-import":
+        n = import_quiz_questions(args.db, read_quiz_tsv(args.src))
+        print(f"Загружено вопросов: {n}. Чтобы бот их увидел без перезапуска: /quizreload")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+metrics.py
+Простой реестр метрик процесса.
+
+Компоненты (кэши, очереди и т.п.) регистрируют функцию, возвращающую словарь счетчиков;
+/metrics (app/handlers/admin.py) собирает снимок всех зарегистрированных источников.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable
+
+MetricsProvider = Callable[[], dict[str, Any]]
+
+_providers: dict[str, MetricsProvider] = {}
+
+
+def register(name: str, provider: MetricsProvider) -> None:
+    _providers[name] = provider
+
+
+def unregister(name: str) -> None:
+    _providers.pop(name, None)
+
+
+def snapshot() -> dict[str, dict[str, Any]]:
+    return {name: provider() for name, provider in sorted(_providers.items())}
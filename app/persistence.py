@@ -0,0 +1,286 @@
+"""
+persistence.py
+Persistence для python-telegram-bot поверх той же SQLite (таблица persisted_data).
+
+user_data и chat_data переживают перезапуск бота — в том числе незаконченные викторины
+(QuizSession и RecentIds в user_data). В отличие от PicklePersistence, которая на каждом
+сбросе переписывает один файл со всеми пользователями:
+- у каждого пользователя/чата своя строка (pickle его словаря);
+- при старте ничего не читается: строка загружается при первом обращении
+  (PTB вызывает refresh_user_data/refresh_chat_data перед каждым хендлером);
+- раз в update_interval PTB отдает только тех, кого затронули апдейты; из них пишутся
+  только изменившиеся — хэш последнего записанного pickle хранится в памяти; user_data,
+  измененный вне апдейта (вытеснение сессии викторины задачей), передается mark_user_dirty;
+- изменения копятся в памяти и уходят в БД одной транзакцией раз в update_interval
+  и при остановке бота (flush).
+
+bot_data не сохраняется: там живут сервисы (БД, HTTP-клиенты, очереди).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Optional, TypeVar
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from app.db import configure_conn, delete_persisted_many_q, get_conn, get_persisted_q, put_persisted_many_q
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# ("user" | "chat", id)
+_Key = tuple[str, int]
+
+
+class SqlitePersistence(BasePersistence[dict[Any, Any], dict[Any, Any], dict[Any, Any]]):
+    def __init__(self, db_path: Path, update_interval: float = 30.0) -> None:
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db_path = db_path
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._conns: list[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+
+        # Ключи, чьи строки уже прочитаны из БД (или которых там нет).
+        self._loaded: set[_Key] = set()
+        self._loading: dict[_Key, asyncio.Task[None]] = {}
+        # Хэш pickle, который лежит в БД (или уже поставлен в очередь на запись).
+        self._written: dict[_Key, int] = {}
+        # Ожидающие записи: pickle или None — удалить строку.
+        self._pending: dict[_Key, Optional[bytes]] = {}
+        self._task: Optional[asyncio.Task[None]] = None
+        self._flush_lock = asyncio.Lock()
+
+        self.loads = 0
+        self.clean_skipped = 0
+        self.rows_written = 0
+        self.rows_deleted = 0
+        self.flushes = 0
+        self.failures = 0
+
+    # --- Загрузка: ничего при старте, строка — при первом обращении ---
+
+    async def get_user_data(self) -> dict[int, dict[Any, Any]]:
+        return {}
+
+    async def get_chat_data(self) -> dict[int, dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> Optional[Any]:
+        return None
+
+    async def get_conversations(self, name: str) -> dict[Any, Any]:
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict[Any, Any]) -> None:
+        await self._refresh(("user", user_id), user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict[Any, Any]) -> None:
+        await self._refresh(("chat", chat_id), chat_data)
+
+    async def refresh_bot_data(self, bot_data: dict[Any, Any]) -> None:
+        return None
+
+    async def _refresh(self, key: _Key, data: dict[Any, Any]) -> None:
+        if key in self._loaded:
+            return
+        # Одна загрузка на ключ, даже если апдейты чата пришли одновременно: data — один и тот же
+        # словарь приложения, загруженное сливается в него один раз.
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, data))
+            self._loading[key] = task
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        await asyncio.shield(task)
+
+    async def _load(self, key: _Key, data: dict[Any, Any]) -> None:
+        blob = await self._db(get_persisted_q, *key)
+        self.loads += 1
+        if blob is not None:
+            self._written.setdefault(key, hash(blob))
+            try:
+                stored = pickle.loads(blob)
+            except Exception:
+                # Например, класс из старой версии бота удален: начинаем с пустых данных.
+                log.exception("Не удалось прочитать сохраненные данные %s %s", *key)
+                stored = {}
+            # То, что хендлеры успели записать до загрузки, новее сохраненного.
+            for name, value in stored.items():
+                data.setdefault(name, value)
+        self._loaded.add(key)
+
+    # --- Запись: только изменившееся, пачкой раз в update_interval ---
+
+    async def update_user_data(self, user_id: int, data: dict[Any, Any]) -> None:
+        self._stage(("user", user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: dict[Any, Any]) -> None:
+        self._stage(("chat", chat_id), data)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._drop(("user", user_id))
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._drop(("chat", chat_id))
+
+    async def update_bot_data(self, data: dict[Any, Any]) -> None:
+        return None
+
+    async def update_callback_data(self, data: Any) -> None:
+        return None
+
+    async def update_conversation(self, name: str, key: tuple[int | str, ...], new_state: Optional[object]) -> None:
+        return None
+
+    def mark_user_dirty(self, user_id: int, data: dict[Any, Any]) -> None:
+        """user_data изменили вне апдейта (задача без user_id): PTB сам его не сохранит."""
+        if ("user", user_id) in self._loaded:
+            self._stage(("user", user_id), data)
+
+    def _drop(self, key: _Key) -> None:
+        # Удаляем и незагруженную строку: drop_*_data вызывают явно.
+        self._written.pop(key, None)
+        self._pending[key] = None
+        self._ensure_task()
+
+    def _stage(self, key: _Key, data: dict[Any, Any]) -> None:
+        if not data:
+            # Пустой словарь — строка не нужна; если ее и не было, писать нечего.
+            self._pending.pop(key, None)
+            if self._written.pop(key, None) is not None:
+                self._pending[key] = None
+                self._ensure_task()
+            return
+        try:
+            blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            log.exception("Данные %s %s не сериализуются и не будут сохранены", *key)
+            return
+        # Хэш, а не сами байты: в памяти 8 байт на ключ; коллизия 64-битного хэша
+        # в худшем случае пропустит одну запись до следующего изменения.
+        digest = hash(blob)
+        if self._written.get(key) == digest:
+            self.clean_skipped += 1
+            return
+        self._written[key] = digest
+        self._pending[key] = blob
+        self._ensure_task()
+
+    def _ensure_task(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="persistence-flush")
+
+    async def flush(self) -> None:
+        """Вызывается PTB при остановке (после последнего update_persistence)."""
+        if self._task is not None:
+            # Под замком: отмена не прервет запись посреди пачки (та уже вынута из _pending).
+            async with self._flush_lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._write_pending()
+        self._close()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.update_interval)
+            await self._write_pending()
+
+    async def _write_pending(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            puts = [(kind, key, blob) for (kind, key), blob in batch.items() if blob is not None]
+            deletes = [key for key, blob in batch.items() if blob is None]
+            try:
+                await self._db(self._apply, puts, deletes)
+            except Exception:
+                self.failures += 1
+                log.exception("Не удалось сохранить user_data/chat_data (%d строк)", len(batch))
+                # Вернем в очередь то, что не успело смениться более новым значением.
+                for key, blob in batch.items():
+                    self._pending.setdefault(key, blob)
+                return
+            self.flushes += 1
+            self.rows_written += len(puts)
+            self.rows_deleted += len(deletes)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "loaded": len(self._loaded),
+            "tracked": len(self._written),
+            "pending": len(self._pending),
+            "loads": self.loads,
+            "clean_skipped": self.clean_skipped,
+            "rows_written": self.rows_written,
+            "rows_deleted": self.rows_deleted,
+            "flushes": self.flushes,
+            "failures": self.failures,
+        }
+
+    # --- SQLite: свой небольшой пул (persistence загружается раньше post_init и Database) ---
+
+    async def _db(self, fn: Callable[..., T], *args: Any) -> T:
+        if self._executor is None:
+            # Два потока: точечные загрузки не ждут, пока пишется пачка.
+            self._executor = ThreadPoolExecutor(
+                max_workers=2, thread_name_prefix="sqlite-persistence", initializer=self._init_worker
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(self._call, fn, *args))
+
+    def _init_worker(self) -> None:
+        conn = get_conn(self.db_path)
+        # Транзакциями управляем сами (BEGIN/COMMIT).
+        conn.isolation_level = None
+        configure_conn(conn)
+        self._local.conn = conn
+        with self._conns_lock:
+            self._conns.append(conn)
+
+    def _call(self, fn: Callable[..., T], *args: Any) -> T:
+        return fn(self._local.conn, *args)
+
+    @staticmethod
+    def _apply(conn: sqlite3.Connection, puts: list[tuple[str, int, bytes]], deletes: list[_Key]) -> None:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if puts:
+                put_persisted_many_q(conn, puts, int(time.time()))
+            if deletes:
+                delete_persisted_many_q(conn, deletes)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _close(self) -> None:
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
@@ -0,0 +1,53 @@
+"""
+city_names.py
+Нормализация названий городов — общий ключ для кэша геокодинга и офлайн-справочника:
+регистр, лишние пробелы, латинская диакритика ("München" -> "munchen"), синонимы.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+
+# Синонимы: нормализованное написание -> нормализованный канонический ключ.
+CITY_ALIASES: dict[str, str] = {
+    "munich": "munchen",
+    "muenchen": "munchen",
+    "мюнхен": "munchen",
+    "moscow": "москва",
+    "moskva": "москва",
+    "saint petersburg": "санкт-петербург",
+    "st petersburg": "санкт-петербург",
+    "st. petersburg": "санкт-петербург",
+    "питер": "санкт-петербург",
+    "спб": "санкт-петербург",
+    "берлин": "berlin",
+    "париж": "paris",
+    "лондон": "london",
+    "вена": "wien",
+    "vienna": "wien",
+    "прага": "praha",
+    "prague": "praha",
+    "kiev": "киев",
+    "kyiv": "киев",
+}
+
+
+def normalize_city(city: str) -> str:
+    text = fold_city_name(city)
+    return CITY_ALIASES.get(text, text)
+
+
+def fold_city_name(city: str) -> str:
+    """Нормализация без синонимов: "Мюнхен" остается "мюнхен" (нужно для поиска по префиксу)."""
+    text = unicodedata.normalize("NFKC", city).casefold().replace("ё", "е")
+    text = "".join(_fold_latin(ch) for ch in text)
+    return re.sub(r"[\s,;]+", " ", text).strip(" .")
+
+
+def _fold_latin(ch: str) -> str:
+    # Латинская диакритика (ü, é, ł...) отбрасывается: "München" -> "munchen".
+    # Кириллицу не трогаем, иначе "й" превратилась бы в "и".
+    if ord(ch) >= 0x250:
+        return ch
+    return "".join(c for c in unicodedata.normalize("NFKD", ch) if not unicodedata.combining(c))
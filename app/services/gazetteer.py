@@ -0,0 +1,301 @@
+"""
+gazetteer.py
+Офлайн-справочник городов для геокодинга без сети.
+
+Источник — выгрузка GeoNames (cities15000.txt / cities5000.txt / cities1000.txt,
+https://download.geonames.org/export/dump/). Сырой файл один раз преобразуется в
+компактный бинарный индекс (python -m app.maintenance gazetteer-build ...), который бот
+открывает через mmap: загрузка — это чтение заголовка, а не разбор всего файла в
+Python-объекты; нужные страницы подтягивает ОС при поиске.
+
+Формат индекса (little-endian):
+    заголовок  HEADER: magic, число мест, число ключей, смещения секций
+    места      PLACE[n_places]: широта, долгота, население, смещение названия, смещение страны
+               (название страны, как у геокодера Open-Meteo, — см. country_names.py)
+    ключи      KEY[n_keys]: смещение ключа, номер места; отсортированы по (ключ, -население)
+    строки     длина (u16) + UTF-8
+
+Ключи — нормализованные названия (fold_city_name, без синонимов) из name, asciiname и
+alternatenames на латинице и кириллице, поэтому находятся и "Мюнхен", и "Munich", и "munchen";
+синонимы (CITY_ALIASES, "спб") применяются только к запросу.
+Поиск: точный (двоичный поиск), по префиксу (диапазон ключей) и нечеткий
+(ограниченное расстояние Левенштейна среди ключей с теми же первыми буквами) —
+последний только как исправление опечатки, когда город не нашла и сеть (GeoCache).
+"""
+
+from __future__ import annotations
+
+import mmap
+import struct
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any
+
+from app.services.city_names import fold_city_name, normalize_city
+from app.services.country_names import country_name
+from app.services.open_meteo import GeoResult
+from app.utils.text import bounded_levenshtein
+
+MAGIC = b"GZT1"
+HEADER = struct.Struct("<4sIIIII")
+PLACE = struct.Struct("<ffIII")
+KEY = struct.Struct("<II")
+STRLEN = struct.Struct("<H")
+
+# Длиннее — не город, а описание; в ключи не берем.
+MAX_KEY_LEN = 64
+# Сколько ключей просматриваем при поиске по префиксу ("с" совпадает с тысячами городов).
+PREFIX_SCAN_LIMIT = 2_000
+# Нечеткий поиск перебирает ключи с теми же первыми буквами: опечатки обычно не в начале слова.
+FUZZY_ANCHOR_LEN = 2
+# Сколько ключей с тем же началом просматриваем при нечетком поиске (поиск идет в event loop).
+FUZZY_SCAN_LIMIT = 1_000
+
+# Колонки выгрузки GeoNames (geoname table).
+_COL_NAME, _COL_ASCII, _COL_ALT, _COL_LAT, _COL_LON, _COL_CLASS = 1, 2, 3, 4, 5, 6
+_COL_COUNTRY, _COL_POPULATION = 8, 14
+
+_RUSSIAN_LETTERS = frozenset("абвгдеёжзийклмнопрстуфхцчшщъыьэюя")
+
+
+class Gazetteer:
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n_places, self.n_keys, self._places_off, self._keys_off, self._strings_off = (
+            HEADER.unpack_from(self._mm, 0)
+        )
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{self.path}: не индекс справочника городов (magic={magic!r})")
+
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+
+    def close(self) -> None:
+        self._mm.close()
+
+    # --- Поиск ---
+
+    def lookup(self, city: str) -> GeoResult | None:
+        """Только точное совпадение; None — пусть решают SQLite и сеть."""
+        folded = fold_city_name(city)
+        if not folded:
+            return None
+        key = normalize_city(city)
+        result = self.exact(key)
+        if result is None and key != folded:
+            result = self.exact(folded)
+        if result is not None:
+            self.exact_hits += 1
+            return result
+        self.misses += 1
+        return None
+
+    def correct(self, city: str) -> GeoResult | None:
+        """
+        Ближайший город с опечаткой. Вызывается, только когда и сеть не нашла город:
+        иначе настоящий город, которого нет в выгрузке, молча подменялся бы соседним по написанию.
+        """
+        result = self.fuzzy(fold_city_name(city))
+        if result is not None:
+            self.fuzzy_hits += 1
+        return result
+
+    def exact(self, key: str) -> GeoResult | None:
+        raw = key.encode("utf-8")
+        i = self._lower_bound(raw)
+        if i < self.n_keys and self._key_at(i) == raw:
+            # Среди одноименных городов первым лежит самый крупный.
+            return self._place(self._place_idx(i))
+        return None
+
+    def prefix(self, text: str, limit: int = 10) -> list[GeoResult]:
+        """Города, чье название начинается с text (для подсказок), крупные — первыми."""
+        raw = fold_city_name(text).encode("utf-8")
+        if not raw:
+            return []
+        found: dict[int, int] = {}
+        i = self._lower_bound(raw)
+        end = min(self.n_keys, i + PREFIX_SCAN_LIMIT)
+        while i < end and self._key_at(i).startswith(raw):
+            idx = self._place_idx(i)
+            if idx not in found:
+                found[idx] = self._population(idx)
+            i += 1
+        best = sorted(found, key=lambda idx: -found[idx])[:limit]
+        return [self._place(idx) for idx in best]
+
+    def fuzzy(self, key: str, max_dist: int | None = None) -> GeoResult | None:
+        if max_dist is None:
+            # Короткие названия с опечаткой слишком легко спутать с другим городом.
+            max_dist = 0 if len(key) < 5 else 1 if len(key) < 9 else 2
+        if max_dist <= 0 or len(key) <= FUZZY_ANCHOR_LEN:
+            return None
+
+        anchor = key[:FUZZY_ANCHOR_LEN].encode("utf-8")
+        best: tuple[int, int, int] | None = None  # (расстояние, -население, номер места)
+        i = self._lower_bound(anchor)
+        # Частое начало ("са", "ка") дает тысячи ключей: просмотр ограничен.
+        end = min(self.n_keys, i + FUZZY_SCAN_LIMIT)
+        while i < end:
+            raw = self._key_at(i)
+            if not raw.startswith(anchor):
+                break
+            candidate = raw.decode("utf-8")
+            if abs(len(candidate) - len(key)) > max_dist:
+                # Разница длин уже больше допустимого расстояния — Левенштейн не нужен.
+                i += 1
+                continue
+            dist = bounded_levenshtein(key, candidate, max_dist)
+            if dist <= max_dist:
+                idx = self._place_idx(i)
+                rank = (dist, -self._population(idx), idx)
+                if best is None or rank < best:
+                    best = rank
+            i += 1
+        return self._place(best[2]) if best is not None else None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "places": self.n_places,
+            "keys": self.n_keys,
+            "exact_hits": self.exact_hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses,
+        }
+
+    # --- Чтение индекса ---
+
+    def _lower_bound(self, raw: bytes) -> int:
+        return bisect_left(range(self.n_keys), raw, key=self._key_at)
+
+    def _key_at(self, i: int) -> bytes:
+        key_off, _ = KEY.unpack_from(self._mm, self._keys_off + i * KEY.size)
+        return self._string(key_off)
+
+    def _place_idx(self, i: int) -> int:
+        return KEY.unpack_from(self._mm, self._keys_off + i * KEY.size)[1]
+
+    def _population(self, idx: int) -> int:
+        return PLACE.unpack_from(self._mm, self._places_off + idx * PLACE.size)[2]
+
+    def _place(self, idx: int) -> GeoResult:
+        lat, lon, _, name_off, country_off = PLACE.unpack_from(self._mm, self._places_off + idx * PLACE.size)
+        return GeoResult(
+            name=self._string(name_off).decode("utf-8"),
+            # Индекс, собранный до перевода названий стран, хранит код ISO.
+            country=country_name(self._string(country_off).decode("utf-8")),
+            latitude=round(lat, 4),
+            longitude=round(lon, 4),
+        )
+
+    def _string(self, off: int) -> bytes:
+        start = self._strings_off + off
+        (n,) = STRLEN.unpack_from(self._mm, start)
+        return self._mm[start + STRLEN.size : start + STRLEN.size + n]
+
+
+# --- Сборка индекса (офлайн) ---
+
+
+def build_index(src: Path | str, out: Path | str, min_population: int = 0) -> tuple[int, int]:
+    """Собирает индекс из выгрузки GeoNames. Возвращает (число мест, число ключей)."""
+    places: list[tuple[float, float, int, int, int]] = []
+    keys: list[tuple[bytes, int, int]] = []  # (ключ, -население, номер места)
+    strings = _StringTable()
+
+    with open(src, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) <= _COL_POPULATION or cols[_COL_CLASS] != "P":
+                continue
+            population = int(cols[_COL_POPULATION] or 0)
+            if population < min_population:
+                continue
+
+            alt_names = [n for n in cols[_COL_ALT].split(",") if n]
+            idx = len(places)
+            places.append(
+                (
+                    float(cols[_COL_LAT]),
+                    float(cols[_COL_LON]),
+                    min(population, 0xFFFFFFFF),
+                    strings.add(_display_name(cols[_COL_NAME], alt_names)),
+                    strings.add(country_name(cols[_COL_COUNTRY])),
+                )
+            )
+
+            seen: set[str] = set()
+            for name in (cols[_COL_NAME], cols[_COL_ASCII], *alt_names):
+                if not _is_latin_or_cyrillic(name):
+                    continue
+                key = fold_city_name(name)
+                if not key or len(key) > MAX_KEY_LEN or key in seen:
+                    continue
+                seen.add(key)
+                keys.append((key.encode("utf-8"), -population, idx))
+
+    keys.sort()
+    key_records = [(strings.add_bytes(key), idx) for key, _, idx in keys]
+
+    places_off = HEADER.size
+    keys_off = places_off + len(places) * PLACE.size
+    strings_off = keys_off + len(key_records) * KEY.size
+
+    tmp = Path(f"{out}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(places), len(key_records), places_off, keys_off, strings_off))
+        for place in places:
+            f.write(PLACE.pack(*place))
+        for record in key_records:
+            f.write(KEY.pack(*record))
+        f.write(strings.blob())
+    # Подмена целиком: работающий бот не увидит наполовину записанный файл.
+    tmp.replace(out)
+    return len(places), len(key_records)
+
+
+class _StringTable:
+    def __init__(self) -> None:
+        self._offsets: dict[bytes, int] = {}
+        self._chunks: list[bytes] = []
+        self._size = 0
+
+    def add(self, text: str) -> int:
+        return self.add_bytes(text.encode("utf-8")[:0xFFFF])
+
+    def add_bytes(self, raw: bytes) -> int:
+        off = self._offsets.get(raw)
+        if off is None:
+            off = self._size
+            self._offsets[raw] = off
+            self._chunks.append(STRLEN.pack(len(raw)) + raw)
+            self._size += STRLEN.size + len(raw)
+        return off
+
+    def blob(self) -> bytes:
+        return b"".join(self._chunks)
+
+
+def _display_name(name: str, alt_names: list[str]) -> str:
+    # В выгрузке нет языка альтернативных названий; берем первое, написанное
+    # только русскими буквами (как отвечает онлайн-геокодер с language=ru).
+    for alt in alt_names:
+        letters = [ch for ch in alt.lower() if ch.isalpha()]
+        if letters and all(ch in _RUSSIAN_LETTERS for ch in letters):
+            return alt
+    return name
+
+
+def _is_latin_or_cyrillic(name: str) -> bool:
+    for ch in name:
+        if not ch.isalpha():
+            continue
+        code = ord(ch)
+        if code < 0x250 or 0x1E00 <= code < 0x1F00 or 0x400 <= code < 0x530:
+            continue
+        return False
+    return bool(name)
@@ -0,0 +1,149 @@
+"""
+geocache.py
+Кэш геокодинга: LRU в памяти -> офлайн-справочник -> таблица geocode_cache в SQLite -> сеть.
+
+- ключ нормализуется: регистр, лишние пробелы, диакритика ("München" -> "munchen"),
+  плюс таблица синонимов ("Munich", "Мюнхен" -> тот же ключ);
+- координаты городов не меняются, поэтому положительный результат живет долго;
+- "город не найден" тоже кэшируется, но ненадолго (вдруг опечатку исправят в API);
+- SQLite-уровень переживает перезапуск бота: после рестарта сеть не нужна;
+- офлайн-справочник (app/services/gazetteer.py) отвечает на большинство запросов без
+  SQLite и сети (только точные совпадения); его ответы в SQLite не дублируем;
+- опечатку справочник исправляет, только если и сеть город не нашла; такая догадка
+  кэшируется ненадолго, как "не найдено";
+- suggest() — подсказки по началу названия (inline-режим), результаты по префиксу
+  кэшируются: повторные нажатия клавиш не доходят ни до индекса, ни до сети.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any
+
+from app.db_async import Database
+from app.services.city_names import fold_city_name, normalize_city
+from app.services.gazetteer import Gazetteer
+from app.services.http import HttpClients
+from app.services.open_meteo import GeoResult, geocode_city
+from app.utils.cache import MISSING, LRUCache
+
+log = logging.getLogger(__name__)
+
+
+class GeoCache:
+    def __init__(
+        self,
+        db: Database,
+        memory_entries: int = 5_000,
+        ttl_sec: float = 30 * 24 * 3600,
+        negative_ttl_sec: float = 10 * 60,
+        gazetteer: Gazetteer | None = None,
+        suggest_entries: int = 2_000,
+        suggest_ttl_sec: float = 10 * 60,
+    ) -> None:
+        self.db = db
+        self.gazetteer = gazetteer
+        self.ttl_sec = ttl_sec
+        self.negative_ttl_sec = negative_ttl_sec
+        self.memory = LRUCache(max_entries=memory_entries, ttl_sec=ttl_sec)
+        # Префикс -> список городов для подсказок.
+        self.suggestions = LRUCache(max_entries=suggest_entries, ttl_sec=suggest_ttl_sec)
+
+        self.db_hits = 0
+        self.network_lookups = 0
+
+    async def geocode(self, http: HttpClients, city: str) -> GeoResult | None:
+        key = normalize_city(city)
+        if not key:
+            return None
+
+        # 1) Память.
+        cached = self.memory.get(key)
+        if cached is not MISSING:
+            return cached
+
+        # 2) Офлайн-справочник (mmap, без ввода-вывода в сеть).
+        if self.gazetteer is not None:
+            result = self.gazetteer.lookup(city)
+            if result is not None:
+                self.memory.set(key, result)
+                return result
+
+        # 3) SQLite.
+        now = time.time()
+        row = await self.db.get_geocode(key, int(now))
+        if row is not None:
+            self.db_hits += 1
+            result = _row_to_geo(row)
+            self.memory.set(key, result, ttl_sec=max(1.0, row["expires_at"] - now))
+            return result
+
+        # 4) Сеть.
+        self.network_lookups += 1
+        result = await geocode_city(http, city)
+        if result is None and self.gazetteer is not None:
+            # 5) Опечатка: ближайший по написанию город из справочника — догадка, поэтому
+            # живет в кэше не дольше отрицательного результата.
+            result = self.gazetteer.correct(city)
+            if result is not None:
+                await self.put(key, result, ttl_sec=self.negative_ttl_sec)
+                return result
+        await self.put(key, result)
+        return result
+
+    def cached_suggestions(self, text: str) -> list[GeoResult] | object:
+        """Подсказки из кэша без ожидания; MISSING — придется искать."""
+        return self.suggestions.get(fold_city_name(text))
+
+    async def suggest(self, http: HttpClients, text: str, limit: int = 5) -> list[GeoResult]:
+        key = fold_city_name(text)
+        if not key:
+            return []
+        cached = self.suggestions.get(key)
+        if cached is not MISSING:
+            return cached
+
+        results: list[GeoResult] = []
+        if self.gazetteer is not None:
+            results = self.gazetteer.prefix(text, limit=limit)
+        if not results:
+            # Без справочника (или для синонима вроде "спб") — обычный геокодинг, один вариант.
+            geo = await self.geocode(http, text)
+            results = [geo] if geo is not None else []
+        self.suggestions.set(key, results)
+        return results
+
+    async def put(self, key: str, result: GeoResult | None, ttl_sec: float | None = None) -> None:
+        ttl = ttl_sec if ttl_sec is not None else self.ttl_sec if result is not None else self.negative_ttl_sec
+        self.memory.set(key, result, ttl_sec=ttl)
+        try:
+            await self.db.put_geocode(
+                key,
+                result.name if result else None,
+                result.country if result else None,
+                result.latitude if result else None,
+                result.longitude if result else None,
+                int(time.time() + ttl),
+            )
+        except Exception:
+            # Кэш — оптимизация: ошибка записи не должна ломать ответ пользователю.
+            log.exception("Не удалось сохранить геокодинг в SQLite (key=%r)", key)
+
+    def stats(self) -> dict[str, Any]:
+        result = {**self.memory.stats(), "db_hits": self.db_hits, "network_lookups": self.network_lookups}
+        result.update({f"suggest_{k}": v for k, v in self.suggestions.stats().items()})
+        if self.gazetteer is not None:
+            result.update({f"gazetteer_{k}": v for k, v in self.gazetteer.stats().items()})
+        return result
+
+
+def _row_to_geo(row: dict[str, Any]) -> GeoResult | None:
+    if row["name"] is None:
+        return None
+    return GeoResult(
+        name=str(row["name"]),
+        country=str(row["country"] or ""),
+        latitude=float(row["latitude"]),
+        longitude=float(row["longitude"]),
+    )
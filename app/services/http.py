@@ -0,0 +1,156 @@
+"""
+http.py
+Общие HTTP-клиенты приложения (httpx.AsyncClient) с keep-alive.
+
+- один клиент на хост: у каждого свой пул соединений и свои лимиты;
+- соединения переиспользуются между командами: DNS/TCP/TLS — один раз, а не на каждый /weather;
+- HTTP/2 включается настройкой (нужен пакет h2; без него — HTTP/1.1 с предупреждением в лог).
+
+HttpClients.get() добавляет устойчивость (см. app/services/resilience.py):
+- раздельные таймауты на соединение и чтение + общий дедлайн вызова (с учетом повторов);
+- глобальный лимит одновременных исходящих запросов;
+- ограниченные повторы с джиттером для временных ошибок (сеть, 5xx, 429);
+- автомат (circuit breaker) на каждый хост: при недоступности отвечаем сразу, без ожидания.
+
+Создаются в post_init, закрываются в post_shutdown (bot.py).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import logging
+from typing import Any, Optional
+
+import httpx
+
+from app.services.resilience import CircuitBreaker, CircuitOpenError, backoff_delay
+
+log = logging.getLogger(__name__)
+
+
+class HttpClients:
+    def __init__(
+        self,
+        timeout_sec: float = 6.0,
+        http2: bool = False,
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        keepalive_expiry_sec: float = 30.0,
+        per_host_connections: Optional[dict[str, int]] = None,
+        connect_timeout_sec: float = 2.0,
+        read_timeout_sec: float = 4.0,
+        max_concurrency: int = 32,
+        retries: int = 2,
+        breaker_failures: int = 5,
+        breaker_reset_sec: float = 30.0,
+    ) -> None:
+        # timeout_sec — общий дедлайн одного вызова get() вместе с повторами.
+        self.deadline_sec = timeout_sec
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout_sec,
+            read=read_timeout_sec,
+            write=read_timeout_sec,
+            pool=connect_timeout_sec,
+        )
+        self.http2 = http2 and _h2_available()
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry_sec = keepalive_expiry_sec
+        self.per_host_connections = dict(per_host_connections or {})
+
+        self._clients: dict[str, httpx.AsyncClient] = {}
+
+        self.retries = max(0, retries)
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_sec = breaker_reset_sec
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._limit = asyncio.Semaphore(max(1, max_concurrency))
+
+        self.retried = 0
+        self.deadline_exceeded = 0
+
+    def for_host(self, host: str) -> httpx.AsyncClient:
+        client = self._clients.get(host)
+        if client is None:
+            limit = self.per_host_connections.get(host, self.max_connections)
+            client = httpx.AsyncClient(
+                base_url=f"https://{host}",
+                timeout=self.timeout,
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=limit,
+                    max_keepalive_connections=min(limit, self.max_keepalive),
+                    keepalive_expiry=self.keepalive_expiry_sec,
+                ),
+            )
+            self._clients[host] = client
+        return client
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(self.breaker_failures, self.breaker_reset_sec)
+            self._breakers[host] = breaker
+        return breaker
+
+    async def get(self, host: str, path: str, params: Optional[dict[str, Any]] = None) -> httpx.Response:
+        """
+        GET с устойчивостью. Ответы 4xx возвращаются как есть (raise_for_status — у вызывающего).
+        Ошибки: CircuitOpenError (хост отключен автоматом), httpx.HTTPError (сеть/5xx/дедлайн).
+        """
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            raise CircuitOpenError(host, breaker.retry_after())
+        try:
+            return await asyncio.wait_for(self._get_with_retries(host, path, params, breaker), self.deadline_sec)
+        except asyncio.TimeoutError:
+            self.deadline_exceeded += 1
+            breaker.record_failure()
+            raise httpx.TimeoutException(f"deadline {self.deadline_sec}s exceeded for {host}{path}") from None
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+
+    async def _get_with_retries(
+        self, host: str, path: str, params: Optional[dict[str, Any]], breaker: CircuitBreaker
+    ) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                async with self._limit:
+                    r = await self.for_host(host).get(path, params=params)
+                if r.status_code >= 500 or r.status_code == 429:
+                    r.raise_for_status()
+            except (httpx.TransportError, httpx.HTTPStatusError):
+                breaker.record_failure()
+                if attempt >= self.retries:
+                    raise
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+                self.retried += 1
+                # Пока спали, автомат мог разомкнуться из-за чужих ошибок.
+                if not breaker.allow():
+                    raise CircuitOpenError(host, breaker.retry_after()) from None
+                continue
+            breaker.record_success()
+            return r
+
+    def stats(self) -> dict[str, Any]:
+        result: dict[str, Any] = {"retried": self.retried, "deadline_exceeded": self.deadline_exceeded}
+        for host, breaker in self._breakers.items():
+            for key, value in breaker.stats().items():
+                result[f"{host}.{key}"] = value
+        return result
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+def _h2_available() -> bool:
+    if importlib.util.find_spec("h2") is None:
+        log.warning("HTTP/2 запрошен, но пакет h2 не установлен (pip install httpx[http2]); используем HTTP/1.1")
+        return False
+    return True
@@ -0,0 +1,183 @@
+"""
+leaderboard.py
+Таблицы лидеров викторины: общая и по каждой теме (/top [тема]).
+
+Рейтинг: больше верных ответов — выше; при равенстве выше тот, кто ответил на меньшее
+число вопросов (точнее). Так учитываются и объем, и точность: 40 из 50 выше, чем 30 из 30.
+
+- лучшие top_size берутся из SQLite проходом по покрывающему индексу рейтинга с LIMIT
+  (idx_quiz_stats_rank / idx_quiz_topic_stats_rank) и кэшируются в памяти; снимок
+  сбрасывается, когда запись может его изменить, и живет не дольше top_ttl_sec;
+- место игрока — бинарный поиск O(log n) в отсортированном массиве счетов таблицы
+  (array по 8 байт на игрока + словарь user_id -> счет). Таблица читается из БД при
+  первом запросе — одной выборкой по тому же индексу, уже в порядке рейтинга, — и дальше
+  поддерживается изменениями из upsert_quiz_stats (Database.on_quiz_scores), без пересчета.
+
+С буфером статистики (QUIZ_STATS_FLUSH_SEC) таблицы обновляются при его сбросе.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from array import array
+from bisect import bisect_left, insort
+from typing import Any, Optional
+
+from app.db import QuizScoreChange
+from app.db_async import Database
+from app.utils.cache import LRUCache
+
+_QUESTIONS_MASK = (1 << 32) - 1
+
+
+def score_key(correct: int, questions: int) -> int:
+    # Меньше — лучше: по возрастанию ключа идет порядок рейтинга.
+    return -(correct << 32) + min(questions, _QUESTIONS_MASK)
+
+
+class _Board:
+    __slots__ = ("keys", "scores")
+
+    def __init__(self, rows: list[tuple[int, int, int]]) -> None:
+        # rows уже в порядке рейтинга (quiz_board_q) — сортировать не нужно.
+        self.keys = array("q", (score_key(correct, questions) for _, correct, questions in rows))
+        self.scores = {user_id: score_key(correct, questions) for user_id, correct, questions in rows}
+
+    def set(self, user_id: int, correct: int, questions: int) -> None:
+        new = score_key(correct, questions)
+        old = self.scores.get(user_id)
+        if old is not None:
+            # Счет только растет: меньше вопросов, чем уже учтено, — устаревшее изменение.
+            if old == new or questions < old & _QUESTIONS_MASK:
+                return
+            # Любой из равных ключей подходит: игроки с одинаковым счетом делят место.
+            del self.keys[bisect_left(self.keys, old)]
+        insort(self.keys, new)
+        self.scores[user_id] = new
+
+    def rank(self, user_id: int) -> Optional[int]:
+        key = self.scores.get(user_id)
+        return None if key is None else bisect_left(self.keys, key) + 1
+
+
+class Leaderboard:
+    def __init__(
+        self,
+        db: Database,
+        top_size: int = 10,
+        top_ttl_sec: float = 30.0,
+        names_cache_entries: int = 10_000,
+    ) -> None:
+        self.db = db
+        self.top_size = max(1, top_size)
+        self.top_ttl_sec = top_ttl_sec
+
+        # тема (None — общая) -> таблица; грузится при первом запросе места
+        self._boards: dict[Optional[str], _Board] = {}
+        self._loading: dict[Optional[str], asyncio.Task[_Board]] = {}
+        # Изменения, пришедшие, пока таблица темы читается из БД.
+        self._missed: dict[Optional[str], list[QuizScoreChange]] = {}
+        # тема -> (истекает, лучшие игроки)
+        self._top: dict[Optional[str], tuple[float, list[dict[str, Any]]]] = {}
+        # Счетчик записей по теме: снимок, прочитанный во время записи, не кэшируем.
+        self._writes: dict[Optional[str], int] = {}
+        # Имена, уже записанные в quiz_players.
+        self._names = LRUCache(max_entries=names_cache_entries, ttl_sec=float("inf"))
+
+        self.board_loads = 0
+        self.score_updates = 0
+        self.top_queries = 0
+        self.top_refreshes = 0
+        self.rank_queries = 0
+
+    def apply(self, changes: list[QuizScoreChange]) -> None:
+        """Новый счет игроков после записи в БД (Database.on_quiz_scores)."""
+        for change in changes:
+            topic, user_id, correct, questions = change
+            self.score_updates += 1
+            self._writes[topic] = self._writes.get(topic, 0) + 1
+            board = self._boards.get(topic)
+            if board is not None:
+                board.set(user_id, correct, questions)
+            elif topic in self._missed:
+                self._missed[topic].append(change)
+            self._invalidate_top(topic, user_id, score_key(correct, questions))
+
+    def _invalidate_top(self, topic: Optional[str], user_id: int, key: int) -> None:
+        cached = self._top.get(topic)
+        if cached is None:
+            return
+        rows = cached[1]
+        # Снимок не меняется, только если игрок не в нем и не дотягивает до последнего места.
+        if (
+            len(rows) < self.top_size
+            or any(row["user_id"] == user_id for row in rows)
+            or key <= score_key(rows[-1]["correct"], rows[-1]["questions"])
+        ):
+            del self._top[topic]
+
+    async def top(self, topic: Optional[str]) -> list[dict[str, Any]]:
+        """Лучшие игроки: user_id, correct, questions, name (None — имя неизвестно)."""
+        self.top_queries += 1
+        cached = self._top.get(topic)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        writes = self._writes.get(topic, 0)
+        rows = await self.db.quiz_top(topic, self.top_size)
+        self.top_refreshes += 1
+        if self._writes.get(topic, 0) == writes:
+            self._top[topic] = (time.monotonic() + self.top_ttl_sec, rows)
+        return rows
+
+    async def rank(self, topic: Optional[str], user_id: int) -> Optional[tuple[int, int]]:
+        """(место, всего игроков) или None, если игрок в этой таблице еще не появлялся."""
+        self.rank_queries += 1
+        board = await self._board(topic)
+        place = board.rank(user_id)
+        return None if place is None else (place, len(board.keys))
+
+    async def remember_name(self, user_id: int, name: str) -> None:
+        name = name.strip()[:64]
+        if not name or self._names.get(user_id) == name:
+            return
+        await self.db.put_quiz_player(user_id, name)
+        self._names.set(user_id, name)
+
+    async def _board(self, topic: Optional[str]) -> _Board:
+        board = self._boards.get(topic)
+        if board is not None:
+            return board
+        # Одна загрузка таблицы на всех, кто пришел за ней одновременно.
+        task = self._loading.get(topic)
+        if task is None:
+            self._missed[topic] = []
+            task = asyncio.create_task(self._load(topic))
+            self._loading[topic] = task
+            task.add_done_callback(lambda _: self._loading.pop(topic, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, topic: Optional[str]) -> _Board:
+        try:
+            rows = await self.db.quiz_board(topic)
+        finally:
+            missed = self._missed.pop(topic, [])
+        board = _Board(rows)
+        # Записи, закоммиченные во время чтения: set() пропустит уже учтенные.
+        for _, user_id, correct, questions in missed:
+            board.set(user_id, correct, questions)
+        self._boards[topic] = board
+        self.board_loads += 1
+        return board
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "boards_loaded": len(self._boards),
+            "board_players": sum(len(board.keys) for board in self._boards.values()),
+            "top_cached": len(self._top),
+            "board_loads": self.board_loads,
+            "score_updates": self.score_updates,
+            "top_queries": self.top_queries,
+            "top_refreshes": self.top_refreshes,
+            "rank_queries": self.rank_queries,
+        }
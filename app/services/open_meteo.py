@@ -8,13 +8,23 @@ open_meteo.py
 - Бесплатно, без ключа
 - Простое API
 
-HTTP-клиент: httpx (async).
+HTTP-клиент: httpx (async), общий для всего приложения (app/services/http.py):
+у геокодинга и прогноза разные хосты, у каждого свой пул keep-alive соединений.
+
+Прогноз умеет несколько точек в одном запросе (latitude/longitude списком через запятую):
+ForecastBatcher копит запросы разных точек коротким окном и отправляет их одним вызовом.
 """
 
 from __future__ import annotations
 
+import asyncio
 from dataclasses import dataclass
-import httpx
+from typing import Any, Optional
+
+from app.services.http import HttpClients
+
+GEOCODING_HOST = "geocoding-api.open-meteo.com"
+FORECAST_HOST = "api.open-meteo.com"
 
 
 @dataclass(frozen=True)
@@ -55,15 +65,14 @@ WEATHER_CODE_HINTS: dict[int, str] = {
 }
 
 
-async def geocode_city(client: httpx.AsyncClient, city: str) -> GeoResult | None:
+async def geocode_city(http: HttpClients, city: str) -> GeoResult | None:
     city = city.strip()
     if not city:
         return None
 
-    url = "https://geocoding-api.open-meteo.com/v1/search"
     params = {"name": city, "count": 1, "language": "ru", "format": "json"}
 
-    r = await client.get(url, params=params)
+    r = await http.get(GEOCODING_HOST, "/v1/search", params=params)
     r.raise_for_status()
     data = r.json()
 
@@ -80,20 +89,32 @@ async def geocode_city(client: httpx.AsyncClient, city: str) -> GeoResult | None
     )
 
 
-async def get_weather_now(client: httpx.AsyncClient, lat: float, lon: float) -> WeatherNow:
-    url = "https://api.open-meteo.com/v1/forecast"
+async def get_weather_now(http: HttpClients, lat: float, lon: float) -> WeatherNow:
+    return (await get_weather_many(http, [(lat, lon)]))[0]
+
+
+async def get_weather_many(http: HttpClients, points: list[tuple[float, float]]) -> list[WeatherNow]:
+    """Текущая погода для нескольких точек одним запросом (порядок ответа = порядок points)."""
     params = {
-        "latitude": lat,
-        "longitude": lon,
+        "latitude": ",".join(f"{lat:.4f}" for lat, _ in points),
+        "longitude": ",".join(f"{lon:.4f}" for _, lon in points),
         "current_weather": "true",
         "wind_speed_unit": "kmh",
         "temperature_unit": "celsius",
     }
 
-    r = await client.get(url, params=params)
+    r = await http.get(FORECAST_HOST, "/v1/forecast", params=params)
     r.raise_for_status()
     data = r.json()
 
+    # Для одной точки API отвечает объектом, для нескольких — списком объектов.
+    items = data if isinstance(data, list) else [data]
+    if len(items) != len(points):
+        raise ValueError(f"Open-Meteo вернул {len(items)} точек вместо {len(points)}")
+    return [_parse_current_weather(item) for item in items]
+
+
+def _parse_current_weather(data: dict[str, Any]) -> WeatherNow:
     cw = data.get("current_weather") or {}
     return WeatherNow(
         temperature_c=float(cw.get("temperature", 0.0)),
@@ -102,6 +123,88 @@ async def get_weather_now(client: httpx.AsyncClient, lat: float, lon: float) ->
     )
 
 
+class ForecastBatcher:
+    """
+    Микро-батчинг запросов прогноза:
+    - get(lat, lon) ставит точку в очередь и ждет свой результат;
+    - через window_ms после первой точки (или сразу при max_points) уходит один
+      запрос на все накопленные точки, ответ раздается ожидающим;
+    - одинаковые точки в пачке запрашиваются один раз.
+    """
+
+    def __init__(self, http: HttpClients, window_ms: float = 30.0, max_points: int = 50) -> None:
+        self.http = http
+        self.window = window_ms / 1000.0
+        self.max_points = max(1, max_points)
+
+        self._pending: dict[tuple[float, float], list[asyncio.Future[WeatherNow]]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task[None]] = set()
+
+        self.requests = 0
+        self.points = 0
+        self.callers = 0
+
+    async def get(self, lat: float, lon: float) -> WeatherNow:
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future[WeatherNow] = loop.create_future()
+        self._pending.setdefault((round(lat, 4), round(lon, 4)), []).append(fut)
+        self.callers += 1
+
+        if len(self._pending) >= self.max_points:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: dict[tuple[float, float], list[asyncio.Future[WeatherNow]]]) -> None:
+        points = list(batch)
+        self.requests += 1
+        self.points += len(points)
+        try:
+            results = await get_weather_many(self.http, points)
+        except Exception as e:
+            for futures in batch.values():
+                for fut in futures:
+                    if not fut.done():
+                        fut.set_exception(e)
+            return
+
+        for point, weather in zip(points, results):
+            for fut in batch[point]:
+                if not fut.done():
+                    fut.set_result(weather)
+
+    async def aclose(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for futures in self._pending.values():
+            for fut in futures:
+                fut.cancel()
+        self._pending = {}
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "points": self.points,
+            "callers": self.callers,
+            "avg_points_per_request": round(self.points / self.requests, 2) if self.requests else 0.0,
+        }
+
+
 def describe_weather_code(code: int) -> str:
     return WEATHER_CODE_HINTS.get(code, f"Код погоды: {code}")
 
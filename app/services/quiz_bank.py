@@ -6,12 +6,41 @@ quiz_bank.py
 - Пользователь пишет /quiz <тема>
 - Бот выбирает случайные вопросы по теме и задает их подряд
 - Ответы проверяются (с небольшой нормализацией)
+
+Вопросы лежат в SQLite (таблица quiz_questions), QUIZ_BANK ниже — только начальное
+наполнение пустой базы; большие банки загружаются командой
+python -m app.maintenance quiz-import <файл.tsv>. QuizBank читает банк лениво:
+- при старте — только список тем и число вопросов в них;
+- при первом обращении к теме — только id ее вопросов (array, 4 байта на вопрос);
+- вопросы — точечно по id, с LRU-кэшем скомпилированных CompiledQuestion;
+- выбор k вопросов — O(k) случайных индексов, без копирования и перемешивания темы;
+- уже виденные пользователем вопросы отсекаются фильтром RecentIds (app/utils/bloom.py);
+- reload() сбрасывает все загруженное — новые вопросы подхватываются без перезапуска (/quizreload).
+
+CompiledQuestion неизменяем: допустимые ответы уже нормализованы и лежат во frozenset,
+так что точная проверка ответа — одна нормализация ввода и один поиск в хэше.
+Нечеткий режим (QUIZ_FUZZY) прощает опечатки: расстояние Левенштейна с порогом
+считается только до заранее подготовленных форм, где опечатка допустима
+(числа и короткие ответы — только точно).
 """
 
 from __future__ import annotations
 
+import asyncio
 import random
+from array import array
 from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from app.db import count_quiz_questions, import_quiz_questions
+from app.db_async import Database
+from app.utils.bloom import RecentIds
+from app.utils.cache import MISSING, LRUCache
+from app.utils.text import bounded_levenshtein
+
+# Сколько случайных попыток на один вопрос, прежде чем разрешить уже виденные.
+_PICK_ATTEMPTS = 8
 
 
 @dataclass(frozen=True)
@@ -20,6 +49,17 @@ class QuizQuestion:
     answers: set[str]  # набор допустимых ответов (в нижнем регистре)
 
 
+@dataclass(frozen=True, slots=True)
+class CompiledQuestion:
+    qid: int
+    topic: str
+    question: str
+    display: str  # ответ для кнопки и подсказки
+    answers: frozenset[str]  # нормализованные допустимые ответы
+    typo_forms: tuple[tuple[str, int], ...]  # (нормализованный ответ, сколько опечаток простить)
+
+
+# Начальное наполнение пустой таблицы quiz_questions.
 QUIZ_BANK: dict[str, list[QuizQuestion]] = {
     "python": [
         QuizQuestion("Как называется структура данных {1, 2, 3} в Python?", {"set", "множество"}),
@@ -49,23 +89,215 @@ def normalize(s: str) -> str:
     return "".join(ch for ch in s.strip().lower() if ch.isalnum() or ch in {"*", "^"})
 
 
-def available_topics() -> list[str]:
-    return sorted(QUIZ_BANK.keys())
+def typo_budget(form: str) -> int:
+    # Числа и короткие ответы ("def", "56") — только точно: одна замена меняет смысл.
+    if any(ch.isdigit() for ch in form) or len(form) < 5:
+        return 0
+    return 1 if len(form) < 9 else 2
 
 
-def pick_questions(topic: str, count: int = 3) -> list[QuizQuestion]:
-    key = topic.strip().lower()
-    if key not in QUIZ_BANK:
-        return []
-    questions = QUIZ_BANK[key][:]
-    random.shuffle(questions)
-    return questions[: max(1, min(count, len(questions)))]
+def compile_question(qid: int, topic: str, question: str, answers: Iterable[str]) -> CompiledQuestion:
+    raw = [a.strip() for a in answers if a.strip()]
+    forms = frozenset(filter(None, (normalize(a) for a in raw)))
+    typo_forms = tuple(sorted((form, typo_budget(form)) for form in forms if typo_budget(form) > 0))
+    # Короткий вариант из допустимых — для кнопки и подсказки; сортировка — чтобы не зависеть
+    # от порядка ответов.
+    display = min(raw, key=lambda a: (len(a), a)) if raw else "—"
+    return CompiledQuestion(qid, topic, question, display, forms, typo_forms)
 
 
-def check_answer(q: QuizQuestion, user_answer: str) -> bool:
+def match_answer(q: CompiledQuestion, user_answer: str, fuzzy: bool = False) -> Optional[int]:
+    """0 — точное совпадение, 1..2 — засчитано с таким числом опечаток (fuzzy), None — неверно."""
     ua = normalize(user_answer)
-    for a in q.answers:
-        if ua == normalize(a):
-            return True
-    return False
+    if ua in q.answers:
+        return 0
+    if not fuzzy:
+        return None
+    best: Optional[int] = None
+    for form, budget in q.typo_forms:
+        dist = bounded_levenshtein(ua, form, budget)
+        if dist <= budget and (best is None or dist < best):
+            best = dist
+    return best
+
+
+def check_answer(q: CompiledQuestion, user_answer: str, fuzzy: bool = False) -> bool:
+    return match_answer(q, user_answer, fuzzy) is not None
+
+
+class QuizBank:
+    def __init__(self, db: Database, question_cache_entries: int = 5_000) -> None:
+        self.db = db
+        self._topics: dict[str, int] = {}
+        # тема -> id ее вопросов; грузится при первом обращении к теме
+        self._topic_ids: dict[str, array] = {}
+        self._loading: dict[str, asyncio.Task[array]] = {}
+        # Вопросы не меняются между reload(), поэтому срок жизни в кэше не ограничиваем.
+        self._questions = LRUCache(max_entries=question_cache_entries, ttl_sec=float("inf"))
+        self.version = 0
+
+        self.topic_loads = 0
+        self.picked = 0
+        self.seen_skipped = 0
+        self.seen_fallbacks = 0
+
+    async def reload(self) -> None:
+        """Сбрасывает загруженное и перечитывает список тем (после quiz-import)."""
+        self._topic_ids.clear()
+        self._questions.clear()
+        self._topics = dict(await self.db.quiz_topics())
+        self.version += 1
+
+    def available_topics(self) -> list[str]:
+        return sorted(self._topics)
+
+    async def get(self, qid: int) -> Optional[CompiledQuestion]:
+        return (await self.get_many([qid])).get(qid)
+
+    async def get_many(self, ids: list[int]) -> dict[int, CompiledQuestion]:
+        found: dict[int, CompiledQuestion] = {}
+        missing = []
+        for qid in ids:
+            q = self._questions.get(qid)
+            if q is MISSING:
+                missing.append(qid)
+            else:
+                found[qid] = q
+        if missing:
+            for row in await self.db.quiz_questions(missing):
+                q = compile_question(row["id"], row["topic"], row["question"], row["answers"].split("\n"))
+                self._questions.set(q.qid, q)
+                found[q.qid] = q
+        return found
+
+    async def pick(self, topic: str, count: int = 3, seen: Optional[RecentIds] = None) -> list[CompiledQuestion]:
+        """
+        count случайных вопросов темы (или меньше, если тема меньше). Вопросы из seen
+        пропускаются, пока хватает других; если тема почти вся просмотрена — берутся и они.
+        """
+        ids = await self._ids(topic.strip().lower())
+        n = len(ids)
+        if not n:
+            return []
+        count = max(1, min(count, n))
+        chosen: list[int] = []
+        taken: set[int] = set()
+        attempts = _PICK_ATTEMPTS * count
+        while len(chosen) < count and attempts > 0:
+            attempts -= 1
+            i = random.randrange(n)
+            if i in taken:
+                continue
+            taken.add(i)
+            if seen is not None and ids[i] in seen:
+                self.seen_skipped += 1
+                continue
+            chosen.append(ids[i])
+        if len(chosen) < count:
+            # Непросмотренных не нашлось: добираем любыми, без повторов внутри викторины.
+            self.seen_fallbacks += 1
+            picked = set(chosen)
+            for i in random.sample(range(n), min(n, 4 * count)):
+                if len(chosen) == count:
+                    break
+                if ids[i] not in picked:
+                    picked.add(ids[i])
+                    chosen.append(ids[i])
+        questions = await self.get_many(chosen)
+        self.picked += len(chosen)
+        return [questions[qid] for qid in chosen if qid in questions]
+
+    async def option_ids(self, q: CompiledQuestion, count: int = 4) -> list[int]:
+        """
+        Варианты для кнопок — id вопросов, чьи ответы показываются: сам вопрос (правильный
+        ответ) и другие вопросы той же темы в роли неправильных, в случайном порядке.
+        """
+        ids = await self._ids(q.topic)
+        # С запасом: среди взятых может оказаться сам вопрос или совпадающие ответы.
+        sample = [ids[i] for i in random.sample(range(len(ids)), min(len(ids), 2 * count))]
+        others = await self.get_many(sample)
+        wrong: list[int] = []
+        shown: set[str] = set()
+        for qid in sample:
+            other = others.get(qid)
+            if len(wrong) == count - 1:
+                break
+            if other is None or normalize(other.display) in q.answers or other.display in shown:
+                continue
+            wrong.append(qid)
+            shown.add(other.display)
+        options = wrong + [q.qid]
+        random.shuffle(options)
+        return options
+
+    async def _ids(self, topic: str) -> array:
+        ids = self._topic_ids.get(topic)
+        if ids is not None:
+            return ids
+        if topic not in self._topics:
+            return array("I")
+        # Одна загрузка темы на всех, кто пришел за ней одновременно.
+        task = self._loading.get(topic)
+        if task is None:
+            task = asyncio.create_task(self._load_topic(topic, self.version))
+            self._loading[topic] = task
+            task.add_done_callback(lambda _: self._loading.pop(topic, None))
+        return await asyncio.shield(task)
+
+    async def _load_topic(self, topic: str, version: int) -> array:
+        ids = array("I", await self.db.quiz_topic_ids(topic))
+        self.topic_loads += 1
+        # Если во время загрузки случился reload(), результат мог устареть — не кэшируем.
+        if version == self.version:
+            self._topic_ids[topic] = ids
+        return ids
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "topics": len(self._topics),
+            "questions": sum(self._topics.values()),
+            "topics_loaded": len(self._topic_ids),
+            "topic_ids_bytes": sum(ids.itemsize * len(ids) for ids in self._topic_ids.values()),
+            "topic_loads": self.topic_loads,
+            "picked": self.picked,
+            "seen_skipped": self.seen_skipped,
+            "seen_fallbacks": self.seen_fallbacks,
+            **{f"cache_{k}": v for k, v in self._questions.stats().items()},
+        }
+
+
+def builtin_rows() -> list[tuple[str, str, str]]:
+    return [
+        (topic, q.question, "\n".join(sorted(q.answers)))
+        for topic, questions in QUIZ_BANK.items()
+        for q in questions
+    ]
+
+
+def seed_quiz_bank(db_path: Path) -> int:
+    """Заполняет пустой банк встроенными вопросами; возвращает число добавленных."""
+    if count_quiz_questions(db_path):
+        return 0
+    return import_quiz_questions(db_path, builtin_rows())
+
 
+def read_quiz_tsv(path: Path | str) -> list[tuple[str, str, str]]:
+    """
+    Файл для quiz-import: строка = "тема<TAB>вопрос<TAB>ответ1|ответ2|...".
+    Пустые строки и строки с # в начале пропускаются.
+    """
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, start=1):
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            parts = line.split("\t")
+            if len(parts) != 3:
+                raise ValueError(f"{path}:{lineno}: ожидалось 3 поля через TAB, получено {len(parts)}")
+            topic, question, answers = (p.strip() for p in parts)
+            accepted = [a.strip() for a in answers.split("|") if a.strip()]
+            if not topic or not question or not accepted:
+                raise ValueError(f"{path}:{lineno}: пустая тема, вопрос или ответы")
+            rows.append((topic.lower(), question, "\n".join(accepted)))
+    return rows
@@ -0,0 +1,152 @@
+"""
+quiz_sessions.py
+Сессии викторины: компактное состояние одной викторины и реестр активных сессий.
+
+QuizSession лежит в user_data["quiz"] (одно значение вместо россыпи ключей) и хранит
+только id вопросов из банка — текст и ответы берутся из QuizBank по id. __slots__:
+без словаря атрибутов на каждый объект: сам объект — 80 байт, плюс списки id.
+
+QuizSessionRegistry — индекс активных сессий по user_id в порядке последней активности:
+- evict_idle() (периодическая задача JobQueue) убирает сессии, брошенные дольше
+  idle_timeout_sec: проход идет от самых старых и останавливается на первой свежей;
+- число одновременных сессий ограничено max_sessions: новая вытесняет самую давнюю;
+- сессии, которых нет в индексе (например, восстановленные из persistence после
+  перезапуска), подхватываются при первом обращении — с той же проверкой простоя
+  и тем же ограничением max_sessions;
+- вытеснение из задачи JobQueue не затрагивает апдейт пользователя, и PTB не отдает
+  его user_data в persistence: об этом сообщает on_evict(user_id, user_data), иначе
+  сохраненная сессия вернулась бы после перезапуска.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Mapping, Optional
+
+SESSION_KEY = "quiz"
+
+
+class QuizSession:
+    __slots__ = ("topic", "question_ids", "option_ids", "index", "score", "last_active")
+
+    def __init__(self, topic: str, question_ids: list[int], option_ids: list[list[int]]) -> None:
+        self.topic = topic
+        self.question_ids = question_ids
+        # Для каждого вопроса — id вопросов, чьи ответы показаны на кнопках.
+        self.option_ids = option_ids
+        self.index = 0
+        self.score = 0
+        self.last_active = time.time()
+
+    @property
+    def total(self) -> int:
+        return len(self.question_ids)
+
+    @property
+    def done(self) -> bool:
+        return self.index >= len(self.question_ids)
+
+    @property
+    def current_id(self) -> int:
+        return self.question_ids[self.index]
+
+    @property
+    def current_options(self) -> list[int]:
+        return self.option_ids[self.index]
+
+    def advance(self, correct: bool) -> None:
+        if correct:
+            self.score += 1
+        self.index += 1
+
+
+class QuizSessionRegistry:
+    def __init__(
+        self,
+        user_data: Mapping[int, dict[Any, Any]],
+        idle_timeout_sec: float = 15 * 60,
+        max_sessions: int = 10_000,
+    ) -> None:
+        # application.user_data: чтобы при вытеснении убрать сессию у ее владельца.
+        self._user_data = user_data
+        self.idle_timeout_sec = idle_timeout_sec
+        self.max_sessions = max(1, max_sessions)
+        # user_id -> сессия; от давно неактивных к недавним
+        self._sessions: OrderedDict[int, QuizSession] = OrderedDict()
+        # Вызывается с user_data, из которого убрана вытесненная сессия (bot.py: persistence).
+        self.on_evict: Optional[Callable[[int, dict[Any, Any]], None]] = None
+
+        self.started = 0
+        self.finished = 0
+        self.evicted_idle = 0
+        self.evicted_cap = 0
+
+    def start(self, user_id: int, user_data: dict[Any, Any], session: QuizSession) -> None:
+        # Незаконченная викторина этого пользователя заменяется новой.
+        self._sessions.pop(user_id, None)
+        self._make_room()
+        user_data[SESSION_KEY] = session
+        self._sessions[user_id] = session
+        self.started += 1
+
+    def get(self, user_id: int, user_data: dict[Any, Any]) -> Optional[QuizSession]:
+        """Сессия пользователя (и отметка активности) или None."""
+        session = user_data.get(SESSION_KEY)
+        if not isinstance(session, QuizSession):
+            return None
+        if time.time() - session.last_active > self.idle_timeout_sec:
+            # Задача вытеснения до нее еще не дошла, но сессия уже просрочена.
+            self._sessions.pop(user_id, None)
+            self._drop(user_id, session)
+            self.evicted_idle += 1
+            return None
+        session.last_active = time.time()
+        if user_id in self._sessions:
+            self._sessions.move_to_end(user_id)
+        else:
+            self._make_room()
+            self._sessions[user_id] = session
+        return session
+
+    def finish(self, user_id: int, user_data: dict[Any, Any]) -> None:
+        if user_data.pop(SESSION_KEY, None) is not None:
+            self.finished += 1
+        self._sessions.pop(user_id, None)
+
+    def evict_idle(self) -> int:
+        deadline = time.time() - self.idle_timeout_sec
+        evicted = 0
+        while self._sessions:
+            user_id, session = next(iter(self._sessions.items()))
+            if session.last_active > deadline:
+                break
+            del self._sessions[user_id]
+            self._drop(user_id, session)
+            evicted += 1
+        self.evicted_idle += evicted
+        return evicted
+
+    def _make_room(self) -> None:
+        while len(self._sessions) >= self.max_sessions:
+            old_user, old = self._sessions.popitem(last=False)
+            self._drop(old_user, old)
+            self.evicted_cap += 1
+
+    def _drop(self, user_id: int, session: QuizSession) -> None:
+        # .get, а не [] — user_data приложения создает словарь при обращении к новому ключу.
+        user_data = self._user_data.get(user_id)
+        if user_data is not None and user_data.get(SESSION_KEY) is session:
+            del user_data[SESSION_KEY]
+            if self.on_evict is not None:
+                self.on_evict(user_id, user_data)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "active": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "started": self.started,
+            "finished": self.finished,
+            "evicted_idle": self.evicted_idle,
+            "evicted_cap": self.evicted_cap,
+        }
@@ -0,0 +1,275 @@
+"""
+reminders.py
+Напоминания о заметках (/note remind <id> <когда>).
+
+Вместо задачи JobQueue на каждое напоминание — один планировщик поверх таблицы reminders:
+- в памяти (куча по due_at) лежит только ближайшее окно времени, slice_sec вперед;
+- окно дочитывается порциями по курсору (due_at, id) через индекс idx_reminders_due,
+  когда до его конца остается меньше половины; размер кучи ограничен max_loaded;
+- сработавшие напоминания отправляются пачками и одной транзакцией удаляются из БД
+  (после отправки: при сбое напоминание придет повторно, но не потеряется); удаляются
+  только доставленные и те, что доставить нельзя (бот заблокирован, заметка удалена);
+  временные сбои (сеть, таймаут, RetryAfter) возвращаются в кучу с растущей паузой;
+- после простоя первое окно начинается "с минус бесконечности": все просроченные
+  напоминания находятся тем же диапазонным запросом по индексу, без сканирования таблицы;
+- новое напоминание в уже загруженном окне сразу попадает в кучу и будит планировщик.
+
+Инвариант: все строки с due_at < _upto уже в куче (или отправлены); новые строки с
+due_at < _horizon (окно, которое загружено или загружается сейчас) add() кладет в кучу сам.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import re
+import time
+from datetime import datetime, tzinfo
+from typing import Any, Optional
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+from app.db_async import Database
+from app.services.sender import PRIORITY_BULK, OutboundSender
+from app.services.subscriptions import next_due_at, parse_hhmm
+
+log = logging.getLogger(__name__)
+
+# Дальше года вперед не планируем.
+MAX_AHEAD_SEC = 366 * 24 * 3600
+# Опоздание больше этого (бот был выключен) отмечается в тексте напоминания.
+LATE_NOTICE_SEC = 120
+# Повтор после временного сбоя отправки: 30 с, 60 с, ... не реже раза в 10 минут.
+RETRY_BASE_SEC = 30
+RETRY_MAX_SEC = 600
+
+_UNIT_SEC = {"d": 86400, "д": 86400, "h": 3600, "ч": 3600, "m": 60, "м": 60, "мин": 60}
+_RELATIVE_RE = re.compile(r"(\d+)\s*(мин|d|д|h|ч|m|м)")
+_DATE_FORMATS = ("%Y-%m-%d %H:%M", "%d.%m.%Y %H:%M")
+
+
+def parse_when(text: str, tz: tzinfo, now: float) -> Optional[int]:
+    """
+    Когда напомнить (unix-время) или None, если формат не распознан / время в прошлом.
+    Форматы: "30m", "2h", "1d", "1h30m" (и "30м", "2ч", "1д"), "ЧЧ:ММ" (ближайшее),
+    "ДД.ММ ЧЧ:ММ", "ДД.ММ.ГГГГ ЧЧ:ММ", "ГГГГ-ММ-ДД ЧЧ:ММ" — в часовом поясе tz.
+    """
+    text = " ".join(text.lower().split())
+    if not text:
+        return None
+
+    due: Optional[float] = None
+    parts = _RELATIVE_RE.findall(text)
+    if parts and _RELATIVE_RE.sub("", text).strip() == "":
+        due = now + sum(int(n) * _UNIT_SEC[unit] for n, unit in parts)
+    elif (minute := parse_hhmm(text)) is not None:
+        due = next_due_at(minute, tz, now)
+    else:
+        due = _parse_date(text, tz, now)
+
+    if due is None or due <= now or due - now > MAX_AHEAD_SEC:
+        return None
+    return int(due)
+
+
+def _parse_date(text: str, tz: tzinfo, now: float) -> Optional[float]:
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).replace(tzinfo=tz).timestamp()
+        except ValueError:
+            pass
+    # "ДД.ММ ЧЧ:ММ" без года: ближайшая такая дата (в этом году или в следующем).
+    try:
+        parsed = datetime.strptime(text, "%d.%m %H:%M")
+    except ValueError:
+        return None
+    year = datetime.fromtimestamp(now, tz).year
+    for y in (year, year + 1):
+        try:
+            ts = parsed.replace(year=y, tzinfo=tz).timestamp()
+        except ValueError:  # 29.02 в невисокосный год
+            continue
+        if ts > now:
+            return ts
+    return None
+
+
+def format_due(due_at: int, tz: tzinfo) -> str:
+    return datetime.fromtimestamp(due_at, tz).strftime("%d.%m.%Y %H:%M")
+
+
+class ReminderScheduler:
+    def __init__(
+        self,
+        db: Database,
+        sender: OutboundSender,
+        slice_sec: float = 300.0,
+        max_loaded: int = 10_000,
+        load_batch: int = 1_000,
+        fire_batch: int = 100,
+    ) -> None:
+        self.db = db
+        self.sender = sender
+        self.slice_sec = slice_sec
+        self.max_loaded = max(1, max_loaded)
+        self.load_batch = max(1, load_batch)
+        self.fire_batch = max(1, fire_batch)
+
+        # (due_at или время повтора, id, строка reminders_window_q)
+        self._heap: list[tuple[int, int, dict[str, Any]]] = []
+        self._loaded_ids: set[int] = set()
+        # Все с due_at < _upto загружено; текущее окно дочитывается от _cursor до _horizon.
+        self._upto = 0
+        self._horizon = 0
+        self._cursor: tuple[int, int] = (-1, 0)
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task[None]] = None
+
+        self.loaded = 0
+        self.fired = 0
+        self.late = 0
+        self.skipped_deleted = 0
+        self.failed = 0
+        self.retried = 0
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="reminders")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def add(self, user_id: int, chat_id: int, note_id: int, due_at: int) -> Optional[int]:
+        """Сохраняет напоминание; None — заметки с таким id у пользователя нет."""
+        reminder_id = await self.db.add_reminder(user_id, chat_id, note_id, due_at)
+        if reminder_id is None:
+            return None
+        if due_at < self._horizon:
+            # Окно уже читается: дочитка эту строку может не увидеть, кладем в кучу сами
+            # (дубли отсекает _loaded_ids). Строку берем тем же запросом — с текстом заметки.
+            rows = await self.db.reminders_window(due_at, reminder_id - 1, due_at + 1, 1)
+            for row in rows:
+                self._push(row)
+            self._wake.set()
+        return reminder_id
+
+    # --- Внутреннее ---
+
+    def _push(self, row: dict[str, Any]) -> None:
+        if row["id"] in self._loaded_ids:
+            return
+        self._loaded_ids.add(row["id"])
+        heapq.heappush(self._heap, (row["due_at"], row["id"], row))
+        self.loaded += 1
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._refill()
+                while await self._fire_due():
+                    pass
+            except Exception:
+                log.exception("Планировщик напоминаний: ошибка, повтор через 5 с")
+                await asyncio.sleep(5)
+                continue
+            await self._sleep()
+
+    async def _refill(self) -> None:
+        if self._upto - self.slice_sec / 2 > time.time():
+            return
+        target = int(time.time() + self.slice_sec)
+        self._horizon = max(self._horizon, target)
+        while len(self._heap) < self.max_loaded:
+            after_due, after_id = self._cursor
+            limit = min(self.load_batch, self.max_loaded - len(self._heap))
+            rows = await self.db.reminders_window(after_due, after_id, target, limit)
+            for row in rows:
+                self._push(row)
+            if rows:
+                self._cursor = (rows[-1]["due_at"], rows[-1]["id"])
+            if len(rows) < limit:
+                # Окно дочитано целиком.
+                self._upto = target
+                return
+        # Куча заполнена: дочитаем после отправки сработавших.
+
+    async def _fire_due(self) -> bool:
+        now = time.time()
+        batch: list[dict[str, Any]] = []
+        while self._heap and self._heap[0][0] <= now and len(batch) < self.fire_batch:
+            batch.append(heapq.heappop(self._heap)[2])
+        if not batch:
+            return False
+
+        results = await asyncio.gather(*(self._send(row, now) for row in batch), return_exceptions=True)
+        done: list[int] = []
+        for row, result in zip(batch, results):
+            if result is True:
+                done.append(row["id"])
+                continue
+            if isinstance(result, BaseException):
+                log.error("Напоминание %s: ошибка отправки", row["id"], exc_info=result)
+            # id остается в _loaded_ids: кладем в кучу напрямую, мимо _push.
+            attempts = row.get("attempts", 0) + 1
+            row["attempts"] = attempts
+            retry_at = int(now) + min(RETRY_MAX_SEC, RETRY_BASE_SEC << min(attempts - 1, 10))
+            heapq.heappush(self._heap, (retry_at, row["id"], row))
+            self.retried += 1
+        if done:
+            await self.db.delete_reminders(done)
+            self._loaded_ids.difference_update(done)
+        return True
+
+    async def _send(self, row: dict[str, Any], now: float) -> bool:
+        """True — с напоминанием покончено (доставлено или доставить нельзя), False — повторить."""
+        if row["text"] is None:
+            # Заметку удалили — напоминать не о чем.
+            self.skipped_deleted += 1
+            return True
+        text = f'⏰ Напоминание о заметке {row["note_id"]}:\n{row["text"]}'
+        if now - row["due_at"] > LATE_NOTICE_SEC:
+            self.late += 1
+            text += "\n(с опозданием: бот был недоступен)"
+        try:
+            await self.sender.send(row["chat_id"], text, priority=PRIORITY_BULK)
+        except (Forbidden, BadRequest):
+            # Бот заблокирован, чат не найден: повтор не поможет.
+            self.failed += 1
+        except (RetryAfter, NetworkError) as e:
+            log.warning("Напоминание %s не отправлено, повторим: %s", row["id"], e)
+            return False
+        except TelegramError as e:
+            log.warning("Напоминание %s не отправлено: %s", row["id"], e)
+            self.failed += 1
+        else:
+            self.fired += 1
+        return True
+
+    async def _sleep(self) -> None:
+        now = time.time()
+        # Пора дочитывать окно; но если куча заполнена, ждать нужно только срабатывания.
+        wake_at = self._upto - self.slice_sec / 2 if len(self._heap) < self.max_loaded else now + self.slice_sec
+        if self._heap:
+            wake_at = min(wake_at, self._heap[0][0])
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=max(0.0, min(wake_at - now, self.slice_sec)))
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "in_memory": len(self._heap),
+            "window_sec": max(0, int(self._upto - time.time())),
+            "loaded": self.loaded,
+            "fired": self.fired,
+            "late": self.late,
+            "skipped_deleted": self.skipped_deleted,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
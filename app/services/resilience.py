@@ -0,0 +1,92 @@
+"""
+resilience.py
+Примитивы устойчивости для внешних HTTP-вызовов:
+- CircuitBreaker: после серии ошибок хост "размыкается" и запросы к нему сразу отклоняются,
+  через reset_timeout_sec пропускается одна пробная попытка;
+- backoff_delay: экспоненциальная задержка с полным джиттером между повторами,
+  чтобы повторы разных пользователей не приходили синхронно.
+"""
+
+from __future__ import annotations
+
+import random
+import time
+from typing import Any
+
+
+class CircuitOpenError(Exception):
+    """Хост временно отключен автоматом: запрос даже не отправлялся."""
+
+    def __init__(self, host: str, retry_after_sec: float) -> None:
+        super().__init__(f"circuit open for {host}, retry after {retry_after_sec:.1f}s")
+        self.host = host
+        self.retry_after_sec = retry_after_sec
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_sec: float = 30.0) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_sec = reset_timeout_sec
+
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+        self.rejected = 0
+        self.opened_total = 0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout_sec:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+        # HALF_OPEN: пропускаем ровно одну пробную попытку.
+        if self._trial_in_flight:
+            self.rejected += 1
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def retry_after(self) -> float:
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout_sec - (time.monotonic() - self._opened_at))
+
+    def release(self) -> None:
+        """Попытка прервана без результата (отмена): освобождаем слот пробного запроса."""
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self._failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self._trial_in_flight = False
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened_total += 1
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self._failures,
+            "rejected": self.rejected,
+            "opened_total": self.opened_total,
+        }
+
+
+def backoff_delay(attempt: int, base_sec: float = 0.2, max_sec: float = 2.0) -> float:
+    """Полный джиттер: случайная задержка в [0, min(max, base * 2^attempt)]."""
+    return random.uniform(0.0, min(max_sec, base_sec * (2**attempt)))
@@ -0,0 +1,381 @@
+"""
+sender.py
+Очередь исходящих сообщений с лимитами Telegram.
+
+Хендлеры больше не вызывают reply_text сами: reply() кладет сообщение в очередь и сразу
+возвращается, а отправляет один воркер OutboundSender:
+- общее ведро токенов (~30 сообщений/с на бота) и ведро на каждый чат (~1 сообщение/с,
+  с небольшим запасом на всплеск) — не упираемся в flood control;
+- приоритеты: ответы пользователям (PRIORITY_INTERACTIVE) обгоняют рассылки и
+  напоминания (PRIORITY_BULK); внутри одного чата порядок сообщений сохраняется;
+- в чат одновременно уходит не больше одного сообщения: пока оно в пути или чат ждет
+  свой токен, следующие копятся и склеиваются в одно (например, "Верно ✅" и следующий
+  вопрос викторины) — меньше запросов к Bot API;
+- RetryAfter: чат откладывается на указанное время, сообщения возвращаются в начало
+  его очереди и уходят повторно (до max_retries раз); остальные чаты не ждут.
+
+send() — для тех, кому нужен результат (Message или исключение, например Forbidden
+у рассылки); enqueue()/reply() — "отправил и забыл", ошибки только в лог и метрики.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Optional
+
+from telegram import Bot, Message, Update
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import ContextTypes
+
+from app.utils.rate_limit import TokenBucket
+
+log = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Лимит Telegram на длину сообщения: склеенный текст не должен его превышать.
+COALESCE_MAX_LEN = 4096
+COALESCE_SEPARATOR = "\n\n"
+# Состояние чата без сообщений держим, пока его ведро не наполнится (иначе лимит на чат
+# обходился бы удалением состояния); чистим раз в SWEEP_INTERVAL_SEC.
+SWEEP_INTERVAL_SEC = 60.0
+
+
+class _Outgoing:
+    __slots__ = ("text", "kwargs", "priority", "coalesce", "future", "retries", "enqueued")
+
+    def __init__(
+        self,
+        text: str,
+        kwargs: dict[str, Any],
+        priority: int,
+        coalesce: bool,
+        future: Optional[asyncio.Future[Message]],
+    ) -> None:
+        self.text = text
+        self.kwargs = kwargs
+        self.priority = priority
+        self.coalesce = coalesce
+        self.future = future
+        self.retries = 0
+        self.enqueued = time.monotonic()
+
+
+class _ChatQueue:
+    __slots__ = ("items", "bucket", "busy", "entry", "priority", "not_before", "last_sent")
+
+    def __init__(self, bucket: TokenBucket) -> None:
+        self.items: deque[_Outgoing] = deque()
+        self.bucket = bucket
+        # Сообщение этого чата выбрано к отправке или уже отправляется.
+        self.busy = False
+        # Номер действующей записи чата в _ready/_delayed (-1 — чат не запланирован);
+        # остальные записи чата в кучах устарели и пропускаются.
+        self.entry = -1
+        self.priority = 0
+        # После RetryAfter раньше этого момента (monotonic) в чат не пишем.
+        self.not_before = 0.0
+        self.last_sent = 0.0
+
+
+class OutboundSender:
+    def __init__(
+        self,
+        bot: Bot,
+        rate_per_sec: float = 25.0,
+        per_chat_rate: float = 1.0,
+        per_chat_burst: float = 3.0,
+        max_inflight: int = 16,
+        max_retries: int = 3,
+    ) -> None:
+        self.bot = bot
+        self.bucket = TokenBucket(rate_per_sec)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = max(1.0, per_chat_burst)
+        self.max_inflight = max(1, max_inflight)
+        self.max_retries = max(0, max_retries)
+
+        self._chats: dict[int, _ChatQueue] = {}
+        # Чаты, которым можно писать: (приоритет, порядковый номер, chat_id).
+        self._ready: list[tuple[int, int, int]] = []
+        # Чаты, ждущие свой токен или конца RetryAfter: (monotonic-время, номер, chat_id).
+        self._delayed: list[tuple[float, int, int]] = []
+        self._seq = itertools.count()
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        self._inflight: set[asyncio.Task[None]] = set()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task[None]] = None
+        self._last_sweep = time.monotonic()
+        self.pending = 0
+
+        self.requests = 0
+        self.messages = 0
+        self.coalesced = 0
+        self.retry_after = 0
+        self.failed = 0
+        self._wait_total = [0.0, 0.0]
+        self._wait_count = [0, 0]
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="outbound-sender")
+
+    async def stop(self, drain_timeout_sec: float = 5.0) -> None:
+        """Дает очереди до drain_timeout_sec досылаться, остальное отменяет."""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + drain_timeout_sec
+        while (self.pending or self._inflight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        for task in list(self._inflight):
+            task.cancel()
+        await asyncio.gather(*self._inflight, return_exceptions=True)
+        for chat in self._chats.values():
+            for item in chat.items:
+                if item.future is not None and not item.future.done():
+                    item.future.cancel()
+        if self.pending:
+            log.warning("Очередь отправки остановлена, не отправлено сообщений: %d", self.pending)
+        self._chats.clear()
+        self.pending = 0
+
+    def enqueue(
+        self,
+        chat_id: int,
+        text: str,
+        priority: int = PRIORITY_INTERACTIVE,
+        coalesce: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        """Ставит сообщение в очередь и сразу возвращается; ошибки отправки — только в лог."""
+        self._put(chat_id, _Outgoing(text, kwargs, priority, coalesce, None))
+
+    async def send(
+        self,
+        chat_id: int,
+        text: str,
+        priority: int = PRIORITY_INTERACTIVE,
+        coalesce: bool = True,
+        **kwargs: Any,
+    ) -> Message:
+        """Ставит сообщение в очередь и ждет отправки: Message или исключение Bot API."""
+        future: asyncio.Future[Message] = asyncio.get_running_loop().create_future()
+        self._put(chat_id, _Outgoing(text, kwargs, priority, coalesce, future))
+        return await future
+
+    # --- Внутреннее ---
+
+    def _put(self, chat_id: int, item: _Outgoing) -> None:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = _ChatQueue(TokenBucket(self.per_chat_rate, self.per_chat_burst))
+            self._chats[chat_id] = chat
+        chat.items.append(item)
+        self.pending += 1
+        self._schedule(chat_id, chat)
+
+    def _schedule(self, chat_id: int, chat: _ChatQueue) -> None:
+        if chat.busy or not chat.items:
+            return
+        if chat.not_before > time.monotonic():
+            if chat.entry < 0:
+                self._push_delayed(chat_id, chat, chat.not_before)
+            return
+        priority = min(item.priority for item in chat.items)
+        # Уже запланированный чат переносим, только если пришло более срочное сообщение.
+        if chat.entry >= 0 and priority >= chat.priority:
+            return
+        self._push_ready(chat_id, chat, priority)
+        self._wake.set()
+
+    def _push_ready(self, chat_id: int, chat: _ChatQueue, priority: int) -> None:
+        chat.entry = next(self._seq)
+        chat.priority = priority
+        heapq.heappush(self._ready, (priority, chat.entry, chat_id))
+
+    def _push_delayed(self, chat_id: int, chat: _ChatQueue, at: float) -> None:
+        chat.entry = next(self._seq)
+        # Ждущий чат срочнее уже не станет: раньше своего времени он все равно не уйдет.
+        chat.priority = -1
+        heapq.heappush(self._delayed, (at, chat.entry, chat_id))
+        self._wake.set()
+
+    def _promote_delayed(self, now: float) -> None:
+        while self._delayed and self._delayed[0][0] <= now:
+            _, entry, chat_id = heapq.heappop(self._delayed)
+            chat = self._chats.get(chat_id)
+            if chat is None or chat.entry != entry:
+                continue
+            self._push_ready(chat_id, chat, min(item.priority for item in chat.items))
+
+    def _next_chat(self) -> Optional[tuple[int, _ChatQueue]]:
+        """Самый срочный чат, которому можно писать прямо сейчас (токен чата уже взят)."""
+        now = time.monotonic()
+        self._promote_delayed(now)
+        while self._ready:
+            _, entry, chat_id = heapq.heappop(self._ready)
+            chat = self._chats.get(chat_id)
+            if chat is None or chat.entry != entry:
+                continue
+            # Пока действует RetryAfter, токен не берем: он сгорел бы на отложенной отправке.
+            wait = chat.not_before - now
+            if wait <= 0:
+                wait = chat.bucket.try_acquire()
+            if wait > 0:
+                self._push_delayed(chat_id, chat, now + wait)
+                continue
+            chat.entry = -1
+            chat.busy = True
+            return chat_id, chat
+        return None
+
+    def _take_batch(self, chat: _ChatQueue) -> list[_Outgoing]:
+        """Первое сообщение чата и идущие за ним, которые можно склеить с ним в одно."""
+        first = chat.items.popleft()
+        batch = [first]
+        size = len(first.text)
+        while chat.items and first.coalesce:
+            prev, nxt = batch[-1], chat.items[0]
+            if not nxt.coalesce or prev.kwargs.get("reply_markup") is not None:
+                break
+            # Клавиатура может быть только у последнего сообщения склейки.
+            if _without_markup(nxt.kwargs) != _without_markup(first.kwargs):
+                break
+            size += len(COALESCE_SEPARATOR) + len(nxt.text)
+            if size > COALESCE_MAX_LEN:
+                break
+            batch.append(chat.items.popleft())
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            if time.monotonic() - self._last_sweep > SWEEP_INTERVAL_SEC:
+                self._sweep(time.monotonic())
+            picked = self._next_chat()
+            if picked is None:
+                await self._idle()
+                continue
+            chat_id, chat = picked
+            await self.bucket.acquire()
+            await self._slots.acquire()
+            batch = self._take_batch(chat)
+            task = asyncio.create_task(self._deliver(chat_id, chat, batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _idle(self) -> None:
+        now = time.monotonic()
+        timeout = self._delayed[0][0] - now if self._delayed else SWEEP_INTERVAL_SEC
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=max(0.0, timeout))
+        except asyncio.TimeoutError:
+            pass
+
+    def _sweep(self, now: float) -> None:
+        self._last_sweep = now
+        refill_sec = self.per_chat_burst / self.per_chat_rate
+        idle = [
+            chat_id
+            for chat_id, chat in self._chats.items()
+            if not chat.items and not chat.busy and now - max(chat.last_sent, chat.not_before) > refill_sec
+        ]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    async def _deliver(self, chat_id: int, chat: _ChatQueue, batch: list[_Outgoing]) -> None:
+        last = batch[-1]
+        text = batch[0].text if len(batch) == 1 else COALESCE_SEPARATOR.join(item.text for item in batch)
+        kwargs = {**_without_markup(batch[0].kwargs), **last.kwargs}
+        try:
+            self.requests += 1
+            try:
+                message = await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+            except RetryAfter as e:
+                self.retry_after += 1
+                chat.not_before = time.monotonic() + float(e.retry_after)
+                retry = [item for item in batch if item.retries < self.max_retries]
+                for item in retry:
+                    item.retries += 1
+                # Обратно в начало очереди чата — в том же порядке.
+                chat.items.extendleft(reversed(retry))
+                self._fail([item for item in batch if item not in retry], e)
+                log.warning("RetryAfter %s с для чата %s", e.retry_after, chat_id)
+            except Exception as e:
+                self._fail(batch, e)
+                if isinstance(e, TelegramError):
+                    log.warning("Не удалось отправить сообщение в чат %s: %s", chat_id, e)
+                else:
+                    log.exception("Ошибка отправки сообщения в чат %s", chat_id)
+            else:
+                self._done(batch, message)
+        finally:
+            chat.busy = False
+            chat.last_sent = time.monotonic()
+            self._slots.release()
+            self._schedule(chat_id, chat)
+
+    def _done(self, batch: list[_Outgoing], message: Message) -> None:
+        now = time.monotonic()
+        self.pending -= len(batch)
+        self.messages += len(batch)
+        self.coalesced += len(batch) - 1
+        for item in batch:
+            p = min(item.priority, PRIORITY_BULK)
+            self._wait_total[p] += now - item.enqueued
+            self._wait_count[p] += 1
+            if item.future is not None and not item.future.done():
+                item.future.set_result(message)
+
+    def _fail(self, batch: list[_Outgoing], error: BaseException) -> None:
+        self.pending -= len(batch)
+        self.failed += len(batch)
+        for item in batch:
+            if item.future is not None and not item.future.done():
+                item.future.set_exception(error)
+
+    def stats(self) -> dict[str, Any]:
+        def wait_ms(p: int) -> float:
+            return round(self._wait_total[p] / self._wait_count[p] * 1000, 1) if self._wait_count[p] else 0.0
+
+        return {
+            "pending": self.pending,
+            "chats": len(self._chats),
+            "inflight": len(self._inflight),
+            "requests": self.requests,
+            "messages": self.messages,
+            "coalesced": self.coalesced,
+            "retry_after": self.retry_after,
+            "failed": self.failed,
+            "wait_interactive_ms": wait_ms(PRIORITY_INTERACTIVE),
+            "wait_bulk_ms": wait_ms(PRIORITY_BULK),
+        }
+
+
+def _without_markup(kwargs: dict[str, Any]) -> dict[str, Any]:
+    if "reply_markup" not in kwargs:
+        return kwargs
+    return {k: v for k, v in kwargs.items() if k != "reply_markup"}
+
+
+def reply(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, **kwargs: Any) -> None:
+    """
+    Замена update.message.reply_text(): ответ встает в очередь OutboundSender,
+    хендлер не ждет ни сети, ни лимитов Telegram.
+    """
+    message = update.effective_message
+    if message is None:
+        return
+    if message.is_topic_message and message.message_thread_id is not None:
+        kwargs.setdefault("message_thread_id", message.message_thread_id)
+    sender: OutboundSender = context.application.bot_data["sender"]
+    sender.enqueue(message.chat_id, text, **kwargs)
@@ -0,0 +1,174 @@
+"""
+subscriptions.py
+Ежедневная рассылка погоды по подпискам (/weather subscribe <город> <ЧЧ:ММ>).
+
+Как устроено:
+- подписки лежат в SQLite (weather_subscriptions) с индексом по next_due_at;
+- одна периодическая задача JobQueue (а не задача на каждого подписчика) раз в тик
+  выбирает по индексу только тех, кому пора, порциями по page_size;
+- перед отправкой порции next_due_at сдвигается на следующий день: следующий запрос
+  порции уже не увидит эти строки, а сбой посреди рассылки не приведет к повторам;
+- подписчики группируются по ячейке сетки (как в WeatherCache): на ячейку — одно
+  обращение к кэшу погоды, а промахи разных ячеек ForecastBatcher объединяет
+  в многоточечные запросы;
+- сообщения уходят через общую очередь OutboundSender с низким приоритетом: лимиты
+  Telegram и RetryAfter учитывает она, а ответы пользователям идут вперед рассылки;
+- если бот был выключен и отправка опоздала больше чем на max_late_sec,
+  вчерашнюю погоду не шлем — только переносим на следующий день.
+
+Время подписки задается в часовом поясе рассылки (Settings.subscriptions_tz).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import time
+from datetime import datetime, timedelta, tzinfo
+from typing import Any, Callable, Optional
+
+from telegram.error import Forbidden, TelegramError
+
+from app.db_async import Database
+from app.services.open_meteo import GeoResult
+from app.services.sender import PRIORITY_BULK, OutboundSender
+from app.services.weather_cache import WeatherCache, WeatherReading, grid_cell
+
+log = logging.getLogger(__name__)
+
+RenderWeather = Callable[[GeoResult, WeatherReading], str]
+
+_HHMM_RE = re.compile(r"^([01]?\d|2[0-3])[:.]([0-5]\d)$")
+
+
+def parse_hhmm(text: str) -> Optional[int]:
+    """ "07:30" -> 450 (минут от полуночи); None, если формат не тот."""
+    m = _HHMM_RE.match(text.strip())
+    if not m:
+        return None
+    return int(m.group(1)) * 60 + int(m.group(2))
+
+
+def format_hhmm(send_minute: int) -> str:
+    return f"{send_minute // 60:02d}:{send_minute % 60:02d}"
+
+
+def next_due_at(send_minute: int, tz: tzinfo, after_ts: float) -> int:
+    """Ближайший момент (unix-время) строго после after_ts, когда в поясе tz будет ЧЧ:ММ."""
+    local = datetime.fromtimestamp(after_ts, tz)
+    hour, minute = divmod(send_minute, 60)
+    candidate = local.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if candidate.timestamp() <= after_ts:
+        # Сложение дат с zoneinfo идет по "настенным часам": переход на летнее время учтен.
+        candidate = (candidate + timedelta(days=1)).replace(hour=hour, minute=minute)
+    return int(candidate.timestamp())
+
+
+class WeatherDigest:
+    def __init__(
+        self,
+        db: Database,
+        weather_cache: WeatherCache,
+        sender: OutboundSender,
+        render: RenderWeather,
+        tz: tzinfo,
+        page_size: int = 500,
+        max_late_sec: float = 30 * 60,
+    ) -> None:
+        self.db = db
+        self.weather_cache = weather_cache
+        self.sender = sender
+        self.render = render
+        self.tz = tz
+        self.page_size = max(1, page_size)
+        self.max_late_sec = max_late_sec
+
+        self._running = False
+
+        self.ticks_skipped = 0
+        self.sent = 0
+        self.failed = 0
+        self.skipped_late = 0
+        self.unsubscribed = 0
+        self.cells_fetched = 0
+
+    async def tick(self) -> int:
+        """Отправляет все, чему пора. Возвращает число отправленных сообщений."""
+        if self._running:
+            # Прошлая рассылка еще идет (большая порция при лимите скорости) — не дублируем.
+            self.ticks_skipped += 1
+            return 0
+        self._running = True
+        sent_before = self.sent
+        try:
+            while True:
+                now = int(time.time())
+                rows = await self.db.due_weather_subscriptions(now, self.page_size)
+                if not rows:
+                    break
+                await self._process_page(rows, now)
+                if len(rows) < self.page_size:
+                    break
+        finally:
+            self._running = False
+        return self.sent - sent_before
+
+    async def _process_page(self, rows: list[dict[str, Any]], now: int) -> None:
+        await self.db.reschedule_weather_subscriptions(
+            [
+                (next_due_at(row["send_minute"], self.tz, now), row["chat_id"], row["city_key"], row["next_due_at"])
+                for row in rows
+            ]
+        )
+
+        by_cell: dict[tuple[int, int], list[dict[str, Any]]] = {}
+        for row in rows:
+            if now - row["next_due_at"] > self.max_late_sec:
+                self.skipped_late += 1
+                continue
+            cell = grid_cell(row["latitude"], row["longitude"], self.weather_cache.cell_step)
+            by_cell.setdefault(cell, []).append(row)
+        if not by_cell:
+            return
+
+        groups = list(by_cell.values())
+        self.cells_fetched += len(groups)
+        readings = await asyncio.gather(
+            *(self.weather_cache.get(group[0]["latitude"], group[0]["longitude"]) for group in groups),
+            return_exceptions=True,
+        )
+
+        sends = []
+        for group, reading in zip(groups, readings):
+            if isinstance(reading, BaseException):
+                log.warning("Рассылка погоды: нет данных для %d подписчиков: %r", len(group), reading)
+                self.failed += len(group)
+                continue
+            for row in group:
+                geo = GeoResult(row["city"], row["country"], row["latitude"], row["longitude"])
+                sends.append(self._send(row, "Ежедневная погода\n" + self.render(geo, reading)))
+        await asyncio.gather(*sends)
+
+    async def _send(self, row: dict[str, Any], text: str) -> None:
+        try:
+            await self.sender.send(row["chat_id"], text, priority=PRIORITY_BULK)
+        except Forbidden:
+            # Бота заблокировали или удалили из чата — подписки этого чата больше не нужны.
+            self.unsubscribed += await self.db.delete_weather_subscriptions(row["chat_id"])
+        except TelegramError as e:
+            log.warning("Рассылка погоды: не удалось отправить в чат %s: %s", row["chat_id"], e)
+            self.failed += 1
+        else:
+            self.sent += 1
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "running": self._running,
+            "ticks_skipped": self.ticks_skipped,
+            "sent": self.sent,
+            "failed": self.failed,
+            "skipped_late": self.skipped_late,
+            "unsubscribed": self.unsubscribed,
+            "cells_fetched": self.cells_fetched,
+        }
@@ -0,0 +1,149 @@
+"""
+weather_cache.py
+Кэш текущей погоды по ячейкам координатной сетки.
+
+- ключ — ячейка сетки (по умолчанию 0.1° ≈ 11 км): соседние точки одного города
+  используют одно значение;
+- Open-Meteo обновляет current_weather раз в 15 минут, столько же запись считается свежей;
+- single-flight: одновременные промахи по одной ячейке ждут один общий запрос;
+- stale-while-revalidate: просроченная (но не слишком старая) запись отдается сразу,
+  а обновление идет одним фоновым запросом;
+- деградация: если сервис недоступен (автомат разомкнут, сеть, дедлайн) или ответил
+  некорректными данными, отдаем последнее известное значение (до degraded_max_age_sec)
+  с пометкой stale вместо ошибки.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+import httpx
+
+from app.services.open_meteo import WeatherNow
+from app.services.resilience import CircuitOpenError
+from app.utils.cache import MISSING, LRUCache
+
+log = logging.getLogger(__name__)
+
+Cell = tuple[int, int]
+FetchWeather = Callable[[float, float], Awaitable[WeatherNow]]
+
+
+@dataclass(frozen=True)
+class WeatherReading:
+    weather: WeatherNow
+    age_sec: float
+    # True — свежие данные получить не удалось, показываем последнее известное значение.
+    stale: bool = False
+
+
+def grid_cell(lat: float, lon: float, step: float = 0.1) -> Cell:
+    return round(lat / step), round(lon / step)
+
+
+class WeatherCache:
+    def __init__(
+        self,
+        fetch: FetchWeather,
+        cell_step: float = 0.1,
+        fresh_ttl_sec: float = 15 * 60,
+        max_stale_sec: float = 2 * 3600,
+        max_entries: int = 5_000,
+        degraded_max_age_sec: float = 24 * 3600,
+    ) -> None:
+        self.fetch = fetch
+        self.cell_step = cell_step
+        self.fresh_ttl_sec = fresh_ttl_sec
+        # Запись старше fresh_ttl + max_stale уже не отдается: ждем свежие данные.
+        self.max_stale_sec = max_stale_sec
+        # Значение: (время получения, погода). Храним дольше окна SWR — для ответа при деградации.
+        ttl = fresh_ttl_sec + max(max_stale_sec, degraded_max_age_sec)
+        self._entries = LRUCache(max_entries=max_entries, ttl_sec=ttl)
+        self._inflight: dict[Cell, asyncio.Task[WeatherNow]] = {}
+
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.degraded = 0
+
+    async def get(self, lat: float, lon: float) -> WeatherReading:
+        cell = grid_cell(lat, lon, self.cell_step)
+        entry = self._entries.get(cell)
+        if entry is not MISSING:
+            fetched_at, weather = entry
+            age = time.monotonic() - fetched_at
+            if age < self.fresh_ttl_sec:
+                self.fresh_hits += 1
+                return WeatherReading(weather, age)
+            if age < self.fresh_ttl_sec + self.max_stale_sec:
+                # Устарело: отдаем сразу, обновляем в фоне (один запрос на ячейку).
+                self.stale_hits += 1
+                self._refresh(cell)
+                return WeatherReading(weather, age)
+
+        self.misses += 1
+        try:
+            # shield: отмена одного ожидающего не отменяет общий запрос для остальных.
+            weather = await asyncio.shield(self._refresh(cell))
+        except (CircuitOpenError, httpx.HTTPError, ValueError):
+            # ValueError — битый или неполный ответ Open-Meteo: тоже лучше старое значение.
+            if entry is MISSING:
+                raise
+            self.degraded += 1
+            fetched_at, weather = entry
+            return WeatherReading(weather, time.monotonic() - fetched_at, stale=True)
+        return WeatherReading(weather, 0.0)
+
+    def _refresh(self, cell: Cell) -> "asyncio.Task[WeatherNow]":
+        task = self._inflight.get(cell)
+        if task is not None:
+            self.coalesced += 1
+            return task
+
+        task = asyncio.create_task(self._fetch_cell(cell), name=f"weather-{cell[0]}:{cell[1]}")
+        self._inflight[cell] = task
+        task.add_done_callback(lambda t, c=cell: self._on_done(c, t))
+        return task
+
+    async def _fetch_cell(self, cell: Cell) -> WeatherNow:
+        self.fetches += 1
+        lat, lon = cell[0] * self.cell_step, cell[1] * self.cell_step
+        weather = await self.fetch(lat, lon)
+        self._entries.set(cell, (time.monotonic(), weather))
+        return weather
+
+    def _on_done(self, cell: Cell, task: "asyncio.Task[WeatherNow]") -> None:
+        self._inflight.pop(cell, None)
+        # Ошибку фонового обновления никто не ждет — пишем в лог, чтобы не было
+        # "Task exception was never retrieved".
+        if task.cancelled() or task.exception() is None:
+            return
+        if isinstance(task.exception(), CircuitOpenError):
+            log.debug("Погода для ячейки %s не обновлена: %s", cell, task.exception())
+        else:
+            log.warning("Не удалось обновить погоду для ячейки %s: %r", cell, task.exception())
+
+    async def aclose(self) -> None:
+        # Фоновые обновления не переживают остановку: HTTP-клиенты закрываются следом.
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "fresh_hits": self.fresh_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "fetches": self.fetches,
+            "degraded": self.degraded,
+        }
@@ -0,0 +1,135 @@
+"""
+update_processor.py
+Параллельная обработка апдейтов разных пользователей с сохранением порядка для одного.
+
+По умолчанию Application обрабатывает апдейты строго по одному: медленный /weather
+одного пользователя задерживает /note всех остальных. OrderedUpdateProcessor:
+- апдейты с одинаковым ключом (пользователь, а если его нет — чат) выполняются строго
+  по очереди, в порядке поступления (asyncio.Lock отдает захват ожидающим по FIFO);
+  на этом держатся, например, ответы викторины через on_text_quiz_router;
+- апдейты разных ключей идут параллельно, но не больше max_concurrent одновременно.
+
+Почему лимит свой, а не семафор BaseUpdateProcessor: process_update() базового класса
+(final) держит его слот, пока апдейт ждет своей очереди по ключу. Десяток сообщений
+одного пользователя занял бы десяток слотов и притормозил бы остальных. Поэтому
+базовый семафор сделан большим (max_pending), а реальный лимит берется уже после
+захвата блокировки ключа — слоты расходуются только на то, что действительно выполняется.
+
+Метрики: сколько апдейтов ждет (очередь по ключу + очередь за слотом), сколько выполняется,
+время ожидания до начала обработки (среднее, p50/p95/max по последним апдейтам).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Сколько последних ожиданий хранить для перцентилей.
+_WAIT_SAMPLES = 1_000
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent: int = 64, max_pending: int = 4_096) -> None:
+        super().__init__(max_concurrent_updates=max(max_pending, max_concurrent))
+        self.max_concurrent = max(1, max_concurrent)
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        # ключ -> [блокировка, число апдейтов с этим ключом в работе или в ожидании]
+        self._keys: dict[Hashable, list[Any]] = {}
+
+        self.waiting = 0
+        self.running = 0
+        self.processed = 0
+        self._started = 0
+        self._wait_total = 0.0
+        self._waits: deque[float] = deque(maxlen=_WAIT_SAMPLES)
+
+    @staticmethod
+    def update_key(update: object) -> Optional[Hashable]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user is not None:
+            return ("user", update.effective_user.id)
+        if update.effective_chat is not None:
+            return ("chat", update.effective_chat.id)
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self.update_key(update)
+        started = time.monotonic()
+        self.waiting += 1
+        waiting = True
+        entry = self._enter(key)
+        try:
+            if entry is not None:
+                await entry[0].acquire()
+            try:
+                async with self._slots:
+                    self.waiting -= 1
+                    waiting = False
+                    self._record_wait(time.monotonic() - started)
+                    self.running += 1
+                    try:
+                        await coroutine
+                    finally:
+                        self.running -= 1
+                        self.processed += 1
+            finally:
+                if entry is not None:
+                    entry[0].release()
+        finally:
+            # Отмена во время ожидания: апдейт так и не начал выполняться.
+            if waiting:
+                self.waiting -= 1
+            self._leave(key, entry)
+
+    def _enter(self, key: Optional[Hashable]) -> Optional[list[Any]]:
+        if key is None:
+            return None
+        entry = self._keys.get(key)
+        if entry is None:
+            entry = [asyncio.Lock(), 0]
+            self._keys[key] = entry
+        entry[1] += 1
+        return entry
+
+    def _leave(self, key: Optional[Hashable], entry: Optional[list[Any]]) -> None:
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] == 0:
+            # Последний апдейт ключа — блокировка больше не нужна, словарь не растет.
+            del self._keys[key]
+
+    def _record_wait(self, wait_sec: float) -> None:
+        self._started += 1
+        self._wait_total += wait_sec
+        self._waits.append(wait_sec)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> dict[str, Any]:
+        waits = sorted(self._waits)
+
+        def pct(p: float) -> float:
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 1) if waits else 0.0
+
+        return {
+            "waiting": self.waiting,
+            "running": self.running,
+            "max_concurrent": self.max_concurrent,
+            "keys": len(self._keys),
+            "processed": self.processed,
+            "wait_avg_ms": round(self._wait_total / self._started * 1000, 1) if self._started else 0.0,
+            "wait_p50_ms": pct(0.50),
+            "wait_p95_ms": pct(0.95),
+            "wait_max_ms": round(waits[-1] * 1000, 1) if waits else 0.0,
+        }
@@ -0,0 +1,59 @@
+"""
+bloom.py
+Компактный фильтр "недавно видел" для целых id: два поколения фильтра Блума.
+
+- add(x) пишет в текущее поколение; когда в нем набралось capacity элементов, оно становится
+  предыдущим, а старое предыдущее выбрасывается — так фильтр помнит последние
+  capacity..2*capacity элементов и не "забивается" единицами со временем;
+- x in f: есть ли x в одном из поколений. Ложные срабатывания возможны (~2% при
+  параметрах по умолчанию), ложных пропусков нет;
+- размер фиксирован: 2 * bits / 8 байт (по умолчанию 512 байт) — хранится в user_data.
+
+Хэши — арифметика над id (не hash()): результат одинаков между перезапусками,
+поэтому фильтр можно сохранять и загружать.
+"""
+
+from __future__ import annotations
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix(x: int) -> int:
+    # splitmix64: хорошо перемешивает последовательные id.
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+class RecentIds:
+    __slots__ = ("bits", "hashes", "capacity", "count", "current", "previous")
+
+    def __init__(self, bits: int = 2048, hashes: int = 4, capacity: int = 200) -> None:
+        self.bits = max(8, bits - bits % 8)
+        self.hashes = max(1, hashes)
+        self.capacity = max(1, capacity)
+        self.count = 0
+        self.current = bytearray(self.bits // 8)
+        self.previous = bytearray(self.bits // 8)
+
+    def _positions(self, x: int) -> list[int]:
+        # Двойное хэширование: k позиций из двух половин одного 64-битного хэша.
+        h = _mix(x)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, x: int) -> None:
+        if self.count >= self.capacity:
+            self.previous, self.current = self.current, bytearray(self.bits // 8)
+            self.count = 0
+        for pos in self._positions(x):
+            self.current[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, x: int) -> bool:
+        positions = self._positions(x)
+        for generation in (self.current, self.previous):
+            if all(generation[pos >> 3] & (1 << (pos & 7)) for pos in positions):
+                return True
+        return False
@@ -0,0 +1,77 @@
+"""
+cache.py
+Ограниченный LRU-кэш с TTL для данных в памяти процесса.
+
+- размер ограничен max_entries: при переполнении вытесняется самая давно использованная запись;
+- запись живет не дольше ttl_sec;
+- счетчики hits/misses/evictions/expirations помогают подобрать размер (см. /metrics).
+
+Кэш не потокобезопасен: рассчитан на использование из одного event loop.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+# Маркер промаха: None может быть нормальным закэшированным значением.
+MISSING: Any = object()
+
+
+class LRUCache:
+    def __init__(self, max_entries: int = 10_000, ttl_sec: float = 60.0) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_sec = ttl_sec
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return MISSING
+
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return MISSING
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_sec: float | None = None) -> None:
+        ttl = self.ttl_sec if ttl_sec is None else ttl_sec
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
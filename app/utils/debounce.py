@@ -0,0 +1,58 @@
+"""
+debounce.py
+Дебаунс по ключу (например, по user_id) с отменой устаревших вызовов.
+
+KeyedDebouncer.run(key, factory, delay_sec):
+- ждет delay_sec и только потом вызывает factory();
+- новый вызов с тем же ключом отменяет предыдущий — и ожидание, и уже начатую работу;
+- отмененный (вытесненный) вызов возвращает None, а не падает с CancelledError.
+
+Нужен для inline-запросов: Telegram присылает запрос на каждое нажатие клавиши,
+а отвечать имеет смысл только на последний.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class KeyedDebouncer:
+    def __init__(self) -> None:
+        self._pending: dict[Hashable, asyncio.Task[Any]] = {}
+
+        self.started = 0
+        self.superseded = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[T]], delay_sec: float = 0.0) -> Optional[T]:
+        previous = self._pending.pop(key, None)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.superseded += 1
+
+        task = asyncio.create_task(self._delayed(factory, delay_sec))
+        self._pending[key] = task
+        try:
+            # wait (а не await task): отмена вложенной задачи не должна выглядеть
+            # как отмена вызывающего.
+            await asyncio.wait({task})
+        finally:
+            if self._pending.get(key) is task:
+                del self._pending[key]
+            # Отменили самого вызывающего — работа тоже больше не нужна.
+            if not task.done():
+                task.cancel()
+        if task.cancelled():
+            return None
+        return task.result()
+
+    async def _delayed(self, factory: Callable[[], Awaitable[T]], delay_sec: float) -> T:
+        if delay_sec > 0:
+            await asyncio.sleep(delay_sec)
+        self.started += 1
+        return await factory()
+
+    def stats(self) -> dict[str, Any]:
+        return {"pending": len(self._pending), "started": self.started, "superseded": self.superseded}
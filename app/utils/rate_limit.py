@@ -0,0 +1,43 @@
+"""
+rate_limit.py
+Ограничение частоты: классическое "ведро токенов".
+
+- токены пополняются со скоростью rate_per_sec, но не больше capacity;
+- acquire() ждет, пока токен появится (асинхронно, без блокировки event loop);
+- try_acquire() не ждет: возвращает 0.0, если токен взят, иначе — через сколько секунд он появится.
+
+Используется для исходящих сообщений: у Telegram лимит ~30 сообщений в секунду на бота.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    def __init__(self, rate_per_sec: float, capacity: Optional[float] = None) -> None:
+        self.rate = max(1e-6, rate_per_sec)
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_sec)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
@@ -16,3 +16,32 @@ def clamp(text: str, max_len: int = 3500) -> str:
 def join_lines(lines: list[str]) -> str:
     return "\n".join(lines).strip()
 
+
+def bounded_levenshtein(a: str, b: str, max_dist: int) -> int:
+    """
+    Расстояние Левенштейна, но не больше max_dist + 1: как только ясно, что порог
+    превышен, считать дальше не нужно. Считается только полоса шириной 2*max_dist+1.
+    """
+    if abs(len(a) - len(b)) > max_dist:
+        return max_dist + 1
+    if len(a) > len(b):
+        a, b = b, a
+    over = max_dist + 1
+    prev = list(range(len(a) + 1))
+    for j in range(1, len(b) + 1):
+        lo = max(1, j - max_dist)
+        hi = min(len(a), j + max_dist)
+        cur = [over] * (len(a) + 1)
+        cur[0] = j if j <= max_dist else over
+        best = cur[0]
+        cb = b[j - 1]
+        for i in range(lo, hi + 1):
+            cost = 0 if a[i - 1] == cb else 1
+            d = min(prev[i] + 1, cur[i - 1] + 1, prev[i - 1] + cost)
+            cur[i] = d if d < over else over
+            if cur[i] < best:
+                best = cur[i]
+        if best > max_dist:
+            return over
+        prev = cur
+    return min(prev[len(a)], over)
@@ -0,0 +1,305 @@
+"""
+webhook.py
+Режим webhook: Telegram сам присылает апдейты POST-запросами на наш HTTP-сервер.
+
+Сервер встроенный (asyncio.start_server), без дополнительных зависимостей:
+- POST <path>: проверяем секрет (заголовок X-Telegram-Bot-Api-Secret-Token), кладем
+  Update в app.update_queue и сразу отвечаем 200 — обработка идет асинхронно, через
+  обычный конвейер Application (и OrderedUpdateProcessor);
+- GET /healthz: 200 и размер очереди апдейтов — для балансировщика и мониторинга;
+- keep-alive: Telegram держит соединения открытыми, на одном соединении много запросов;
+- не больше max_connections одновременных соединений (лишним — 503).
+
+Локальная проверка без Telegram: WEBHOOK_URL не задан — setWebhook не вызывается,
+а записанный апдейт можно отправить вручную:
+    curl -X POST http://127.0.0.1:8080/telegram \\
+         -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" -d @update.json
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hmac
+import json
+import logging
+import signal
+from typing import Any, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from app import metrics
+from config import Settings
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+HEALTH_PATH = "/healthz"
+# Апдейт Telegram — единицы килобайт; больше мегабайта — явно не он.
+MAX_BODY_BYTES = 1024 * 1024
+MAX_HEADERS = 100
+# Сколько держим простаивающее keep-alive соединение.
+IDLE_TIMEOUT_SEC = 75.0
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class _HttpError(Exception):
+    def __init__(self, status: int) -> None:
+        super().__init__(status)
+        self.status = status
+
+
+class WebhookServer:
+    def __init__(
+        self,
+        app: Application,
+        listen: str = "0.0.0.0",
+        port: int = 8080,
+        path: str = "/telegram",
+        secret_token: str = "",
+        max_connections: int = 40,
+    ) -> None:
+        self.app = app
+        self.listen = listen
+        self.port = port
+        self.path = path if path.startswith("/") else "/" + path
+        self.secret_token = secret_token
+        self.max_connections = max(1, max_connections)
+
+        self._server: Optional[asyncio.AbstractServer] = None
+        # Открытые соединения: writer -> задача, которая его обслуживает.
+        self._connections: dict[asyncio.StreamWriter, asyncio.Task[Any]] = {}
+
+        self.requests = 0
+        self.updates = 0
+        self.rejected = 0
+        self.bad_requests = 0
+        self.overloaded = 0
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.listen, self.port)
+        log.info("Webhook-сервер слушает http://%s:%d%s", self.listen, self.port, self.path)
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        # Простаивающие keep-alive соединения закрываем сами, иначе ждали бы IDLE_TIMEOUT_SEC;
+        # запрос, который уже читается, дочитает и получит ответ.
+        tasks = list(self._connections.values())
+        for writer in list(self._connections):
+            writer.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "connections": len(self._connections),
+            "requests": self.requests,
+            "updates": self.updates,
+            "rejected": self.rejected,
+            "bad_requests": self.bad_requests,
+            "overloaded": self.overloaded,
+        }
+
+    # --- HTTP ---
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        if len(self._connections) >= self.max_connections:
+            self.overloaded += 1
+            await self._respond(writer, 503, keep_alive=False)
+            await _close(writer)
+            return
+
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(_read_request(reader), IDLE_TIMEOUT_SEC)
+                except _HttpError as e:
+                    self.bad_requests += 1
+                    await self._respond(writer, e.status, keep_alive=False)
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, ConnectionError):
+                    # Таймаут простоя, обрыв, слишком длинная строка заголовка.
+                    break
+                if request is None:
+                    break
+
+                method, path, headers, body = request
+                self.requests += 1
+                try:
+                    status, payload = self._route(method, path, headers, body)
+                except Exception:
+                    log.exception("Webhook: ошибка обработки запроса %s %s", method, path)
+                    status, payload = 500, b""
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        except Exception:
+            # Иначе asyncio лишь напишет "Unhandled exception in client_connected_cb".
+            log.exception("Webhook: соединение закрыто из-за ошибки")
+        finally:
+            self._connections.pop(writer, None)
+            await _close(writer)
+
+    def _route(self, method: str, path: str, headers: dict[str, str], body: bytes) -> tuple[int, bytes]:
+        path = path.split("?", 1)[0]
+        if path == HEALTH_PATH:
+            if method != "GET":
+                return 405, b""
+            payload = {"status": "ok", "update_queue": self.app.update_queue.qsize()}
+            return 200, json.dumps(payload).encode()
+        if path != self.path:
+            return 404, b""
+        if method != "POST":
+            return 405, b""
+
+        if self.secret_token and not hmac.compare_digest(
+            headers.get(SECRET_HEADER, "").encode(), self.secret_token.encode()
+        ):
+            self.rejected += 1
+            return 403, b""
+        try:
+            data = json.loads(body)
+        except ValueError:
+            self.bad_requests += 1
+            return 400, b""
+        # Валидный JSON — еще не апдейт: de_json ждет объект с целым update_id.
+        update_id = data.get("update_id") if isinstance(data, dict) else None
+        if not isinstance(update_id, int) or isinstance(update_id, bool):
+            self.bad_requests += 1
+            return 400, b""
+        try:
+            update = Update.de_json(data, self.app.bot)
+        except Exception:
+            self.bad_requests += 1
+            log.warning("Webhook: апдейт %s не разобран", update_id, exc_info=True)
+            return 400, b""
+        if update is None:
+            self.bad_requests += 1
+            return 400, b""
+
+        # Ответ Telegram не ждет обработки: апдейт уходит в очередь Application.
+        self.app.update_queue.put_nowait(update)
+        self.updates += 1
+        return 200, b""
+
+    @staticmethod
+    async def _respond(
+        writer: asyncio.StreamWriter, status: int, payload: bytes = b"", keep_alive: bool = True
+    ) -> None:
+        head = [
+            f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}",
+            f"Content-Length: {len(payload)}",
+            "Content-Type: application/json" if payload else "Content-Type: text/plain",
+            "Connection: keep-alive" if keep_alive else "Connection: close",
+        ]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+        with contextlib.suppress(ConnectionError):
+            await writer.drain()
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[tuple[str, str, dict[str, str], bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, path, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise _HttpError(400) from None
+    method = method.upper()
+
+    headers: dict[str, str] = {}
+    while True:
+        raw = await reader.readline()
+        if raw in (b"\r\n", b"\n", b""):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise _HttpError(400)
+        name, _, value = raw.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    body = b""
+    if method == "POST":
+        if "content-length" not in headers:
+            raise _HttpError(411)
+        try:
+            length = int(headers["content-length"])
+        except ValueError:
+            raise _HttpError(400) from None
+        if length < 0 or length > MAX_BODY_BYTES:
+            raise _HttpError(413)
+        body = await reader.readexactly(length)
+    return method, path, headers, body
+
+
+async def _close(writer: asyncio.StreamWriter) -> None:
+    writer.close()
+    with contextlib.suppress(ConnectionError, OSError):
+        await writer.wait_closed()
+
+
+async def run_webhook(app: Application, settings: Settings) -> None:
+    """
+    Аналог app.run_polling() для webhook-режима: тот же порядок жизненного цикла
+    (initialize -> post_init -> start ... stop -> shutdown -> post_shutdown), но вместо
+    Updater апдейты приносит WebhookServer. Останавливается по SIGINT/SIGTERM.
+    """
+    server = WebhookServer(
+        app,
+        listen=settings.webhook_listen,
+        port=settings.webhook_port,
+        path=settings.webhook_path,
+        secret_token=settings.webhook_secret,
+        max_connections=settings.webhook_max_connections,
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):  # Windows
+            loop.add_signal_handler(sig, stop.set)
+
+    await app.initialize()
+    try:
+        if app.post_init is not None:
+            await app.post_init(app)
+        metrics.register("webhook", server.stats)
+        await server.start()
+        if settings.webhook_url:
+            # Несколько экземпляров за балансировщиком: setWebhook достаточно вызвать одному.
+            await app.bot.set_webhook(
+                url=settings.webhook_url,
+                secret_token=settings.webhook_secret or None,
+                max_connections=settings.webhook_max_connections,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        await app.start()
+        try:
+            await stop.wait()
+        finally:
+            await server.stop()
+            await app.stop()
+            if app.post_stop is not None:
+                await app.post_stop(app)
+    finally:
+        await app.shutdown()
+        if app.post_shutdown is not None:
+            await app.post_shutdown(app)
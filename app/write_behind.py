@@ -0,0 +1,132 @@
+"""
+write_behind.py
+Отложенная (write-behind) запись статистики викторин.
+
+Вместо записи в БД на каждое завершение викторины:
+- приращения копятся в памяти и складываются по (user_id, тема) — таблицам лидеров
+  по темам нужна разбивка (см. app/services/leaderboard.py);
+- раз в interval_sec (и при остановке бота) все накопленное уходит в БД
+  одной пачкой; темы пользователя пишутся в порядке игры, так что last_topic — последняя;
+- в итоге популярная викторина дает одну запись на пользователя и тему за окно сброса.
+
+Чтения (get_quiz_stats) добавляют к данным из БД еще не записанные приращения,
+поэтому /stats сразу показывает актуальные значения.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+log = logging.getLogger(__name__)
+
+# (user_id, quizzes_add, questions_add, correct_add, last_topic)
+QuizStatsRow = tuple[int, int, int, int, Optional[str]]
+
+
+@dataclass
+class QuizStatsDelta:
+    quizzes: int = 0
+    questions: int = 0
+    correct: int = 0
+    last_topic: Optional[str] = None
+
+    def merge(self, other: "QuizStatsDelta") -> None:
+        self.quizzes += other.quizzes
+        self.questions += other.questions
+        self.correct += other.correct
+        if other.last_topic is not None:
+            self.last_topic = other.last_topic
+
+
+class QuizStatsWriteBehind:
+    def __init__(self, flush_fn: Callable[[list[QuizStatsRow]], Awaitable[None]], interval_sec: float) -> None:
+        self._flush_fn = flush_fn
+        self.interval_sec = interval_sec
+
+        # user_id -> тема -> приращения; темы — от давно сыгранной к последней.
+        self._pending: dict[int, dict[Optional[str], QuizStatsDelta]] = {}
+        # Приращения, которые сейчас записываются (видны чтениям до COMMIT).
+        self._inflight: dict[int, dict[Optional[str], QuizStatsDelta]] = {}
+        self._task: Optional[asyncio.Task[None]] = None
+        self._flush_lock = asyncio.Lock()
+        self._stopping = asyncio.Event()
+
+    def add(
+        self,
+        user_id: int,
+        quizzes_add: int,
+        questions_add: int,
+        correct_add: int,
+        last_topic: Optional[str],
+    ) -> None:
+        topics = self._pending.setdefault(user_id, {})
+        # pop + вставка: только что сыгранная тема уходит в конец.
+        delta = topics.pop(last_topic, None) or QuizStatsDelta()
+        delta.merge(QuizStatsDelta(quizzes_add, questions_add, correct_add, last_topic))
+        topics[last_topic] = delta
+
+    def apply_pending(self, stats: dict[str, Any]) -> dict[str, Any]:
+        """Добавляет к строке quiz_stats незаписанные приращения пользователя."""
+        user_id = int(stats["user_id"])
+        for source in (self._inflight, self._pending):
+            for delta in source.get(user_id, {}).values():
+                stats = dict(stats)
+                stats["quizzes_total"] = int(stats["quizzes_total"]) + delta.quizzes
+                stats["questions_total"] = int(stats["questions_total"]) + delta.questions
+                stats["correct_total"] = int(stats["correct_total"]) + delta.correct
+                if delta.last_topic is not None:
+                    stats["last_topic"] = delta.last_topic
+        return stats
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run(), name="quiz-stats-write-behind")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # Не отменяем задачу: отмена посреди flush() потеряла бы пачку в _inflight
+            # (запись в БД при этом могла и пройти). Цикл сам выйдет, дописав текущую.
+            self._stopping.set()
+            await self._task
+            self._task = None
+        # Финальный сброс: при остановке ничего не теряем.
+        await self.flush()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._inflight, self._pending = self._pending, {}
+            rows = [
+                (uid, d.quizzes, d.questions, d.correct, d.last_topic)
+                for uid, topics in self._inflight.items()
+                for d in topics.values()
+            ]
+            try:
+                await self._flush_fn(rows)
+            except Exception:
+                log.exception("Не удалось записать статистику викторин (%d строк)", len(rows))
+                # Возвращаем приращения в очередь, следующий сброс повторит попытку;
+                # то, что пришло за время записи, остается в конце как более позднее.
+                for uid, topics in self._inflight.items():
+                    merged = topics
+                    for topic, newer in self._pending.get(uid, {}).items():
+                        delta = merged.pop(topic, None)
+                        if delta is not None:
+                            delta.merge(newer)
+                            newer = delta
+                        merged[topic] = newer
+                    self._pending[uid] = merged
+            finally:
+                self._inflight = {}
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval_sec)
+            except asyncio.TimeoutError:
+                await self.flush()
@@ -3,25 +3,246 @@ bot.py
 Точка входа проекта.
 
 Собираем Application (python-telegram-bot async),
-подключаем команды и запускаем polling.
+подключаем команды и запускаем polling или webhook (BOT_MODE, см. app/webhook.py).
 """
 
 from __future__ import annotations
 
 import logging
 
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler
+from telegram.ext import (
+    Application,
+    ApplicationBuilder,
+    CallbackQueryHandler,
+    CommandHandler,
+    ContextTypes,
+    InlineQueryHandler,
+    MessageHandler,
+)
 from telegram.ext import filters
 
 import asyncio
+from zoneinfo import ZoneInfo
 
-from config import load_settings
+from config import Settings, load_settings
+from app import metrics
 from app.db import init_db
+from app.db_async import Database
+from app.handlers.admin import cmd_metrics, cmd_quiz_reload, cmd_rebuild_counters
+from app.handlers.inline import on_inline_query
+from app.persistence import SqlitePersistence
+from app.update_processor import OrderedUpdateProcessor
+from app.webhook import run_webhook
+from app.services.gazetteer import Gazetteer
+from app.services.leaderboard import Leaderboard
+from app.services.geocache import GeoCache
+from app.services.http import HttpClients
+from app.services.open_meteo import ForecastBatcher
+from app.services.quiz_bank import QuizBank, seed_quiz_bank
+from app.services.quiz_sessions import QuizSessionRegistry
+from app.services.reminders import ReminderScheduler
+from app.services.sender import OutboundSender
+from app.services.subscriptions import WeatherDigest
+from app.services.weather_cache import WeatherCache
+from app.utils.debounce import KeyedDebouncer
 from app.handlers.start_help import cmd_start, cmd_help
-from app.handlers.notes import cmd_note
-from app.handlers.weather import cmd_weather
-from app.handlers.stats import cmd_stats
-from app.handlers.quiz import cmd_quiz, on_text_quiz_router
+from app.handlers.notes import cmd_note, on_notes_page
+from app.handlers.weather import cmd_weather, format_weather
+from app.handlers.stats import cmd_stats, cmd_top
+from app.handlers.quiz import cmd_quiz, on_quiz_answer, on_text_quiz_router
+
+
+log = logging.getLogger(__name__)
+
+
+async def backfill_fts(db: Database) -> None:
+    # Старые заметки (до появления FTS-индекса) индексируются в фоне, порциями.
+    n = await db.backfill_notes_fts()
+    if n:
+        log.info("FTS-индекс заметок дозаполнен: %d строк", n)
+
+
+async def weather_digest_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    digest: WeatherDigest = context.application.bot_data["weather_digest"]
+    sent = await digest.tick()
+    if sent:
+        log.info("Рассылка погоды: отправлено %d сообщений", sent)
+
+
+async def quiz_sessions_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    sessions: QuizSessionRegistry = context.application.bot_data["quiz_sessions"]
+    evicted = sessions.evict_idle()
+    if evicted:
+        log.info("Брошенные викторины удалены: %d", evicted)
+
+
+def open_gazetteer(settings: Settings) -> Gazetteer | None:
+    path = settings.gazetteer_path
+    if path is None or not path.exists():
+        log.info("Офлайн-справочник городов не найден (%s): геокодинг через сеть", path)
+        return None
+    try:
+        gazetteer = Gazetteer(path)
+    except (OSError, ValueError):
+        log.exception("Не удалось открыть справочник городов %s", path)
+        return None
+    log.info("Справочник городов: %d мест, %d ключей", gazetteer.n_places, gazetteer.n_keys)
+    return gazetteer
+
+
+async def post_init(app: Application) -> None:
+    # Долгоживущие ресурсы создаем внутри event loop приложения.
+    settings: Settings = app.bot_data["settings"]
+    db = Database(
+        settings.db_path,
+        pool_size=settings.db_pool_size,
+        batch_max_ops=settings.db_batch_max_ops,
+        batch_delay_ms=settings.db_batch_delay_ms,
+        stats_flush_sec=settings.quiz_stats_flush_sec,
+        cache_max_entries=settings.cache_max_entries,
+        cache_ttl_sec=settings.cache_ttl_sec,
+    )
+    await db.open()
+    app.bot_data["db"] = db
+    metrics.register("db_cache", db.cache_stats)
+    metrics.register("db_writer", db.writer_stats)
+    app.bot_data["fts_backfill_task"] = asyncio.create_task(backfill_fts(db))
+
+    # Банк вопросов: при старте — только список тем, вопросы читаются по мере надобности.
+    quiz_bank = QuizBank(db)
+    await quiz_bank.reload()
+    app.bot_data["quiz_bank"] = quiz_bank
+    metrics.register("quiz_bank", quiz_bank.stats)
+    quiz_sessions = QuizSessionRegistry(
+        app.user_data,
+        idle_timeout_sec=settings.quiz_idle_timeout_sec,
+        max_sessions=settings.quiz_max_sessions,
+    )
+    app.bot_data["quiz_sessions"] = quiz_sessions
+    metrics.register("quiz_sessions", quiz_sessions.stats)
+    # Таблицы лидеров обновляются изменениями счета после каждой записи статистики.
+    leaderboard = Leaderboard(db, top_size=settings.leaderboard_size, top_ttl_sec=settings.leaderboard_ttl_sec)
+    db.on_quiz_scores = leaderboard.apply
+    app.bot_data["leaderboard"] = leaderboard
+    metrics.register("leaderboard", leaderboard.stats)
+
+    http = HttpClients(
+        timeout_sec=settings.http_timeout_sec,
+        http2=settings.http_http2,
+        max_connections=settings.http_max_connections,
+        max_keepalive=settings.http_max_keepalive,
+        keepalive_expiry_sec=settings.http_keepalive_expiry_sec,
+        per_host_connections=settings.http_pool_per_host,
+        connect_timeout_sec=settings.http_connect_timeout_sec,
+        read_timeout_sec=settings.http_read_timeout_sec,
+        max_concurrency=settings.http_max_concurrency,
+        retries=settings.http_retries,
+        breaker_failures=settings.http_breaker_failures,
+        breaker_reset_sec=settings.http_breaker_reset_sec,
+    )
+    app.bot_data["http"] = http
+    metrics.register("http", http.stats)
+    gazetteer = open_gazetteer(settings)
+    app.bot_data["gazetteer"] = gazetteer
+    geo_cache = GeoCache(db, gazetteer=gazetteer)
+    app.bot_data["geo_cache"] = geo_cache
+    metrics.register("geocode_cache", geo_cache.stats)
+    forecast_batcher = ForecastBatcher(
+        http,
+        window_ms=settings.weather_batch_window_ms,
+        max_points=settings.weather_batch_max_points,
+    )
+    app.bot_data["forecast_batcher"] = forecast_batcher
+    metrics.register("forecast_batcher", forecast_batcher.stats)
+    weather_cache = WeatherCache(forecast_batcher.get)
+    app.bot_data["weather_cache"] = weather_cache
+    metrics.register("weather_cache", weather_cache.stats)
+    # Все исходящие сообщения (ответы, рассылка, напоминания) — через одну очередь с лимитами.
+    sender = OutboundSender(
+        app.bot,
+        rate_per_sec=settings.send_rate_per_sec,
+        per_chat_rate=settings.send_per_chat_rate,
+        per_chat_burst=settings.send_per_chat_burst,
+        max_inflight=settings.send_max_inflight,
+    )
+    await sender.start()
+    app.bot_data["sender"] = sender
+    metrics.register("sender", sender.stats)
+    weather_digest = WeatherDigest(
+        db,
+        weather_cache,
+        sender,
+        render=format_weather,
+        tz=app.bot_data["subscriptions_tz"],
+    )
+    app.bot_data["weather_digest"] = weather_digest
+    metrics.register("weather_digest", weather_digest.stats)
+    if app.job_queue is not None:
+        # Одна периодическая задача на всех подписчиков: выбирает из БД только тех, кому пора.
+        app.job_queue.run_repeating(
+            weather_digest_job, interval=settings.subscriptions_tick_sec, first=1.0, name="weather-digest"
+        )
+        # Брошенные викторины: без этой задачи они удаляются только при обращении пользователя.
+        app.job_queue.run_repeating(
+            quiz_sessions_job, interval=min(60.0, settings.quiz_idle_timeout_sec / 2), name="quiz-sessions"
+        )
+    else:
+        log.warning(
+            "JobQueue недоступна (pip install 'python-telegram-bot[job-queue]'): "
+            "рассылка погоды и очистка брошенных викторин отключены"
+        )
+
+    reminders = ReminderScheduler(db, sender)
+    await reminders.start()
+    app.bot_data["reminders"] = reminders
+    metrics.register("reminders", reminders.stats)
+
+    if isinstance(app.persistence, SqlitePersistence):
+        metrics.register("persistence", app.persistence.stats)
+        # Вытеснение из задачи JobQueue: без этого сессия осталась бы в сохраненном user_data.
+        quiz_sessions.on_evict = app.persistence.mark_user_dirty
+
+    inline_debouncer = KeyedDebouncer()
+    app.bot_data["inline_debouncer"] = inline_debouncer
+    metrics.register("inline", inline_debouncer.stats)
+
+
+async def post_stop(app: Application) -> None:
+    # Бот еще не закрыт (app.shutdown позже): очередь исходящих успевает досылаться.
+    reminders: ReminderScheduler | None = app.bot_data.pop("reminders", None)
+    if reminders is not None:
+        await reminders.stop()
+
+    # После планировщиков: они уже ничего не добавят.
+    sender: OutboundSender | None = app.bot_data.pop("sender", None)
+    if sender is not None:
+        await sender.stop()
+
+
+async def post_shutdown(app: Application) -> None:
+    task: asyncio.Task | None = app.bot_data.pop("fts_backfill_task", None)
+    if task is not None and not task.done():
+        task.cancel()
+
+    weather_cache: WeatherCache | None = app.bot_data.pop("weather_cache", None)
+    if weather_cache is not None:
+        await weather_cache.aclose()
+
+    forecast_batcher: ForecastBatcher | None = app.bot_data.pop("forecast_batcher", None)
+    if forecast_batcher is not None:
+        await forecast_batcher.aclose()
+
+    http: HttpClients | None = app.bot_data.pop("http", None)
+    if http is not None:
+        await http.aclose()
+
+    db: Database | None = app.bot_data.pop("db", None)
+    if db is not None:
+        await db.close()
+
+    gazetteer: Gazetteer | None = app.bot_data.pop("gazetteer", None)
+    if gazetteer is not None:
+        gazetteer.close()
 
 
 def main() -> None:
@@ -34,13 +255,32 @@ def main() -> None:
 
     # Инициализация БД
     init_db(settings.db_path)
+    seeded = seed_quiz_bank(settings.db_path)
+    if seeded:
+        log.info("Банк вопросов заполнен встроенными вопросами: %d", seeded)
 
     # ApplicationBuilder — рекомендуемый способ сборки приложения. :contentReference[oaicite:4]{index=4}
-    app = ApplicationBuilder().token(settings.bot_token).build()
+    # Апдейты разных пользователей — параллельно, одного пользователя — строго по порядку.
+    update_processor = OrderedUpdateProcessor(max_concurrent=settings.max_concurrent_updates)
+    builder = (
+        ApplicationBuilder()
+        .token(settings.bot_token)
+        .concurrent_updates(update_processor)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if settings.persistence:
+        # user_data (в т.ч. незаконченные викторины) переживает перезапуск; строки читаются лениво.
+        builder = builder.persistence(
+            SqlitePersistence(settings.db_path, update_interval=settings.persistence_interval_sec)
+        )
+    app = builder.build()
 
     # Общие данные приложения (доступны из context.application.bot_data)
-    app.bot_data["db_path"] = settings.db_path
-    app.bot_data["http_timeout_sec"] = settings.http_timeout_sec
+    app.bot_data["settings"] = settings
+    metrics.register("updates", lambda: {**update_processor.stats(), "update_queue": app.update_queue.qsize()})
+    app.bot_data["subscriptions_tz"] = ZoneInfo(settings.subscriptions_tz)
 
     # Команды
     app.add_handler(CommandHandler("start", cmd_start))
@@ -49,14 +289,31 @@ def main() -> None:
     app.add_handler(CommandHandler("weather", cmd_weather))
     app.add_handler(CommandHandler("quiz", cmd_quiz))
     app.add_handler(CommandHandler("stats", cmd_stats))
+    app.add_handler(CommandHandler("top", cmd_top))
+    app.add_handler(CommandHandler("metrics", cmd_metrics))
+    app.add_handler(CommandHandler("quizreload", cmd_quiz_reload))
+    app.add_handler(CommandHandler("rebuildcounters", cmd_rebuild_counters))
+
+    # Кнопки постраничного вывода заметок
+    app.add_handler(CallbackQueryHandler(on_notes_page, pattern=r"^notes:"))
+    # Кнопки вариантов ответа викторины (сообщение с вопросом редактируется на месте)
+    app.add_handler(CallbackQueryHandler(on_quiz_answer, pattern=r"^quiz:"))
+
+    # Inline-подсказки городов с погодой. block=False: новый запрос того же пользователя
+    # должен прийти, пока старый ждет дебаунс, и отменить его.
+    app.add_handler(InlineQueryHandler(on_inline_query, block=False))
 
-    # Роутер для текстовых ответов викторины (срабатывает только когда user_data["quiz_waiting"]=True)
+    # Роутер для текстовых ответов викторины (срабатывает только при активной сессии, см. app/handlers/quiz.py)
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_text_quiz_router))
 
-    asyncio.set_event_loop(asyncio.new_event_loop())
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
 
     # Запуск
-    app.run_polling(close_loop=False)
+    if settings.bot_mode == "webhook":
+        loop.run_until_complete(run_webhook(app, settings))
+    else:
+        app.run_polling(close_loop=False)
 
 
 if __name__ == "__main__":
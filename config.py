@@ -10,12 +10,14 @@ config.py
 from __future__ import annotations
 
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 
 
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "student_helper.sqlite3"
+# Офлайн-справочник городов (собирается: python -m app.maintenance gazetteer-build ...).
+GAZETTEER_PATH = BASE_DIR / "data" / "cities.gzt"
 
 
 @dataclass(frozen=True)
@@ -23,6 +25,131 @@ class Settings:
     bot_token: str
     db_path: Path
     http_timeout_sec: float
+    # Размер пула соединений SQLite (по одному соединению на поток исполнителя).
+    db_pool_size: int = 4
+    # Групповой коммит: максимум операций в одной транзакции и окно ожидания пачки.
+    db_batch_max_ops: int = 64
+    db_batch_delay_ms: float = 5.0
+    # Интервал отложенной записи статистики викторин (0 — писать сразу).
+    quiz_stats_flush_sec: float = 0.0
+    # Засчитывать ответы викторины с опечатками (расстояние Левенштейна 1–2 для длинных ответов).
+    quiz_fuzzy: bool = False
+    # Брошенная викторина удаляется через столько секунд бездействия; предел одновременных викторин.
+    quiz_idle_timeout_sec: float = 900.0
+    quiz_max_sessions: int = 10_000
+    # Кэш чтений по user_id (/stats, первая страница /note list).
+    cache_max_entries: int = 10_000
+    cache_ttl_sec: float = 60.0
+    # Telegram user_id администраторов (служебные команды вроде /metrics).
+    admin_ids: frozenset[int] = frozenset()
+    # Общие HTTP-клиенты (keep-alive пулы на хост).
+    http_http2: bool = False
+    http_max_connections: int = 20
+    http_max_keepalive: int = 10
+    http_keepalive_expiry_sec: float = 30.0
+    # Переопределение размера пула для отдельных хостов: {"api.open-meteo.com": 40}.
+    http_pool_per_host: dict[str, int] = field(default_factory=dict)
+    # Устойчивость исходящих запросов: таймауты, общий лимит, повторы, автомат на хост.
+    http_connect_timeout_sec: float = 2.0
+    http_read_timeout_sec: float = 4.0
+    http_max_concurrency: int = 32
+    http_retries: int = 2
+    http_breaker_failures: int = 5
+    http_breaker_reset_sec: float = 30.0
+    # Микро-батчинг прогноза: окно сбора точек и максимум точек в одном запросе.
+    weather_batch_window_ms: float = 30.0
+    weather_batch_max_points: int = 50
+    # Индекс офлайн-справочника городов; None или нет файла — геокодинг только через сеть.
+    gazetteer_path: Path | None = None
+    # Inline-подсказки городов: пауза в наборе, после которой ищем некэшированный префикс.
+    inline_debounce_ms: float = 300.0
+    # Ежедневная рассылка погоды: часовой пояс времени подписки, период проверки.
+    subscriptions_tz: str = "Europe/Moscow"
+    subscriptions_tick_sec: float = 30.0
+    # Очередь исходящих сообщений (app/services/sender.py): лимит на бота (у Telegram ~30/с),
+    # на чат (~1/с, burst — запас на короткий всплеск), сколько запросов в пути одновременно.
+    send_rate_per_sec: float = 25.0
+    send_per_chat_rate: float = 1.0
+    send_per_chat_burst: float = 3.0
+    send_max_inflight: int = 16
+    # Таблица лидеров /top: сколько лучших показывать и сколько секунд живет их снимок в памяти.
+    leaderboard_size: int = 10
+    leaderboard_ttl_sec: float = 30.0
+    # user_data/chat_data в SQLite между перезапусками (app/persistence.py) и период сброса изменений.
+    persistence: bool = True
+    persistence_interval_sec: float = 30.0
+    # Сколько апдейтов разных пользователей обрабатывается одновременно
+    # (апдейты одного пользователя — всегда по очереди, см. app/update_processor.py).
+    max_concurrent_updates: int = 64
+    # Режим получения апдейтов: "polling" или "webhook" (встроенный сервер, см. app/webhook.py).
+    bot_mode: str = "polling"
+    webhook_listen: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_path: str = "/telegram"
+    # Секрет, который Telegram присылает в X-Telegram-Bot-Api-Secret-Token (пусто — не проверяем).
+    webhook_secret: str = ""
+    webhook_max_connections: int = 40
+    # Публичный https-адрес для setWebhook; пусто — не регистрируем (локальная отладка).
+    webhook_url: str = ""
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        raise RuntimeError(f"Переменная окружения {name} должна быть целым числом, получено: {raw!r}") from None
+
+
+def _env_float(name: str, default: float) -> float:
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        raise RuntimeError(f"Переменная окружения {name} должна быть числом, получено: {raw!r}") from None
+
+
+def _env_ids(name: str) -> frozenset[int]:
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return frozenset()
+    try:
+        return frozenset(int(x) for x in raw.replace(";", ",").split(",") if x.strip())
+    except ValueError:
+        raise RuntimeError(f"Переменная окружения {name} должна быть списком id через запятую, получено: {raw!r}") from None
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name, "").strip().lower()
+    if not raw:
+        return default
+    return raw in {"1", "true", "yes", "on"}
+
+
+def _env_host_map(name: str) -> dict[str, int]:
+    # Формат: "host1=10,host2=40".
+    raw = os.getenv(name, "").strip()
+    result: dict[str, int] = {}
+    for part in raw.split(","):
+        if not part.strip():
+            continue
+        host, _, value = part.partition("=")
+        try:
+            result[host.strip()] = int(value)
+        except ValueError:
+            raise RuntimeError(f"Переменная окружения {name}: ожидается host=число, получено: {part!r}") from None
+    return result
+
+
+def _env_mode(name: str) -> str:
+    raw = os.getenv(name, "").strip().lower() or "polling"
+    if raw not in {"polling", "webhook"}:
+        raise RuntimeError(f"Переменная окружения {name} должна быть polling или webhook, получено: {raw!r}")
+    return raw
 
 
 def load_settings() -> Settings:
@@ -37,6 +164,50 @@ def load_settings() -> Settings:
     return Settings(
         bot_token=token,
         db_path=DB_PATH,
-        http_timeout_sec=10.0,
+        # Общий дедлайн одного HTTP-вызова вместе с повторами.
+        http_timeout_sec=_env_float("HTTP_TIMEOUT_SEC", 6.0),
+        db_pool_size=_env_int("DB_POOL_SIZE", 4),
+        db_batch_max_ops=_env_int("DB_BATCH_MAX_OPS", 64),
+        db_batch_delay_ms=_env_float("DB_BATCH_DELAY_MS", 5.0),
+        quiz_stats_flush_sec=_env_float("QUIZ_STATS_FLUSH_SEC", 0.0),
+        quiz_fuzzy=_env_bool("QUIZ_FUZZY", False),
+        quiz_idle_timeout_sec=_env_float("QUIZ_IDLE_TIMEOUT_SEC", 900.0),
+        quiz_max_sessions=_env_int("QUIZ_MAX_SESSIONS", 10_000),
+        cache_max_entries=_env_int("CACHE_MAX_ENTRIES", 10_000),
+        cache_ttl_sec=_env_float("CACHE_TTL_SEC", 60.0),
+        admin_ids=_env_ids("ADMIN_IDS"),
+        http_http2=_env_bool("HTTP2", False),
+        http_max_connections=_env_int("HTTP_MAX_CONNECTIONS", 20),
+        http_max_keepalive=_env_int("HTTP_MAX_KEEPALIVE", 10),
+        http_keepalive_expiry_sec=_env_float("HTTP_KEEPALIVE_EXPIRY_SEC", 30.0),
+        http_pool_per_host=_env_host_map("HTTP_POOL_PER_HOST"),
+        http_connect_timeout_sec=_env_float("HTTP_CONNECT_TIMEOUT_SEC", 2.0),
+        http_read_timeout_sec=_env_float("HTTP_READ_TIMEOUT_SEC", 4.0),
+        http_max_concurrency=_env_int("HTTP_MAX_CONCURRENCY", 32),
+        http_retries=_env_int("HTTP_RETRIES", 2),
+        http_breaker_failures=_env_int("HTTP_BREAKER_FAILURES", 5),
+        http_breaker_reset_sec=_env_float("HTTP_BREAKER_RESET_SEC", 30.0),
+        weather_batch_window_ms=_env_float("WEATHER_BATCH_WINDOW_MS", 30.0),
+        weather_batch_max_points=_env_int("WEATHER_BATCH_MAX_POINTS", 50),
+        gazetteer_path=Path(os.getenv("GAZETTEER_PATH", "").strip() or GAZETTEER_PATH),
+        inline_debounce_ms=_env_float("INLINE_DEBOUNCE_MS", 300.0),
+        subscriptions_tz=os.getenv("SUBSCRIPTIONS_TZ", "").strip() or "Europe/Moscow",
+        subscriptions_tick_sec=_env_float("SUBSCRIPTIONS_TICK_SEC", 30.0),
+        send_rate_per_sec=_env_float("SEND_RATE_PER_SEC", 25.0),
+        send_per_chat_rate=_env_float("SEND_PER_CHAT_RATE", 1.0),
+        send_per_chat_burst=_env_float("SEND_PER_CHAT_BURST", 3.0),
+        send_max_inflight=_env_int("SEND_MAX_INFLIGHT", 16),
+        leaderboard_size=_env_int("LEADERBOARD_SIZE", 10),
+        leaderboard_ttl_sec=_env_float("LEADERBOARD_TTL_SEC", 30.0),
+        persistence=_env_bool("PERSISTENCE", True),
+        persistence_interval_sec=_env_float("PERSISTENCE_INTERVAL_SEC", 30.0),
+        max_concurrent_updates=_env_int("MAX_CONCURRENT_UPDATES", 64),
+        bot_mode=_env_mode("BOT_MODE"),
+        webhook_listen=os.getenv("WEBHOOK_LISTEN", "").strip() or "0.0.0.0",
+        webhook_port=_env_int("WEBHOOK_PORT", 8080),
+        webhook_path=os.getenv("WEBHOOK_PATH", "").strip() or "/telegram",
+        webhook_secret=os.getenv("WEBHOOK_SECRET", "").strip(),
+        webhook_max_connections=_env_int("WEBHOOK_MAX_CONNECTIONS", 40),
+        webhook_url=os.getenv("WEBHOOK_URL", "").strip(),
     )
 